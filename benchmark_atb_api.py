@@ -0,0 +1,673 @@
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from threading import Thread
+from subprocess import check_call, check_output, DEVNULL, STDOUT
+from tempfile import mkdtemp, TemporaryFile
+from os import environ
+from os.path import join, dirname
+from time import perf_counter, sleep
+from argparse import ArgumentParser
+from platform import python_version
+from threading import Lock
+from urllib.parse import urlsplit, parse_qs
+import re
+from inspect import stack
+from ssl import SSLContext, PROTOCOL_TLS_SERVER, create_default_context, CERT_NONE
+import json
+import sys
+import gzip
+from hashlib import sha1
+import yaml
+import tracemalloc
+
+import atb_api
+from atb_api import API, ConnectionPool, ConditionalCache, UrllibTransport, InProcessTransport, RecordingTransport, ReplayTransport, MultipartBody, JobPipeline, deserializer_fct_for, available_api_formats, kabsch_rmsds, rmsd_matrix_rows
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+class StandInHandler(BaseHTTPRequestHandler):
+    '''Minimal stand-in for the ATB API routes, answering with JSON payloads of recorded shape.'''
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def body_chunks(self):
+        if 'Content-Length' in self.headers:
+            remaining = int(self.headers['Content-Length'])
+            while remaining > 0:
+                chunk = self.rfile.read(min(remaining, 1024 ** 2))
+                remaining -= len(chunk)
+                yield chunk
+        elif self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                chunk_size = int(self.rfile.readline().strip(), 16)
+                yield self.rfile.read(chunk_size + 2)[:chunk_size]
+                if chunk_size == 0:
+                    break
+
+    def discard_body(self) -> None:
+        for _ in self.body_chunks():
+            pass
+
+    def respond(self) -> None:
+        self.discard_body()
+        body = json.dumps(
+            dict(
+                molecule=dict(molid=21, inchi='InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3', formula='C2H6O', curation_trust=0),
+                accepted_molids=[],
+            ),
+        ).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = respond
+    do_POST = respond
+
+def self_signed_contexts() -> tuple:
+    directory = mkdtemp()
+    (key, cert) = (join(directory, 'key.pem'), join(directory, 'cert.pem'))
+    check_call(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-keyout', key, '-out', cert, '-days', '1', '-subj', '/CN=localhost'],
+        stdout=DEVNULL,
+        stderr=DEVNULL,
+    )
+    server_context = SSLContext(PROTOCOL_TLS_SERVER)
+    server_context.load_cert_chain(cert, key)
+    client_context = create_default_context()
+    client_context.check_hostname = False
+    client_context.verify_mode = CERT_NONE
+    return (server_context, client_context)
+
+def start_stand_in_server(server_context=None) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    if server_context is not None:
+        server.socket = server_context.wrap_socket(server.socket, server_side=True)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def requests_per_second(api: API, n_requests: int) -> float:
+    start = perf_counter()
+    for _ in range(n_requests):
+        api.Molecules.molid(molid=21)
+    return n_requests / (perf_counter() - start)
+
+def benchmark_connection_pool(n_requests: int = 500) -> None:
+    (server_context, client_context) = self_signed_contexts()
+    server = start_stand_in_server(server_context)
+    host = 'https://localhost:{0}'.format(server.server_address[1])
+    try:
+        for (description, pool) in [
+            ('one connection per request (before)', ConnectionPool(maxsize=0, ssl_context=client_context)),
+            ('pooled keep-alive connections (after)', ConnectionPool(ssl_context=client_context)),
+        ]:
+            api = API(host=host, api_token='benchmark', api_format='json', connection_pool=pool)
+            print('{0}: {1:.0f} requests/s'.format(description, requests_per_second(api, n_requests)))
+            print('    pool statistics: {0}'.format(api.pool_statistics()))
+    finally:
+        server.shutdown()
+
+def stand_in_handler(method: str, url: str, headers: dict, body: bytes) -> tuple:
+    return (200, {'Content-Type': 'text/plain'}, json.dumps(dict(molecule=dict(molid=21, formula='C2H6O'))).encode())
+
+def benchmark_transports(n_requests: int = 500) -> None:
+    server = start_stand_in_server()
+    host = 'http://127.0.0.1:{0}'.format(server.server_address[1])
+    cassette = join(mkdtemp(), 'molid.jsonl.gz')
+    try:
+        API(host=host, api_token='benchmark', api_format='json', transport=RecordingTransport(cassette)).Molecules.molid(molid=21)
+        for (description, transport) in [
+            ('stdlib, one connection per request', UrllibTransport()),
+            ('pooled keep-alive connections', ConnectionPool()),
+            ('in-process handler (client overhead only)', InProcessTransport(stand_in_handler)),
+            ('replayed cassette', ReplayTransport(cassette)),
+        ]:
+            api = API(host=host, api_token='benchmark', api_format='json', transport=transport)
+            print('{0}: {1:.0f} requests/s'.format(description, requests_per_second(api, n_requests)))
+    finally:
+        server.shutdown()
+
+class OfflineAPI(API):
+    '''API answering every request with a canned response, to time the client alone.'''
+
+    def safe_urlopen(self, base_url, data={}, method='GET', retry_number=1):
+        return '{"molecules": [], "molecule": {"molid": 21}}'
+
+class FrameInspectingAPI(OfflineAPI):
+    '''Resolves endpoints the way API.url() used to, by inspecting the caller's frame.'''
+
+    def url(self, api_namespace, api_endpoint):
+        stack()
+        return super(FrameInspectingAPI, self).url(api_namespace, api_endpoint)
+
+def microseconds_per_call(function, n_calls: int) -> float:
+    start = perf_counter()
+    for _ in range(n_calls):
+        function()
+    return (perf_counter() - start) / n_calls * 1e6
+
+def benchmark_client_overhead(n_calls: int = 2000) -> None:
+    for (description, api_class) in [
+        ('frame inspection (before)', FrameInspectingAPI),
+        ('routing table (after)', OfflineAPI),
+    ]:
+        api = api_class(api_token='benchmark', api_format='json')
+        print(
+            '{0}: Molecules.search {1:.1f} us/call, Molecules.molid {2:.1f} us/call'.format(
+                description,
+                microseconds_per_call(lambda: api.Molecules.search(any='ethanol'), n_calls),
+                microseconds_per_call(lambda: api.Molecules.molid(molid=21), n_calls),
+            ),
+        )
+
+def recorded_shape_molecule(molid: int) -> dict:
+    return dict(
+        molid=molid,
+        iupac='ethanol',
+        common_name='Ethanol',
+        formula='C2H6O',
+        inchi='InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3',
+        inchi_key='LFQSCWFLJHTTHZ-UHFFFAOYSA-N',
+        smiles='CCO',
+        net_charge=0,
+        curation_trust=0,
+        is_finished=True,
+        molecule_type='heteromolecule',
+        has_TI=False,
+        pdb_hetId='EOH',
+        user_label=None,
+        maximum_qm_level=2,
+        qm_level=1,
+        experimental_solvation_free_energy=-5.0,
+        rnme=None,
+    )
+
+def serialized_search_response(api_format: str, n_molecules: int):
+    response = dict(molecules=[recorded_shape_molecule(molid) for molid in range(n_molecules)])
+    if api_format == 'json':
+        return json.dumps(response)
+    elif api_format == 'msgpack':
+        from msgpack import packb
+        return packb(response, use_bin_type=True)
+    else:
+        return yaml.dump(response)
+
+def benchmark_deserializers(sizes: tuple = (10, 1000, 10000)) -> None:
+    backends = [
+        ('yaml (pure Python loader)', 'yaml', lambda x: yaml.load(x, Loader=yaml.SafeLoader)),
+        ('yaml (libyaml loader)', 'yaml', deserializer_fct_for('yaml')),
+        ('json (stdlib)', 'json', json.loads),
+        ('json (fastest available)', 'json', deserializer_fct_for('json')),
+    ] + ([('msgpack', 'msgpack', deserializer_fct_for('msgpack'))] if 'msgpack' in available_api_formats() else [])
+    for n_molecules in sizes:
+        for (description, api_format, deserializer_fct) in backends:
+            payload = serialized_search_response(api_format, n_molecules)
+            n_repeats = max(1, 1000 // n_molecules)
+            start = perf_counter()
+            for _ in range(n_repeats):
+                deserializer_fct(payload)
+            elapsed = perf_counter() - start
+            # Measured separately, as tracing allocations slows parsing down considerably
+            tracemalloc.start()
+            deserializer_fct(payload)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(
+                '{0} molecules, {1}: {2:.1f} MB/s, peak memory {3:.1f} MB (payload {4:.2f} MB)'.format(
+                    n_molecules,
+                    description,
+                    len(payload) * n_repeats / elapsed / 1e6,
+                    peak_memory / 1e6,
+                    len(payload) / 1e6,
+                ),
+            )
+
+def pairwise_kabsch_rmsd(reference, structure) -> float:
+    '''Textbook single-pair Kabsch superposition, used to check the vectorized implementation.'''
+    import numpy
+    (reference, structure) = (reference - reference.mean(axis=0), structure - structure.mean(axis=0))
+    (u, _, vt) = numpy.linalg.svd(structure.T.dot(reference))
+    rotation = vt.T.dot(numpy.diag([1., 1., numpy.sign(numpy.linalg.det(vt.T.dot(u.T)))])).dot(u.T)
+    return float(numpy.sqrt(((structure.dot(rotation.T) - reference) ** 2).sum() / len(reference)))
+
+def benchmark_local_rmsd(n_structures: int = 500, n_atoms: int = 30) -> None:
+    import numpy
+    random = numpy.random.RandomState(0)
+    structures = random.normal(size=(1, n_atoms, 3)) + 0.3 * random.normal(size=(n_structures, n_atoms, 3))
+    n_pairs = n_structures * (n_structures - 1) // 2
+
+    start = perf_counter()
+    reference_rmsds = [pairwise_kabsch_rmsd(structures[0], structure) for structure in structures[1:]]
+    print('pairwise Kabsch (before): {0:.0f} pairs/s'.format((n_structures - 1) / (perf_counter() - start)))
+
+    start = perf_counter()
+    rows = rmsd_matrix_rows(structures, range(n_structures))
+    print('vectorized Kabsch (after): {0:.0f} pairs/s'.format(n_pairs / (perf_counter() - start)))
+    assert numpy.allclose(rows[0][1], reference_rmsds), 'Vectorized RMSDs differ from the pairwise ones'
+    assert numpy.allclose(kabsch_rmsds(structures[0], structures[:1]), 0.)
+
+class InMemoryUploadAPI(API):
+    '''Encodes multipart uploads the way API.prepare_request() used to: the whole body in memory, every value read at once.'''
+
+    def prepare_request(self, base_url, data_items, method):
+        if method == 'POST':
+            multipart_body = MultipartBody([(key, value.read() if hasattr(value, 'read') else value) for (key, value) in data_items])
+            return (base_url, b''.join(bytes(chunk) for chunk in multipart_body), {'Content-Type': multipart_body.headers()['Content-Type']})
+        return super(InMemoryUploadAPI, self).prepare_request(base_url, data_items, method)
+
+def benchmark_uploads(n_files: int = 4, file_size: int = 25 * 1024 ** 2) -> None:
+    server = start_stand_in_server()
+    host = 'http://127.0.0.1:{0}'.format(server.server_address[1])
+    qm_logs = []
+    for _ in range(n_files):
+        qm_log = TemporaryFile()
+        qm_log.write(b'SCF Done:  E(RB3LYP) =  -155.033   A.U. after   10 cycles\n' * (file_size // 58))
+        qm_logs.append(qm_log)
+    try:
+        for (description, api) in [
+            ('in-memory body (before)', InMemoryUploadAPI(host=host, api_token='benchmark', api_format='json')),
+            ('streamed body (after)', API(host=host, api_token='benchmark', api_format='json')),
+            ('streamed gzip body (after, compress_uploads=True)', API(host=host, api_token='benchmark', api_format='json', compress_uploads=True)),
+        ]:
+            for qm_log in qm_logs:
+                qm_log.seek(0)
+            tracemalloc.start()
+            start = perf_counter()
+            api.Jobs.finished(molids=list(range(n_files)), qm_logs=qm_logs)
+            elapsed = perf_counter() - start
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print('{0}: {1:.0f} MB/s, peak memory {2:.1f} MB ({3} MB uploaded)'.format(
+                description,
+                n_files * file_size / elapsed / 1e6,
+                peak_memory / 1e6,
+                n_files * file_size // 1024 ** 2,
+            ))
+    finally:
+        server.shutdown()
+
+class JobsStandInHandler(StandInHandler):
+    '''Stand-in for the jobs endpoints, handing out n_jobs jobs, 10 per Jobs.get, with a latency of LATENCY seconds per request.'''
+    LATENCY = 0.02
+    (lock, n_jobs, next_molid, finished, released) = (Lock(), 0, 0, set(), set())
+
+    @classmethod
+    def reset(cls, n_jobs: int) -> None:
+        with cls.lock:
+            (cls.n_jobs, cls.next_molid, cls.finished, cls.released) = (n_jobs, 0, set(), set())
+
+    def respond(self) -> None:
+        sleep(self.LATENCY)
+        split_url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers['Content-Length'])) if 'Content-Length' in self.headers else b''
+        parameters = parse_qs(split_url.query)
+        molids = parameters['molids'][0].split(',') if 'molids' in parameters else []
+        cls = JobsStandInHandler
+        with cls.lock:
+            if split_url.path.endswith('/get.py'):
+                (first_molid, cls.next_molid) = (cls.next_molid, min(cls.n_jobs, cls.next_molid + 10))
+                response = dict(jobs=[dict(molid=molid, qm_level=1) for molid in range(first_molid, cls.next_molid)])
+            elif split_url.path.endswith('/finished.py'):
+                accepted_molids = [int(molid) for molid in re.findall(rb'name="molid"\r\n\r\n([0-9]+)', body)]
+                cls.finished.update(accepted_molids)
+                response = dict(accepted_molids=accepted_molids)
+            elif split_url.path.endswith('/release.py'):
+                cls.released.update(int(molid) for molid in molids)
+                response = dict(molids=molids)
+            else:
+                response = dict(molids=molids)
+        content = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = respond
+    do_POST = respond
+
+def stand_in_qm_calculation(job: dict) -> tuple:
+    sleep(0.05)
+    return ('QM log of molecule {0}'.format(job['molid']).encode(), job['qm_level'])
+
+def benchmark_job_pipeline(n_jobs: int = 200, processes: int = 8) -> None:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), JobsStandInHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    api = API(host='http://127.0.0.1:{0}'.format(server.server_address[1]), api_token='benchmark', api_format='json')
+    try:
+        JobsStandInHandler.reset(n_jobs)
+        start = perf_counter()
+        while True:
+            jobs = api.Jobs.get()
+            if not jobs:
+                break
+            for molid in api.Jobs.accept(molids=','.join(str(job['molid']) for job in jobs)):
+                (qm_log, current_qm_level) = stand_in_qm_calculation(dict(molid=molid, qm_level=1))
+                api.Jobs.finished(molids=[molid], qm_logs=[qm_log], current_qm_levels=[current_qm_level])
+        print('serial loop (before): {0:.1f} jobs/s'.format(len(JobsStandInHandler.finished) / (perf_counter() - start)))
+
+        JobsStandInHandler.reset(n_jobs)
+        start = perf_counter()
+        pipeline = JobPipeline(api, stand_in_qm_calculation, processes=processes, upload_interval=0.2, poll_interval=0.1).start()
+        while len(JobsStandInHandler.finished) < n_jobs:
+            sleep(0.01)
+        print('JobPipeline (after): {0:.1f} jobs/s'.format(n_jobs / (perf_counter() - start)))
+        pipeline.stop()
+        print('    pipeline statistics: {0}'.format(pipeline.statistics()))
+        assert not JobsStandInHandler.released, JobsStandInHandler.released
+    finally:
+        server.shutdown()
+
+class RecordedShapeHandler(StandInHandler):
+    '''
+    Stand-in for the api/current/<namespace>/<endpoint>.py routes used by Molecules, RMSD, Jobs and Statistics, answering after LATENCY seconds
+    with payloads of recorded shape: N_MOLECULES molecules per search, FILE_SIZE bytes per downloaded file. Responses carry an ETag, are
+    gzipped (from GZIP_MINIMUM_SIZE bytes) if the client accepts it, and share a link of BANDWIDTH bytes/s if set. Multipart uploads
+    are read in chunks and only scanned for their molids (uncompressed bodies only), so that the server does not weigh on the client's memory.
+    '''
+    (LATENCY, N_MOLECULES, FILE_SIZE, BANDWIDTH) = (0., 1000, 100 * 1024, None)
+    GZIP_MINIMUM_SIZE = 1024
+    (lock, link_lock, payloads) = (Lock(), Lock(), {})
+
+    @classmethod
+    def configure(cls, latency: float, n_molecules: int, file_size: int, bandwidth: float = None) -> None:
+        with cls.lock:
+            (cls.LATENCY, cls.N_MOLECULES, cls.FILE_SIZE, cls.BANDWIDTH, cls.payloads) = (latency, n_molecules, file_size, bandwidth, {})
+
+    def read_parameters(self) -> dict:
+        parameters = {key: values[0] for (key, values) in parse_qs(urlsplit(self.path).query).items()}
+        if self.headers.get('Content-Type', '').startswith('multipart/form-data'):
+            parameters['molids'] = ','.join(
+                molid.decode() for chunk in self.body_chunks() for molid in re.findall(rb'name="molid"\r\n\r\n([0-9]+)', chunk)
+            )
+        else:
+            body = b''.join(self.body_chunks()).decode()
+            parameters.update({key: values[0] for (key, values) in parse_qs(body).items()})
+        return parameters
+
+    def payload_for(self, endpoint: str, parameters: dict):
+        molids = [molid for molid in parameters.get('molids', '').split(',') if molid]
+        if endpoint == 'molecules/search':
+            (offset, limit) = (int(parameters.get('offset', 0)), int(parameters.get('limit', self.N_MOLECULES)))
+            matching_molids = range(offset, min(self.N_MOLECULES, offset + limit))
+            if parameters.get('return_type') == 'molids':
+                return dict(molids=list(matching_molids))
+            return dict(molecules=[recorded_shape_molecule(molid) for molid in matching_molids])
+        elif endpoint == 'molecules/molid':
+            if molids:
+                return dict(molecules=[recorded_shape_molecule(int(molid)) for molid in molids])
+            return dict(molecule=recorded_shape_molecule(int(parameters['molid'])))
+        elif endpoint == 'molecules/download_file':
+            lines = []
+            while 81 * len(lines) < self.FILE_SIZE:
+                i = len(lines)
+                lines.append('ATOM  {0:5d}  C{1:<2d} EOH     1    {2:8.3f}{3:8.3f}{4:8.3f}  1.00  0.00           C'.format(
+                    i % 100000, i % 10, (i * 7919 % 20011) / 1000., (i * 104729 % 20021) / 1000., (i * 1299709 % 20023) / 1000.,
+                ))
+            return '\n'.join(lines).encode()[:self.FILE_SIZE]
+        elif endpoint == 'rmsd/matrix':
+            return dict(molids=molids, matrix=[[0.1 * (i != j) for j in range(len(molids))] for i in range(len(molids))])
+        elif endpoint == 'rmsd/align':
+            return dict(molids=molids, rmsds=[0.1] * len(molids))
+        elif endpoint == 'jobs/get':
+            return dict(jobs=[dict(molid=molid, qm_level=1) for molid in range(10)])
+        elif endpoint == 'jobs/finished':
+            return dict(accepted_molids=[int(molid) for molid in molids])
+        elif endpoint.startswith('jobs/'):
+            return dict(molids=molids)
+        elif endpoint == 'statistics/charge_distribution':
+            return dict(data={str(net_charge): 1000 // (1 + abs(net_charge)) for net_charge in range(-5, 6)})
+        return None
+
+    def respond(self) -> None:
+        sleep(self.LATENCY)
+        endpoint = '/'.join(urlsplit(self.path).path.rsplit('/', 2)[-2:])[:-len('.py')]
+        parameters = self.read_parameters()
+        key = (endpoint, tuple(sorted((key, value) for (key, value) in parameters.items() if key != 'api_token')))
+        with self.lock:
+            content = self.payloads.get(key)
+        if content is None:
+            payload = self.payload_for(endpoint, parameters)
+            content = payload if isinstance(payload, bytes) or payload is None else json.dumps(payload).encode()
+            with self.lock:
+                self.payloads[key] = content
+        if content is None:
+            self.send_error(404)
+            return
+        # Like most servers, only bodies worth it are compressed
+        is_gzipped = 'gzip' in self.headers.get('Accept-Encoding', '') and len(content) >= self.GZIP_MINIMUM_SIZE
+        etag = '"{0}{1}"'.format(sha1(content).hexdigest(), '-gzip' if is_gzipped else '')
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        if is_gzipped:
+            with self.lock:
+                gzipped_content = self.payloads.get(key + ('gzip',))
+            if gzipped_content is None:
+                gzipped_content = gzip.compress(content, 6)
+                with self.lock:
+                    self.payloads[key + ('gzip',)] = gzipped_content
+            content = gzipped_content
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('ETag', etag)
+        if is_gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        if self.BANDWIDTH is not None:
+            # A single link, shared by all connections
+            with self.link_lock:
+                sleep(len(content) / self.BANDWIDTH)
+        self.wfile.write(content)
+
+    do_GET = respond
+    do_POST = respond
+
+def percentile(sorted_values: list, q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(round(q / 100. * (len(sorted_values) - 1))))]
+
+def measure(function, n_calls: int) -> dict:
+    '''Throughput and latency percentiles of n_calls calls to function (after a warm-up call), and the peak memory of one more.'''
+    function()
+    latencies = []
+    start = perf_counter()
+    for _ in range(n_calls):
+        call_start = perf_counter()
+        function()
+        latencies.append(perf_counter() - call_start)
+    elapsed = perf_counter() - start
+    latencies.sort()
+    # Measured separately, as tracing allocations slows the client down considerably
+    tracemalloc.start()
+    function()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return dict(
+        calls_per_second=n_calls / elapsed,
+        p50_ms=percentile(latencies, 50) * 1e3,
+        p90_ms=percentile(latencies, 90) * 1e3,
+        p99_ms=percentile(latencies, 99) * 1e3,
+        peak_memory_mb=peak_memory / 1e6,
+    )
+
+# (scenario, number of calls, number of molecules per search, downloaded file size, function of (api, scratch directory))
+SUITE_SCENARIOS = [
+    ('single_call', 300, 1000, 100 * 1024, lambda api, out_dir: api.Molecules.molid(molid=21)),
+    ('statistics', 300, 1000, 100 * 1024, lambda api, out_dir: api.Statistics.charge_distribution()),
+    ('large_search', 10, 10000, 100 * 1024, lambda api, out_dir: api.Molecules.search(any='ethanol')),
+    ('large_search_table', 10, 10000, 100 * 1024, lambda api, out_dir: api.Molecules.search(any='ethanol', return_type='table')),
+    ('bulk_download', 5, 1000, 100 * 1024, lambda api, out_dir: api.Molecules.download_many(list(range(50)), ['pdb_aa', 'mtb_aa'], out_dir=out_dir)),
+    ('file_download', 20, 1000, 10 * 1024 ** 2, lambda api, out_dir: api.Molecules.download_file(molid=21, atb_format='pdb_aa', fnme=join(out_dir, 'large.pdb'))),
+    ('rmsd_matrix', 50, 1000, 100 * 1024, lambda api, out_dir: api.RMSD.matrix(molids=','.join(map(str, range(100))))),
+    ('multipart_upload', 10, 1000, 100 * 1024, lambda api, out_dir: api.Jobs.finished(
+        molids=list(range(4)),
+        qm_logs=[b'SCF Done:  E(RB3LYP) =  -155.033   A.U. after   10 cycles\n' * 20000] * 4,
+        current_qm_levels=[1] * 4,
+    )),
+]
+
+# Metrics for which a lower value is a regression; higher is a regression for all the others
+HIGHER_IS_BETTER = ('calls_per_second',)
+
+def regressions_against(results: dict, baseline: dict, tolerance: float) -> list:
+    '''Descriptions of the metrics of results that are worse than those of baseline by more than tolerance (relative).'''
+    regressions = []
+    for (scenario, metrics) in sorted(results['scenarios'].items()):
+        for (metric, value) in sorted(metrics.items()):
+            baseline_value = baseline.get('scenarios', {}).get(scenario, {}).get(metric)
+            if not baseline_value:
+                continue
+            ratio = value / baseline_value
+            if (ratio < 1. - tolerance) if metric in HIGHER_IS_BETTER else (ratio > 1. + tolerance):
+                regressions.append('{0}.{1}: {2:.3g} (baseline {3:.3g}, {4:+.0%})'.format(scenario, metric, value, baseline_value, ratio - 1.))
+    return regressions
+
+def benchmark_suite(output: str = 'benchmark_results.json', baseline: str = None, latency: float = 0.001, tolerance: float = 0.2, scenarios: list = None) -> list:
+    '''
+    Run SUITE_SCENARIOS against a RecordedShapeHandler server answering after latency seconds, write the results to output as JSON,
+    and return (and print) the regressions against the results stored in baseline, if given.
+    '''
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RecordedShapeHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    api = API(host='http://127.0.0.1:{0}'.format(server.server_address[1]), api_token='benchmark', api_format='json')
+    out_dir = mkdtemp()
+    results = dict(python=python_version(), latency=latency, scenarios={})
+    try:
+        for (scenario, n_calls, n_molecules, file_size, function) in SUITE_SCENARIOS:
+            if scenarios is not None and scenario not in scenarios:
+                continue
+            RecordedShapeHandler.configure(latency, n_molecules, file_size)
+            results['scenarios'][scenario] = measure(lambda: function(api, out_dir), n_calls)
+            print('{0}: {1}'.format(scenario, ', '.join('{0}={1:.3g}'.format(key, value) for (key, value) in sorted(results['scenarios'][scenario].items()))))
+    finally:
+        server.shutdown()
+    if baseline is not None:
+        with open(baseline) as fh:
+            results['regressions'] = regressions_against(results, json.load(fh), tolerance)
+        for regression in results['regressions']:
+            print('REGRESSION {0}'.format(regression))
+    if output is not None:
+        with open(output, 'w') as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+    return results.get('regressions', [])
+
+def benchmark_conditional_requests(n_molecules: int = 200, file_size: int = 256 * 1024) -> None:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RecordedShapeHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    host = 'http://127.0.0.1:{0}'.format(server.server_address[1])
+    RecordedShapeHandler.configure(0., 1000, file_size)
+    try:
+        for (description, conditional_cache) in [
+            ('full downloads (before)', None),
+            ('conditional requests (after)', ConditionalCache(mkdtemp())),
+        ]:
+            api = API(host=host, api_token='benchmark', api_format='json', conditional_cache=conditional_cache)
+            out_dir = mkdtemp()
+            api.Molecules.download_many(list(range(n_molecules)), ['pdb_aa', 'mtb_aa'], out_dir=out_dir)
+            # Refresh of an unchanged mirror
+            start = perf_counter()
+            api.Molecules.download_many(list(range(n_molecules)), ['pdb_aa', 'mtb_aa'], out_dir=out_dir)
+            print('{0}: mirror refresh in {1:.2f}s'.format(description, perf_counter() - start))
+            if conditional_cache is not None:
+                print('    conditional cache statistics: {0}'.format(conditional_cache.statistics()))
+    finally:
+        server.shutdown()
+
+def benchmark_response_compression(n_molecules: int = 50, file_size: int = 512 * 1024, bandwidth: float = 50e6) -> None:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RecordedShapeHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    host = 'http://127.0.0.1:{0}'.format(server.server_address[1])
+    RecordedShapeHandler.configure(0., 1000, file_size, bandwidth=bandwidth)
+    try:
+        for (description, accept_encoding) in [('identity responses (before)', False), ('compressed responses (after)', True)]:
+            api = API(host=host, api_token='benchmark', api_format='json', accept_encoding=accept_encoding)
+            out_dir = mkdtemp()
+            # The first pass is a warm-up, so that the stand-in server has generated (and compressed) every payload
+            for _ in range(2):
+                start = perf_counter()
+                for molid in range(n_molecules):
+                    api.Molecules.download_file(molid=molid, atb_format='pdb_aa', fnme=join(out_dir, '{0}.pdb'.format(molid)))
+            print('{0}: {1:.1f} downloads/s over a {2:.0f} MB/s link'.format(description, n_molecules / (perf_counter() - start), bandwidth / 1e6))
+            if accept_encoding:
+                print('    compression statistics: {0}'.format(api.transport_statistics()['compression']))
+    finally:
+        server.shutdown()
+
+# Heavy modules that importing atb_api and constructing a JSON client must not load (checked by tests/test_startup.py)
+LAZY_MODULES = ('numpy', 'yaml', 'pickle', 'asyncio', 'sqlite3', 'urllib.request', 'concurrent.futures.process')
+# Budgets in seconds, reported by benchmark_startup() (machine dependent, so not enforced by the tests)
+(IMPORT_BUDGET, CONSTRUCTION_BUDGET) = (0.1, 100e-6)
+
+def startup_output(code: str, *python_options: str) -> str:
+    '''Output of code run by a new interpreter, with bytecode caching enabled (so that atb_api is not compiled at every import).'''
+    environment = dict(environ, PYTHONPATH=dirname(atb_api.__file__))
+    environment.pop('PYTHONDONTWRITEBYTECODE', None)
+    return check_output([sys.executable] + list(python_options) + ['-c', code], env=environment, stderr=STDOUT).decode()
+
+def eagerly_loaded_modules() -> list:
+    '''LAZY_MODULES loaded by importing atb_api and constructing an API, in a fresh interpreter.'''
+    return json.loads(startup_output(
+        'import atb_api, json, sys; '
+        'atb_api.API(api_token="benchmark", api_format="json"); '
+        'print(json.dumps([module for module in {0} if module in sys.modules]))'.format(LAZY_MODULES),
+    ))
+
+def startup_measurements(n_repeats: int = 5) -> tuple:
+    '''(import time, API() construction time, LAZY_MODULES loaded by both) in fresh interpreters; times in seconds, best of n_repeats.'''
+    startup_output('import atb_api')
+    import_time = min(
+        int(re.search(r'\|\s*([0-9]+) \| atb_api$', startup_output('import atb_api', '-X', 'importtime'), re.MULTILINE).group(1)) / 1e6
+        for _ in range(n_repeats)
+    )
+    (construction_time, loaded_modules) = json.loads(startup_output(
+        'import atb_api, json, sys, timeit; '
+        'construction_time = min(timeit.repeat(lambda: atb_api.API(api_token="benchmark", api_format="json"), number=100, repeat=5)) / 100; '
+        'print(json.dumps([construction_time, [module for module in {0} if module in sys.modules]]))'.format(LAZY_MODULES),
+    ))
+    return (import_time, construction_time, loaded_modules)
+
+def benchmark_startup(n_repeats: int = 5) -> None:
+    (import_time, construction_time, loaded_modules) = startup_measurements(n_repeats)
+    print('import atb_api: {0:.1f} ms (budget {1:.0f} ms)'.format(import_time * 1e3, IMPORT_BUDGET * 1e3))
+    print('API(api_format=\'json\'): {0:.1f} us (budget {1:.0f} us)'.format(construction_time * 1e6, CONSTRUCTION_BUDGET * 1e6))
+    print('heavy modules loaded eagerly: {0}'.format(', '.join(loaded_modules) or 'none'))
+
+BENCHMARKS = {
+    'startup': benchmark_startup,
+    'connection_pool': benchmark_connection_pool,
+    'client_overhead': benchmark_client_overhead,
+    'transports': benchmark_transports,
+    'deserializers': benchmark_deserializers,
+    'local_rmsd': benchmark_local_rmsd,
+    'uploads': benchmark_uploads,
+    'job_pipeline': benchmark_job_pipeline,
+    'conditional_requests': benchmark_conditional_requests,
+    'response_compression': benchmark_response_compression,
+}
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Offline benchmarks of the ATB API client. Without arguments, runs every benchmark, then the suite.')
+    parser.add_argument('benchmarks', nargs='*', help='Any of {0}, or "suite"'.format(', '.join(BENCHMARKS.keys())))
+    parser.add_argument('--output', default='benchmark_results.json', help='Where to write the suite results, as JSON')
+    parser.add_argument('--baseline', default=None, help='Suite results (JSON) to compare against; exits with status 1 on regressions')
+    parser.add_argument('--latency', type=float, default=0.001, help='Stand-in server latency (seconds) in the suite')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Relative change of a suite metric flagged as a regression')
+    parser.add_argument('--scenarios', nargs='+', default=None, help='Suite scenarios to run (default: all)')
+    args = parser.parse_args()
+
+    regressions = []
+    for name in (args.benchmarks or list(BENCHMARKS.keys()) + ['suite']):
+        if name == 'suite':
+            regressions = benchmark_suite(args.output, args.baseline, args.latency, args.tolerance, args.scenarios)
+        else:
+            BENCHMARKS[name]()
+    sys.exit(1 if regressions else 0)
@@ -1,19 +1,30 @@
-from urllib.request import urlopen, Request
 from urllib.error import HTTPError, URLError
-from urllib.parse import urlencode
-import yaml
+from urllib.parse import urlencode, urlsplit, urlunsplit, urljoin, parse_qsl
+from http.client import HTTPConnection, HTTPSConnection, HTTPException, HTTPMessage, parse_headers
+from ssl import create_default_context
+from threading import Lock, BoundedSemaphore, Condition, Event, Thread
+from queue import Queue, Empty, Full
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from time import monotonic, sleep, time
+from random import uniform
+from io import BytesIO, TextIOBase
+import zlib
+import gzip
+from base64 import b64encode, b64decode
 import json
-import pickle
-from operator import itemgetter
-from os import getpid
+from os import urandom, getpid, makedirs, replace, remove, utime, listdir, stat, cpu_count
+from hashlib import sha1, sha256, new as new_hash
 from copy import deepcopy
+from weakref import WeakSet
 import sys
-from inspect import stack
-from requests import post
-from tempfile import TemporaryFile
-from typing import Any, List, Dict, Callable, Optional, Union, Tuple
+from typing import Any, List, Dict, Callable, Optional, Union, Tuple, Iterator
 from functools import reduce
-from os.path import join
+from numbers import Integral
+from operator import index as as_index
+from bisect import bisect_left
+from os.path import join, dirname, basename, exists, getsize
 from socket import timeout
 from logging import getLogger, Formatter, FileHandler, StreamHandler, DEBUG, INFO, WARNING, ERROR, Logger
 from functools import reduce
@@ -55,17 +66,62 @@ def get_log(unique_id: str, verbosity: int = 0, debug_stream: Any = sys.stdout)
 
     return log
 
+# Heavy or rarely needed modules (yaml, pickle, sqlite3, asyncio, urllib.request, ...) are imported on first use, as most short-lived
+# clients only need a few of them; see benchmark_atb_api.py startup for the import and construction time budgets.
+
+def yaml_loader() -> Any:
+    '''libyaml's C loader is an order of magnitude faster than the pure-Python one.'''
+    import yaml
+    return getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+def yaml_dump(data: Any) -> str:
+    import yaml
+    return yaml.dump(data)
+
+# Formats whose responses are returned as bytes rather than decoded text
+BINARY_API_FORMATS = ('pickle', 'msgpack')
+
+def json_loads_fct() -> Callable[[Union[str, bytes]], API_RESPONSE]:
+    try:
+        from orjson import loads
+    except ImportError:
+        try:
+            from ujson import loads
+        except ImportError:
+            from json import loads
+    return loads
+
+def available_api_formats() -> List[str]:
+    '''Candidates for api_format='auto', fastest to deserialize first.'''
+    api_formats = ['json', 'yaml']
+    try:
+        import msgpack
+        api_formats.insert(1 if json_loads_fct() is not json.loads else 0, 'msgpack')
+    except ImportError:
+        pass
+    return api_formats
+
 def deserializer_fct_for(api_format: str) -> Callable[[str], API_RESPONSE]:
     if api_format == 'json':
-        deserializer_fct = lambda x: json.loads(x)
+        deserializer_fct = json_loads_fct()
     elif api_format == 'yaml':
-        deserializer_fct = lambda x: yaml.load(x)
+        from yaml import load
+        (loader, deserializer_fct) = (yaml_loader(), lambda x: load(x, Loader=loader))
+    elif api_format == 'msgpack':
+        from msgpack import unpackb
+        deserializer_fct = lambda x: unpackb(x, raw=False)
     elif api_format == 'pickle':
-        deserializer_fct = lambda x: pickle.loads(x)
+        from pickle import loads
+        deserializer_fct = lambda x: loads(x)
     else:
         raise Exception('Incorrect API serialization format.')
     return deserializer_fct
 
+def route_for(api_namespace: str, api_endpoint: str) -> str:
+    api_method = api_endpoint + '.py'
+    assert search('^[a-zA-Z0-9-_]+\.py$', api_method), api_method
+    return join('api', 'current', api_namespace, api_method)
+
 def truncate_str_if_necessary(a_str: str, max_length: int = 1000) -> str:
     if len(a_str) <= max_length:
         return a_str
@@ -84,13 +140,1611 @@ def concat_dicts(*args: List[Dict[Any, Any]]) -> Dict[Any, Any]:
         ),
     )
 
+def merge_responses(responses: List[API_RESPONSE]) -> API_RESPONSE:
+    '''Merge the responses of the chunks of a request: lists are concatenated, dicts merged, and other values taken from the last chunk.'''
+    merged = {}
+    for response in responses:
+        for (key, value) in response.items():
+            if isinstance(value, list) and isinstance(merged.get(key), list):
+                merged[key] = merged[key] + value
+            elif isinstance(value, dict) and isinstance(merged.get(key), dict):
+                merged[key] = add_dicts(merged[key], value)
+            else:
+                merged[key] = value
+    return merged
+
+def merge_align_responses(responses: List[API_RESPONSE]) -> API_RESPONSE:
+    '''merge_responses() of RMSD.align() chunks, which all start with the reference molid: its entry is only kept from the first chunk.'''
+    if not responses or not responses[0].get('molids'):
+        return merge_responses(responses)
+    reference = str(responses[0]['molids'][0])
+    without_reference = []
+    for response in responses[1:]:
+        molids = [str(molid) for molid in response.get('molids', [])]
+        if reference in molids:
+            i = molids.index(reference)
+            response = {
+                key: value[:i] + value[i + 1:] if isinstance(value, list) and len(value) == len(molids) else value
+                for (key, value) in response.items()
+            }
+        without_reference.append(response)
+    return merge_responses(responses[:1] + without_reference)
+
+def molid_list_for(molids: Union[ATB_MOLID, List[ATB_MOLID], Tuple[ATB_MOLID, ...]]) -> List[ATB_MOLID]:
+    if isinstance(molids, str):
+        return [molid for molid in molids.split(',') if molid]
+    elif isinstance(molids, int):
+        return [molids]
+    else:
+        return list(molids)
+
+class ChunkedRequestError(Exception):
+    '''Some chunks of a request split by API.in_chunks() failed: see errors, result (merged successful chunks) and pending (unsent molids).'''
+
+    def __init__(self, errors: List[Tuple[List[ATB_MOLID], Exception]], result: Any, pending: List[ATB_MOLID] = []) -> None:
+        super(ChunkedRequestError, self).__init__(
+            '{0} chunk(s) failed: {1}{2}'.format(
+                len(errors),
+                '; '.join('{0} molids: {1}'.format(len(molids), e) for (molids, e) in errors),
+                ' ({0} molids not sent)'.format(len(pending)) if pending else '',
+            ),
+        )
+        self.errors = errors
+        self.result = result
+        self.pending = list(pending)
+
 DEFAULT_DEBUG_STREAM = sys.stderr
 
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def pool_key_for(split_url: Any) -> Tuple[str, str, int]:
+    return (split_url.scheme, split_url.hostname, split_url.port or DEFAULT_PORTS.get(split_url.scheme))
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+def normalized_items(data_items: List[Tuple[str, Any]]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((str(key), str(value)) for (key, value) in data_items))
+
+def endpoint_for(url: str) -> str:
+    ''''namespace/endpoint' of an API url, e.g. 'molecules/molid'.'''
+    return '/'.join(url.rsplit('/', 2)[-2:])[:-len('.py')]
+
+# Endpoints with side effects, whose requests are neither shared nor retried by default
+NON_IDEMPOTENT_ENDPOINTS = (
+    'molecules/submit',
+    'molecules/finished_job',
+    'jobs/finished',
+    'jobs/get',
+    'jobs/new',
+    'jobs/accept',
+    'jobs/release',
+    'jobs/sync',
+)
+
+def is_file_value(value: Any) -> bool:
+    return isinstance(value, (bytes, bytearray, memoryview)) or hasattr(value, 'read')
+
+def chunked_frames(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    '''Frame a request body of unknown length for Transfer-Encoding: chunked.'''
+    for chunk in chunks:
+        if len(chunk) > 0:
+            yield '{0:x}\r\n'.format(len(chunk)).encode() + bytes(chunk) + b'\r\n'
+    yield b'0\r\n\r\n'
+
+class MultipartBody(object):
+    '''Streaming (optionally gzipped) multipart/form-data request body, which can be iterated again on retries.'''
+    CHUNK_SIZE = 64 * 1024
+    COMPRESSION_LEVEL = 6
+
+    def __init__(self, data_items: List[Tuple[str, Any]], compress: bool = False, chunk_size: int = CHUNK_SIZE) -> None:
+        self.boundary = urandom(16).hex()
+        self.compress = compress
+        self.sent_bytes = 0
+        self.chunk_size = chunk_size
+        # (part header, value, initial position of seekable files)
+        self.parts = [
+            (
+                self.header_for(key, is_file_value(value)),
+                value,
+                value.tell() if hasattr(value, 'seekable') and value.seekable() else None,
+            )
+            for (key, value) in data_items
+        ]
+
+    def header_for(self, key: str, is_file: bool) -> bytes:
+        return '--{0}\r\nContent-Disposition: form-data; name="{1}"{2}\r\n\r\n'.format(
+            self.boundary,
+            key,
+            '; filename="{0}"'.format(key) if is_file else '',
+        ).encode()
+
+    def value_chunks(self, value: Any, position: Optional[int]) -> Iterator[bytes]:
+        if hasattr(value, 'read'):
+            if position is not None:
+                value.seek(position)
+            while True:
+                chunk = value.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk if not isinstance(chunk, str) else chunk.encode()
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            view = memoryview(value).cast('B')
+            for i in range(0, len(view), self.chunk_size):
+                yield view[i:i + self.chunk_size]
+        else:
+            yield str(value).encode()
+
+    def uncompressed_chunks(self) -> Iterator[bytes]:
+        for (header, value, position) in self.parts:
+            yield header
+            yield from self.value_chunks(value, position)
+            yield b'\r\n'
+        yield '--{0}--\r\n'.format(self.boundary).encode()
+
+    def __iter__(self) -> Iterator[bytes]:
+        self.sent_bytes = 0
+        for chunk in (self.compressed_chunks() if self.compress else self.uncompressed_chunks()):
+            self.sent_bytes += len(chunk)
+            yield chunk
+
+    def compressed_chunks(self) -> Iterator[bytes]:
+        compressor = zlib.compressobj(self.COMPRESSION_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in self.uncompressed_chunks():
+            compressed_chunk = compressor.compress(chunk)
+            if compressed_chunk:
+                yield compressed_chunk
+        yield compressor.flush()
+
+    @staticmethod
+    def size_for(value: Any, position: Optional[int]) -> Optional[int]:
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return memoryview(value).nbytes
+        elif hasattr(value, 'read'):
+            if position is None or isinstance(value, TextIOBase):
+                return None
+            end = value.seek(0, 2)
+            value.seek(position)
+            return end - position
+        else:
+            return len(str(value).encode())
+
+    def content_length(self) -> Optional[int]:
+        '''Body size in bytes, or None if it is only known once sent (compressed body, unseekable or text files).'''
+        if self.compress:
+            return None
+        sizes = [self.size_for(value, position) for (_, value, position) in self.parts]
+        if None in sizes:
+            return None
+        return sum(sizes) + sum(len(header) + 2 for (header, _, _) in self.parts) + len('--{0}--\r\n'.format(self.boundary))
+
+    def headers(self) -> Dict[str, str]:
+        content_length = self.content_length()
+        return add_dicts(
+            {'Content-Type': 'multipart/form-data; boundary={0}'.format(self.boundary)},
+            {'Content-Length': str(content_length)} if content_length is not None else {},
+            {'Content-Encoding': 'gzip'} if self.compress else {},
+        )
+
+class PooledResponse(object):
+    '''File-like HTTP response which hands its connection back to the pool once the body has been read.'''
+
+    def __init__(self, pool: 'ConnectionPool', key: Tuple[str, str, int], connection: HTTPConnection, response: Any, url: str, connect_time: float = 0.) -> None:
+        self.pool = pool
+        # Seconds spent opening the connection (0 for reused ones)
+        self.connect_time = connect_time
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.msg
+
+    def getcode(self) -> int:
+        return self.status
+
+    def info(self) -> Any:
+        return self.headers
+
+    def geturl(self) -> str:
+        return self.url
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        content = self.response.read() if amt is None else self.response.read(amt)
+        if self.response.isclosed():
+            self.release()
+        return content
+
+    def release(self) -> None:
+        if self.connection is None:
+            return
+        connection, self.connection = self.connection, None
+        if self.response.isclosed() and not self.response.will_close:
+            self.pool.put_connection(self.key, connection)
+        else:
+            self.pool.discard_connection(connection)
+
+    def close(self) -> None:
+        self.release()
+        self.response.close()
+
+    def __del__(self) -> None:
+        # Responses dropped before being read to the end give their connection slot back
+        if getattr(self, 'connection', None) is not None:
+            self.close()
+
+    def __enter__(self) -> 'PooledResponse':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+class ConnectionPool(object):
+    '''Thread-safe pool of persistent (keep-alive) HTTP(S) connections, keyed by (scheme, host, port).'''
+    POOL_SIZE = 10
+    KEEP_ALIVE = 30.
+    MAXIMUM_REDIRECTS = 5
+
+    def __init__(self, maxsize: int = POOL_SIZE, keep_alive: float = KEEP_ALIVE, keep_alive_per_host: Optional[Dict[str, float]] = None, ssl_context: Any = None) -> None:
+        self.maxsize = maxsize
+        self.keep_alive = keep_alive
+        self.keep_alive_per_host = dict(keep_alive_per_host) if keep_alive_per_host is not None else {}
+        self.ssl_context = ssl_context
+        self.lock = Lock()
+        self.idle_connections = {}
+        self.in_use = 0
+        self.counters = dict(
+            requests=0,
+            connections_created=0,
+            connections_reused=0,
+            connections_expired=0,
+            connections_discarded=0,
+        )
+
+    def keep_alive_for(self, host: str) -> float:
+        return self.keep_alive_per_host.get(host, self.keep_alive)
+
+    def new_connection(self, key: Tuple[str, str, int], timeout: Optional[float]) -> HTTPConnection:
+        (scheme, host, port) = key
+        if scheme == 'https':
+            if self.ssl_context is None:
+                self.ssl_context = create_default_context()
+            return HTTPSConnection(host, port, timeout=timeout, context=self.ssl_context)
+        elif scheme == 'http':
+            return HTTPConnection(host, port, timeout=timeout)
+        else:
+            raise Exception('Unsupported URL scheme: {0}'.format(scheme))
+
+    def is_reusable(self, connection: Any) -> bool:
+        return True
+
+    def take_idle_connection(self, key: Tuple[str, str, int]) -> Optional[Any]:
+        '''Take a slot, and the most recently used idle connection for key that is still alive (None if there is none).'''
+        (now, expired_connections) = (monotonic(), [])
+        try:
+            with self.lock:
+                self.in_use += 1
+                idle_connections = self.idle_connections.get(key, [])
+                while idle_connections:
+                    (connection, last_used) = idle_connections.pop()
+                    if now - last_used <= self.keep_alive_for(key[1]) and self.is_reusable(connection):
+                        self.counters['connections_reused'] += 1
+                        return connection
+                    self.counters['connections_expired'] += 1
+                    expired_connections.append(connection)
+                self.counters['connections_created'] += 1
+                return None
+        finally:
+            for connection in expired_connections:
+                connection.close()
+
+    def release_slot(self) -> None:
+        with self.lock:
+            self.in_use -= 1
+
+    def get_connection(self, key: Tuple[str, str, int], timeout: Optional[float]) -> Tuple[HTTPConnection, bool]:
+        connection = self.take_idle_connection(key)
+        if connection is not None:
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            return (connection, True)
+        try:
+            return (self.new_connection(key, timeout), False)
+        except:
+            self.release_slot()
+            raise
+
+    def put_connection(self, key: Tuple[str, str, int], connection: HTTPConnection) -> None:
+        with self.lock:
+            self.in_use -= 1
+            idle_connections = self.idle_connections.setdefault(key, [])
+            if len(idle_connections) < self.maxsize:
+                idle_connections.append((connection, monotonic()))
+                return
+            self.counters['connections_discarded'] += 1
+        connection.close()
+
+    def discard_connection(self, connection: HTTPConnection) -> None:
+        with self.lock:
+            self.in_use -= 1
+            self.counters['connections_discarded'] += 1
+        connection.close()
+
+    def send(self, method: str, url: str, body: Optional[bytes] = None, headers: Dict[str, str] = {}, timeout: Optional[float] = None) -> PooledResponse:
+        split_url = urlsplit(url)
+        key = pool_key_for(split_url)
+        path = urlunsplit(('', '', split_url.path or '/', split_url.query, ''))
+        with self.lock:
+            self.counters['requests'] += 1
+        # Streamed bodies of unknown length (e.g. compressed uploads) are sent chunked
+        is_chunked = body is not None and not isinstance(body, bytes) and 'Content-Length' not in headers
+        if is_chunked:
+            headers = add_dicts(headers, {'Transfer-Encoding': 'chunked'})
+        while True:
+            (connection, reused) = self.get_connection(key, timeout)
+            response = None
+            try:
+                connect_time = 0.
+                if not reused:
+                    connect_started_at = monotonic()
+                    connection.connect()
+                    connect_time = monotonic() - connect_started_at
+                connection.request(method, path, body=chunked_frames(body) if is_chunked else body, headers=headers)
+                response = connection.getresponse()
+            except API_Timeout:
+                raise
+            except (HTTPException, OSError) as e:
+                if reused:
+                    # The server closed this keep-alive connection while it was idle; retry on a fresh one
+                    continue
+                raise URLError(e)
+            finally:
+                # Whatever went wrong, the connection's slot is given back
+                if response is None:
+                    self.discard_connection(connection)
+            return PooledResponse(self, key, connection, response, url, connect_time=connect_time)
+
+    def urlopen(self, method: str, url: str, body: Optional[bytes] = None, headers: Dict[str, str] = {}, timeout: Optional[float] = None) -> PooledResponse:
+        for _ in range(self.MAXIMUM_REDIRECTS + 1):
+            response = self.send(method, url, body=body, headers=headers, timeout=timeout)
+            if response.status in REDIRECT_STATUSES and response.headers.get('Location') is not None:
+                response.read()
+                url = urljoin(url, response.headers['Location'])
+                if response.status not in (307, 308):
+                    method, body, headers = 'GET', None, {}
+            elif response.status >= 400:
+                raise HTTPError(url, response.status, response.reason, response.headers, BytesIO(response.read()))
+            else:
+                return response
+        raise URLError('Too many redirects (>{0}) for url: {1}'.format(self.MAXIMUM_REDIRECTS, url))
+
+    def statistics(self) -> Dict[str, int]:
+        with self.lock:
+            return add_dicts(
+                self.counters,
+                dict(
+                    in_use=self.in_use,
+                    idle=sum(len(idle_connections) for idle_connections in self.idle_connections.values()),
+                    hosts=len(self.idle_connections),
+                ),
+            )
+
+    def clear(self) -> None:
+        with self.lock:
+            idle_connections, self.idle_connections = self.idle_connections, {}
+        for (connection, _) in reduce(lambda acc, e: acc + e, idle_connections.values(), []):
+            connection.close()
+
+class UrllibTransport(object):
+    '''Transport opening a new connection for every request, with urllib.request.urlopen().'''
+
+    def urlopen(self, method: str, url: str, body: Any = None, headers: Dict[str, str] = {}, timeout: Optional[float] = None) -> Any:
+        from urllib.request import urlopen, Request
+        return urlopen(Request(url, data=body, headers=headers, method=method), timeout=timeout)
+
+    def statistics(self) -> Dict[str, int]:
+        return {}
+
+    def clear(self) -> None:
+        pass
+
+def message_for(headers: List[Tuple[str, str]]) -> HTTPMessage:
+    message = HTTPMessage()
+    for (key, value) in headers:
+        message[key] = value
+    return message
+
+class BufferedResponse(BytesIO):
+    '''In-memory HTTP response, with the interface of those of urlopen() and ConnectionPool.urlopen().'''
+
+    def __init__(self, url: str, status: int, reason: str, headers: List[Tuple[str, str]], content: bytes) -> None:
+        super(BufferedResponse, self).__init__(content)
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = message_for(headers)
+
+    def getcode(self) -> int:
+        return self.status
+
+    def info(self) -> HTTPMessage:
+        return self.headers
+
+    def geturl(self) -> str:
+        return self.url
+
+def buffered_response_for(url: str, status: int, reason: str, headers: List[Tuple[str, str]], content: bytes) -> BufferedResponse:
+    '''BufferedResponse, raised as an HTTPError for error statuses (as urlopen() does).'''
+    if status >= 400:
+        raise HTTPError(url, status, reason, message_for(headers), BytesIO(content))
+    return BufferedResponse(url, status, reason, headers, content)
+
+def body_bytes_for(body: Any) -> bytes:
+    if body is None:
+        return b''
+    elif isinstance(body, bytes):
+        return body
+    else:
+        return b''.join(bytes(chunk) for chunk in body)
+
+class InProcessTransport(object):
+    '''Transport calling handler(method, url, headers, body) -> (status, headers, content) in-process, without sockets.'''
+
+    def __init__(self, handler: Callable[[str, str, Dict[str, str], bytes], Tuple[int, Any, bytes]]) -> None:
+        self.handler = handler
+        self.lock = Lock()
+        self.counters = dict(requests=0, errors=0)
+
+    def urlopen(self, method: str, url: str, body: Any = None, headers: Dict[str, str] = {}, timeout: Optional[float] = None) -> BufferedResponse:
+        (status, response_headers, content) = self.handler(method, url, headers, body_bytes_for(body))
+        with self.lock:
+            self.counters['requests'] += 1
+            self.counters['errors'] += int(status >= 400)
+        response_headers = list(response_headers.items()) if isinstance(response_headers, dict) else list(response_headers)
+        return buffered_response_for(url, status, '', response_headers, content)
+
+    def statistics(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counters)
+
+    def clear(self) -> None:
+        pass
+
+# Looked up once, as failed imports are slow
+CONTENT_ENCODINGS = []
+
+def available_content_encodings() -> List[str]:
+    '''Response encodings the client can decode, most compact first: brotli (if the brotli or brotlicffi package is installed), gzip, deflate.'''
+    if not CONTENT_ENCODINGS:
+        from importlib.util import find_spec
+        CONTENT_ENCODINGS.extend((['br'] if any(find_spec(module_name) is not None for module_name in ('brotli', 'brotlicffi')) else []) + ['gzip', 'deflate'])
+    return list(CONTENT_ENCODINGS)
+
+class StreamDecoder(object):
+    '''Incremental decoder of a gzip, deflate (zlib-wrapped or raw) or br response body.'''
+
+    def __init__(self, content_encoding: str) -> None:
+        self.content_encoding = content_encoding
+        if content_encoding == 'br':
+            try:
+                from brotli import Decompressor
+                self.decompressor = Decompressor()
+                self.decompress = self.decompressor.process
+            except ImportError:
+                from brotlicffi import Decompressor
+                self.decompressor = Decompressor()
+                self.decompress = self.decompressor.decompress
+            self.flush = lambda: b''
+        elif content_encoding in ('gzip', 'x-gzip'):
+            self.set_decompressor(zlib.decompressobj(16 + zlib.MAX_WBITS))
+        elif content_encoding == 'deflate':
+            self.set_decompressor(zlib.decompressobj())
+            # Some servers send raw deflate streams, without the zlib header
+            self.is_first_chunk = True
+        else:
+            raise Exception('Unsupported Content-Encoding: {0}'.format(content_encoding))
+
+    def set_decompressor(self, decompressor: Any) -> None:
+        self.decompressor = decompressor
+        self.decompress = self.decompress_zlib
+        self.flush = decompressor.flush
+        self.is_first_chunk = False
+
+    def decompress_zlib(self, chunk: bytes) -> bytes:
+        try:
+            return self.decompressor.decompress(chunk)
+        except zlib.error:
+            if not self.is_first_chunk:
+                raise
+            self.set_decompressor(zlib.decompressobj(-zlib.MAX_WBITS))
+            return self.decompressor.decompress(chunk)
+        finally:
+            self.is_first_chunk = False
+
+class DecodingResponse(object):
+    '''HTTP response decompressing its body as it is read, CHUNK_SIZE compressed bytes at a time.'''
+    CHUNK_SIZE = 16 * 1024
+
+    def __init__(self, response: Any, transport: 'DecompressingTransport') -> None:
+        self.response = response
+        self.transport = transport
+        self.decoder = StreamDecoder(response.headers['Content-Encoding'].strip().lower())
+        self.buffer = bytearray()
+        self.eof = False
+        self.status = response.status
+        self.reason = response.reason
+        # The headers of the decoded body
+        self.headers = message_for([
+            (key, value) for (key, value) in response.headers.items() if key.lower() not in ('content-encoding', 'content-length')
+        ])
+        self.connect_time = getattr(response, 'connect_time', 0.)
+
+    def getcode(self) -> int:
+        return self.status
+
+    def info(self) -> Any:
+        return self.headers
+
+    def geturl(self) -> str:
+        return self.response.geturl()
+
+    def decoded_chunk(self, amt: Optional[int]) -> bytes:
+        chunk = self.response.read() if amt is None else self.response.read(amt)
+        decoded_chunk = self.decoder.decompress(chunk) if chunk else b''
+        if amt is None or not chunk:
+            decoded_chunk += self.decoder.flush()
+            self.eof = True
+        self.transport.count(len(chunk), len(decoded_chunk))
+        return decoded_chunk
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        if amt is None:
+            content = bytes(self.buffer) + (self.decoded_chunk(None) if not self.eof else b'')
+            self.buffer = bytearray()
+            return content
+        while len(self.buffer) < amt and not self.eof:
+            self.buffer += self.decoded_chunk(self.CHUNK_SIZE)
+        content = bytes(self.buffer[:amt])
+        del self.buffer[:amt]
+        return content
+
+    def close(self) -> None:
+        self.response.close()
+
+class DecompressingTransport(object):
+    '''Transport wrapper asking for compressed responses and decompressing them as they are read.'''
+
+    def __init__(self, transport: Any, content_encodings: Optional[List[str]] = None) -> None:
+        self.transport = transport
+        self.accept_encoding = ', '.join(content_encodings if content_encodings is not None else available_content_encodings())
+        self.lock = Lock()
+        self.counters = dict(compressed_responses=0, identity_responses=0, compressed_bytes=0, decompressed_bytes=0)
+
+    def count(self, compressed_bytes: int, decompressed_bytes: int) -> None:
+        with self.lock:
+            self.counters['compressed_bytes'] += compressed_bytes
+            self.counters['decompressed_bytes'] += decompressed_bytes
+
+    def urlopen(self, method: str, url: str, body: Any = None, headers: Dict[str, str] = {}, timeout: Optional[float] = None) -> Any:
+        try:
+            response = self.transport.urlopen(method, url, body=body, headers=add_dicts(headers, {'Accept-Encoding': self.accept_encoding}), timeout=timeout)
+        except HTTPError as e:
+            if e.headers is None or e.headers.get('Content-Encoding', 'identity').lower() == 'identity':
+                raise
+            # Decompressed, for error messages
+            decoded_error = DecodingResponse(e, self)
+            raise HTTPError(e.geturl(), e.code, e.reason, decoded_error.headers, BytesIO(decoded_error.read()))
+        is_compressed = response.headers.get('Content-Encoding', 'identity').lower() != 'identity'
+        with self.lock:
+            self.counters['compressed_responses' if is_compressed else 'identity_responses'] += 1
+        return DecodingResponse(response, self) if is_compressed else response
+
+    def statistics(self) -> Dict[str, Any]:
+        with self.lock:
+            compression = add_dicts(
+                self.counters,
+                dict(compression_ratio=self.counters['decompressed_bytes'] / self.counters['compressed_bytes'] if self.counters['compressed_bytes'] > 0 else 0.),
+            )
+        return add_dicts(self.transport.statistics(), dict(compression=compression))
+
+    def clear(self) -> None:
+        self.transport.clear()
+
+class Cassette(object):
+    '''Recorded HTTP exchanges in a gzipped JSON lines file, keyed by method, redacted url and body digest.'''
+    REDACTED_PARAMETERS = ('api_token',)
+
+    def __init__(self, fnme: str, redacted_parameters: Tuple[str, ...] = REDACTED_PARAMETERS) -> None:
+        self.fnme = fnme
+        self.redacted_parameters = redacted_parameters
+        self.lock = Lock()
+
+    def redacted_url(self, url: str) -> str:
+        split_url = urlsplit(url)
+        query_items = [(key, value) for (key, value) in parse_qsl(split_url.query, keep_blank_values=True) if key not in self.redacted_parameters]
+        return urlunsplit(split_url._replace(query=urlencode(sorted(query_items))))
+
+    def body_digest(self, body: Any) -> str:
+        digest = sha1()
+        if isinstance(body, MultipartBody):
+            # Digest of the uncompressed parts, without the (random) boundary
+            for (header, value, position) in body.parts:
+                key = search('name="([^"]*)"', header.decode()).group(1)
+                digest.update(header.replace(body.boundary.encode(), b''))
+                if key not in self.redacted_parameters:
+                    for chunk in body.value_chunks(value, position):
+                        digest.update(chunk)
+        elif body is not None:
+            try:
+                query_items = parse_qsl(body.decode(), keep_blank_values=True, strict_parsing=True)
+                digest.update(urlencode(sorted((key, value) for (key, value) in query_items if key not in self.redacted_parameters)).encode())
+            except (UnicodeDecodeError, ValueError):
+                digest.update(body_bytes_for(body))
+        return digest.hexdigest()
+
+    def key_for(self, method: str, url: str, body: Any) -> str:
+        return '{0} {1} {2}'.format(method, self.redacted_url(url), self.body_digest(body))
+
+    def append(self, key: str, url: str, status: int, reason: str, headers: List[Tuple[str, str]], content: bytes) -> None:
+        line = json.dumps(dict(key=key, url=self.redacted_url(url), status=status, reason=reason, headers=headers, content=b64encode(content).decode()))
+        with self.lock:
+            # Each append is a gzip member of its own, so that the file stays readable whenever recording stops
+            with gzip.open(self.fnme, 'ab') as fh:
+                fh.write(line.encode() + b'\n')
+
+    def exchanges(self) -> Dict[str, List[Tuple[int, str, List[Tuple[str, str]], bytes]]]:
+        exchanges = {}
+        with gzip.open(self.fnme, 'rb') as fh:
+            for line in fh:
+                exchange = json.loads(line.decode())
+                exchanges.setdefault(exchange['key'], []).append(
+                    (exchange['status'], exchange['reason'], [tuple(header) for header in exchange['headers']], b64decode(exchange['content'])),
+                )
+        return exchanges
+
+class RecordingTransport(object):
+    '''Transport recording every exchange of another transport (by default, a new ConnectionPool) into a Cassette file.'''
+
+    def __init__(self, fnme: str, transport: Any = None, redacted_parameters: Tuple[str, ...] = Cassette.REDACTED_PARAMETERS) -> None:
+        self.cassette = Cassette(fnme, redacted_parameters=redacted_parameters)
+        self.transport = transport if transport is not None else ConnectionPool()
+        self.lock = Lock()
+        self.counters = dict(recorded=0)
+
+    def urlopen(self, method: str, url: str, body: Any = None, headers: Dict[str, str] = {}, timeout: Optional[float] = None) -> BufferedResponse:
+        key = self.cassette.key_for(method, url, body)
+        try:
+            response = self.transport.urlopen(method, url, body=body, headers=headers, timeout=timeout)
+            (status, reason, response_headers, content) = (response.status, response.reason, list(response.headers.items()), response.read())
+        except HTTPError as e:
+            (status, reason, response_headers, content) = (e.code, e.reason, list(e.headers.items()), e.read())
+        self.cassette.append(key, url, status, reason, response_headers, content)
+        with self.lock:
+            self.counters['recorded'] += 1
+        return buffered_response_for(url, status, reason, response_headers, content)
+
+    def statistics(self) -> Dict[str, Any]:
+        with self.lock:
+            return add_dicts(self.counters, dict(transport=self.transport.statistics()))
+
+    def clear(self) -> None:
+        self.transport.clear()
+
+class ReplayTransport(object):
+    '''Transport answering requests from the exchanges of a Cassette file, offline; unrecorded requests raise a URLError.'''
+
+    def __init__(self, fnme: str, redacted_parameters: Tuple[str, ...] = Cassette.REDACTED_PARAMETERS) -> None:
+        self.cassette = Cassette(fnme, redacted_parameters=redacted_parameters)
+        self.exchanges = self.cassette.exchanges()
+        # key -> number of times it was replayed
+        self.replayed = {}
+        self.lock = Lock()
+        self.counters = dict(replayed=0, missing=0)
+
+    def urlopen(self, method: str, url: str, body: Any = None, headers: Dict[str, str] = {}, timeout: Optional[float] = None) -> BufferedResponse:
+        key = self.cassette.key_for(method, url, body)
+        with self.lock:
+            if key not in self.exchanges:
+                self.counters['missing'] += 1
+                raise URLError('No exchange recorded for {0}'.format(key))
+            n_replayed = self.replayed.get(key, 0)
+            self.replayed[key] = n_replayed + 1
+            self.counters['replayed'] += 1
+        (status, reason, response_headers, content) = self.exchanges[key][min(n_replayed, len(self.exchanges[key]) - 1)]
+        return buffered_response_for(url, status, reason, response_headers, content)
+
+    def statistics(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counters)
+
+    def clear(self) -> None:
+        pass
+
+class ConditionalCache(object):
+    '''Size-bounded on-disk store of GET responses with ETag or Last-Modified validators, for ConditionalTransport.'''
+    MAXIMUM_BYTES = 4 * 1024 ** 3
+
+    def __init__(self, directory: str, maximum_bytes: int = MAXIMUM_BYTES) -> None:
+        self.directory = directory
+        self.maximum_bytes = maximum_bytes
+        self.lock = Lock()
+        makedirs(directory, exist_ok=True)
+        # In-memory index of the stored bodies' sizes, least recently used first, read from disk once so that commit() does not list the store
+        self.sizes = OrderedDict()
+        for (_, key, size) in sorted(self.stored_bodies()):
+            self.sizes[key] = size
+        self.total_bytes = sum(self.sizes.values())
+        self.counters = dict(conditional_requests=0, not_modified=0, modified=0, bytes_avoided=0, stored=0, bytes_stored=0, evictions=0)
+
+    def key_for(self, url: str) -> str:
+        return sha256(url.encode()).hexdigest()
+
+    def count(self, counter: str, value: int = 1) -> None:
+        with self.lock:
+            self.counters[counter] += value
+
+    def stored_bodies(self) -> List[Tuple[float, str, int]]:
+        '''(last used, key, size) of every body on disk.'''
+        stored_bodies = []
+        for fnme in listdir(self.directory):
+            if not fnme.endswith('.body'):
+                continue
+            try:
+                body_stat = stat(join(self.directory, fnme))
+            except (IOError, OSError):
+                continue
+            stored_bodies.append((body_stat.st_mtime, fnme[:-len('.body')], body_stat.st_size))
+        return stored_bodies
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        '''Validators and size of the stored response, or None.'''
+        try:
+            with open(join(self.directory, key + '.json')) as fh:
+                entry = json.load(fh)
+            utime(join(self.directory, key + '.body'))
+        except (IOError, OSError, ValueError):
+            return None
+        with self.lock:
+            if key in self.sizes:
+                self.sizes.move_to_end(key)
+            else:
+                # Stored by another process sharing the directory
+                self.sizes[key] = entry['size']
+                self.total_bytes += entry['size']
+        return entry
+
+    def conditional_headers(self, entry: Dict[str, Any]) -> Dict[str, str]:
+        return add_dicts(
+            {'If-None-Match': entry['etag']} if entry.get('etag') is not None else {},
+            {'If-Modified-Since': entry['last_modified']} if entry.get('last_modified') is not None else {},
+        )
+
+    def open(self, key: str) -> Any:
+        return open(join(self.directory, key + '.body'), 'rb')
+
+    def temporary_fnme(self, key: str) -> str:
+        return temporary_fnme_for(join(self.directory, key + '.body'))
+
+    def commit(self, key: str, temporary_fnme: str, headers: Any) -> None:
+        '''Store the body written to temporary_fnme (see temporary_fnme()) with the validators of headers.'''
+        size = getsize(temporary_fnme)
+        with self.lock:
+            replace(temporary_fnme, join(self.directory, key + '.body'))
+            self.total_bytes += size - self.sizes.pop(key, 0)
+            self.sizes[key] = size
+            self.counters['stored'] += 1
+            self.counters['bytes_stored'] += size
+        write_atomically(
+            join(self.directory, key + '.json'),
+            json.dumps(dict(etag=headers.get('ETag'), last_modified=headers.get('Last-Modified'), content_type=headers.get('Content-Type'), size=size)).encode(),
+        )
+        if self.total_bytes > self.maximum_bytes:
+            self.evict()
+
+    def evict(self) -> None:
+        '''Drop least recently used responses until the store fits in maximum_bytes.'''
+        with self.lock:
+            while self.sizes and self.total_bytes > self.maximum_bytes:
+                (key, size) = self.sizes.popitem(last=False)
+                self.total_bytes -= size
+                self.counters['evictions'] += 1
+                for extension in ('.json', '.body'):
+                    try:
+                        remove(join(self.directory, key + extension))
+                    except (IOError, OSError):
+                        # Already evicted by another process sharing the directory
+                        pass
+
+    def statistics(self) -> Dict[str, int]:
+        with self.lock:
+            return add_dicts(self.counters, dict(total_bytes=self.total_bytes, entries=len(self.sizes)))
+
+class StoredResponse(object):
+    '''HTTP response served from a file (a ConditionalCache body, on 304 Not Modified).'''
+
+    def __init__(self, url: str, fh: Any, content_type: Optional[str]) -> None:
+        self.url = url
+        self.fh = fh
+        self.status = 200
+        self.reason = 'OK (not modified)'
+        self.headers = message_for([('Content-Type', content_type)] if content_type is not None else [])
+
+    def getcode(self) -> int:
+        return self.status
+
+    def info(self) -> HTTPMessage:
+        return self.headers
+
+    def geturl(self) -> str:
+        return self.url
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        content = self.fh.read() if amt is None else self.fh.read(amt)
+        if amt is None or not content:
+            self.fh.close()
+        return content
+
+    def close(self) -> None:
+        self.fh.close()
+
+class StoringResponse(object):
+    '''HTTP response copying its body to a ConditionalCache while it is read, and stored once read to the end.'''
+
+    def __init__(self, response: Any, cache: ConditionalCache, key: str) -> None:
+        self.response = response
+        self.cache = cache
+        self.key = key
+        self.temporary_fnme = cache.temporary_fnme(key)
+        self.fh = open(self.temporary_fnme, 'xb')
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.connect_time = getattr(response, 'connect_time', 0.)
+
+    def getcode(self) -> int:
+        return self.status
+
+    def info(self) -> Any:
+        return self.headers
+
+    def geturl(self) -> str:
+        return self.response.geturl()
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        try:
+            content = self.response.read() if amt is None else self.response.read(amt)
+            if self.fh is not None:
+                self.fh.write(content)
+                if amt is None or not content:
+                    self.fh.close()
+                    self.fh = None
+                    self.cache.commit(self.key, self.temporary_fnme, self.headers)
+        except:
+            self.discard()
+            raise
+        return content
+
+    def discard(self) -> None:
+        '''Drop the partial copy; a no-op once the response has been stored.'''
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+        if exists(self.temporary_fnme):
+            remove(self.temporary_fnme)
+
+    def close(self) -> None:
+        self.discard()
+        self.response.close()
+
+    def __del__(self) -> None:
+        # Responses dropped before being read to the end leave no temporary file behind
+        if getattr(self, 'fh', None) is not None:
+            self.discard()
+
+class ConditionalTransport(object):
+    '''Transport wrapper revalidating stored GET responses with If-None-Match / If-Modified-Since.'''
+
+    def __init__(self, transport: Any, cache: ConditionalCache) -> None:
+        self.transport = transport
+        self.cache = cache
+
+    def urlopen(self, method: str, url: str, body: Any = None, headers: Dict[str, str] = {}, timeout: Optional[float] = None) -> Any:
+        if method != 'GET':
+            return self.transport.urlopen(method, url, body=body, headers=headers, timeout=timeout)
+        key = self.cache.key_for(url)
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.cache.count('conditional_requests')
+            headers = add_dicts(headers, self.cache.conditional_headers(entry))
+        try:
+            response = self.transport.urlopen(method, url, body=body, headers=headers, timeout=timeout)
+            status = response.status
+        except HTTPError as e:
+            if e.code != 304 or entry is None:
+                raise
+            (response, status) = (e, e.code)
+        if status == 304 and entry is not None:
+            # Read the (empty) body, so that pooled connections can be reused
+            response.read()
+            response.close()
+            try:
+                fh = self.cache.open(key)
+            except (IOError, OSError):
+                # Evicted in the meantime: request it again, unconditionally
+                unconditional_headers = {header: value for (header, value) in headers.items() if not header.startswith('If-')}
+                return self.transport.urlopen(method, url, body=body, headers=unconditional_headers, timeout=timeout)
+            self.cache.count('not_modified')
+            self.cache.count('bytes_avoided', entry['size'])
+            return StoredResponse(url, fh, entry.get('content_type'))
+        if entry is not None:
+            self.cache.count('modified')
+        if response.headers.get('ETag') is None and response.headers.get('Last-Modified') is None:
+            return response
+        return StoringResponse(response, self.cache, key)
+
+    def statistics(self) -> Dict[str, Any]:
+        return add_dicts(self.transport.statistics(), dict(conditional_cache=self.cache.statistics()))
+
+    def clear(self) -> None:
+        self.transport.clear()
+
+def temporary_fnme_for(fnme: str) -> str:
+    return join(dirname(fnme), '.{0}.{1}.tmp'.format(basename(fnme), urandom(16).hex()))
+
+def write_atomically(fnme: str, content: bytes) -> None:
+    '''Write to a temporary file next to fnme, then rename it, so that readers never see a partial file.'''
+    temporary_fnme = temporary_fnme_for(fnme)
+    with open(temporary_fnme, 'xb') as fh:
+        fh.write(content)
+    replace(temporary_fnme, fnme)
+
+def checksum_digest(checksum: str) -> Any:
+    '''Empty hash object for checksum='<algorithm>:<hexdigest>' (e.g. 'sha256:9f86...').'''
+    return new_hash(checksum.split(':', 1)[0])
+
+def verify_digest(digest: Any, checksum: str, name: str) -> None:
+    if digest.hexdigest() != checksum.split(':', 1)[1].lower():
+        raise Exception('Checksum mismatch for {0}: expected {1}, got {2}'.format(name, checksum, digest.hexdigest()))
+
+def verify_checksum(content: Union[str, bytes], checksum: str, name: str) -> None:
+    digest = checksum_digest(checksum)
+    digest.update(content if isinstance(content, bytes) else content.encode())
+    verify_digest(digest, checksum, name)
+
+class TopologyCache(object):
+    '''Persistent, content-addressed and size-bounded on-disk cache of downloaded files.'''
+    MAXIMUM_BYTES = 1024 ** 3
+
+    def __init__(self, directory: str, maximum_bytes: int = MAXIMUM_BYTES) -> None:
+        self.directory = directory
+        self.maximum_bytes = maximum_bytes
+        self.lock = Lock()
+        for sub_directory in ('objects', 'keys'):
+            makedirs(join(directory, sub_directory), exist_ok=True)
+        self.total_bytes = sum(stat(join(directory, 'objects', object_id)).st_size for object_id in listdir(join(directory, 'objects')))
+        # In-memory index of the keys, least recently used first, and of the number of keys referring to each object,
+        # read from disk once, so that put() and evict() do not list the cache
+        self.entries = OrderedDict()
+        self.references = {}
+        for (_, key, entry) in sorted(self.stored_entries()):
+            self.add_entry(key, entry)
+        self.counters = dict(hits=0, misses=0, stale=0, bytes_saved=0, bytes_stored=0, evictions=0)
+
+    def key_for(self, host: str, molid: ATB_MOLID, atb_format: str, parameters: Dict[str, Any]) -> str:
+        return sha256(
+            json.dumps([host, str(molid), atb_format, sorted((str(key), str(value)) for (key, value) in parameters.items())]).encode(),
+        ).hexdigest()
+
+    def count(self, counter: str, value: int = 1) -> None:
+        with self.lock:
+            self.counters[counter] += value
+
+    def stored_entries(self) -> List[Tuple[float, str, Dict[str, Any]]]:
+        '''(last used, key, entry) of every key on disk (temporary files excluded).'''
+        stored_entries = []
+        for key in listdir(join(self.directory, 'keys')):
+            if key.startswith('.'):
+                continue
+            try:
+                stored_entries.append((stat(join(self.directory, 'keys', key)).st_mtime, key, self.entry_for(key)))
+            except (IOError, OSError, ValueError):
+                continue
+        return stored_entries
+
+    def entry_for(self, key: str) -> Dict[str, Any]:
+        with open(join(self.directory, 'keys', key)) as fh:
+            return json.load(fh)
+
+    def add_entry(self, key: str, entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        '''Index entry as the most recently used, and return the entry it replaced (if any); call with the lock held.'''
+        replaced_entry = self.entries.pop(key, None)
+        self.entries[key] = entry
+        self.references[entry['object']] = self.references.get(entry['object'], 0) + 1
+        if replaced_entry is not None:
+            self.references[replaced_entry['object']] -= 1
+        return replaced_entry
+
+    def drop_entry(self, key: str) -> None:
+        '''Remove key from the index, and its object once no key refers to it; call with the lock held.'''
+        entry = self.entries.pop(key)
+        self.references[entry['object']] -= 1
+        self.remove_unreferenced_object(entry)
+
+    def remove_unreferenced_object(self, entry: Dict[str, Any]) -> None:
+        if self.references.get(entry['object'], 0) > 0:
+            return
+        self.references.pop(entry['object'], None)
+        try:
+            remove(join(self.directory, 'objects', entry['object']))
+            self.total_bytes -= entry['size']
+        except (IOError, OSError):
+            # Already removed by another process sharing the cache
+            pass
+
+    def get(self, key: str, topology_hash: str) -> Optional[bytes]:
+        try:
+            entry = self.entry_for(key)
+            if entry['topology_hash'] != topology_hash:
+                self.count('stale')
+                return None
+            with open(join(self.directory, 'objects', entry['object']), 'rb') as fh:
+                content = fh.read()
+            utime(join(self.directory, 'keys', key))
+        except (IOError, OSError, ValueError):
+            self.count('misses')
+            return None
+        with self.lock:
+            if self.entries.get(key) == entry:
+                self.entries.move_to_end(key)
+            else:
+                # Stored by another process sharing the cache
+                self.add_entry(key, entry)
+            self.counters['hits'] += 1
+            self.counters['bytes_saved'] += len(content)
+        return content
+
+    def put(self, key: str, content: bytes, topology_hash: str) -> None:
+        object_id = sha256(content).hexdigest()
+        if not exists(join(self.directory, 'objects', object_id)):
+            write_atomically(join(self.directory, 'objects', object_id), content)
+            with self.lock:
+                self.total_bytes += len(content)
+            self.count('bytes_stored', len(content))
+        entry = dict(object=object_id, topology_hash=topology_hash, size=len(content))
+        write_atomically(join(self.directory, 'keys', key), json.dumps(entry).encode())
+        with self.lock:
+            replaced_entry = self.add_entry(key, entry)
+            if replaced_entry is not None:
+                self.remove_unreferenced_object(replaced_entry)
+            if self.total_bytes > self.maximum_bytes:
+                self.evict()
+
+    def evict(self) -> None:
+        '''Drop least recently used entries until the cache fits in maximum_bytes; call with the lock held.'''
+        while self.entries and self.total_bytes > self.maximum_bytes:
+            key = next(iter(self.entries))
+            try:
+                remove(join(self.directory, 'keys', key))
+            except (IOError, OSError):
+                # Already evicted by another process sharing the cache
+                pass
+            self.drop_entry(key)
+            self.counters['evictions'] += 1
+
+    def statistics(self) -> Dict[str, int]:
+        with self.lock:
+            return add_dicts(self.counters, dict(total_bytes=self.total_bytes, entries=len(self.entries)))
+
+class RMSDPairCache(object):
+    '''Persistent (SQLite) store of the pairwise RMSDs computed by RMSD.tiled_matrix().'''
+    SQL_VARIABLES = 500
+
+    def __init__(self, fnme: str) -> None:
+        self.fnme = fnme
+        self.lock = Lock()
+        import sqlite3
+        self.connection = sqlite3.connect(fnme, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS pairs (parameters TEXT, molid_a TEXT, molid_b TEXT, rmsd REAL, PRIMARY KEY (parameters, molid_a, molid_b))',
+            )
+        self.counters = dict(hits=0, stored=0)
+
+    @staticmethod
+    def pair_for(molid_a: str, molid_b: str) -> Tuple[str, str]:
+        return (molid_a, molid_b) if molid_a <= molid_b else (molid_b, molid_a)
+
+    def get_many(self, parameters: str, molids: List[str]) -> Dict[Tuple[str, str], float]:
+        '''Cached RMSDs of all pairs of molids.'''
+        (molid_set, pairs) = (set(molids), {})
+        with self.lock:
+            for i in range(0, len(molids), self.SQL_VARIABLES):
+                chunk = molids[i:i + self.SQL_VARIABLES]
+                for (molid_a, molid_b, rmsd) in self.connection.execute(
+                    'SELECT molid_a, molid_b, rmsd FROM pairs WHERE parameters = ? AND molid_a IN ({0})'.format(','.join(['?'] * len(chunk))),
+                    [parameters] + chunk,
+                ):
+                    if molid_b in molid_set:
+                        pairs[(molid_a, molid_b)] = rmsd
+            self.counters['hits'] += len(pairs)
+        return pairs
+
+    def put_many(self, parameters: str, pairs: Dict[Tuple[str, str], float]) -> None:
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO pairs VALUES (?, ?, ?, ?)',
+                [(parameters, molid_a, molid_b, rmsd) for ((molid_a, molid_b), rmsd) in pairs.items()],
+            )
+            self.counters['stored'] += len(pairs)
+
+    def statistics(self) -> Dict[str, int]:
+        with self.lock:
+            return add_dicts(self.counters, dict(pairs=self.connection.execute('SELECT COUNT(*) FROM pairs').fetchone()[0]))
+
+class ResponseCache(object):
+    '''In-memory LRU cache of deserialized API responses, with a time-to-live per endpoint (in seconds); stores and returns deep copies.'''
+    TTLS = {
+        'molid': 3600.,
+        'search': 300.,
+        'molids_with_chembl_ids': 3600.,
+        'duplicated_inchis': 3600.,
+        'charge_distribution': 3600.,
+    }
+    MAXIMUM_ENTRIES = 4096
+    MAXIMUM_BYTES = 64 * 1024 ** 2
+
+    def __init__(self, ttls: Dict[str, float] = TTLS, maximum_entries: int = MAXIMUM_ENTRIES, maximum_bytes: int = MAXIMUM_BYTES) -> None:
+        self.ttls = dict(ttls)
+        self.maximum_entries = maximum_entries
+        self.maximum_bytes = maximum_bytes
+        self.lock = Lock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.counters = dict(hits=0, misses=0, expired=0, evictions=0, invalidations=0)
+
+    def endpoint_for(self, url: str) -> str:
+        return url.rsplit('/', 1)[-1][:-len('.py')]
+
+    def caches(self, url: str) -> bool:
+        return self.endpoint_for(url) in self.ttls
+
+    def key_for(self, url: str, method: str, data_items: List[Tuple[str, Any]]) -> Tuple[str, str, Tuple[Tuple[str, str], ...]]:
+        return (url, method, normalized_items(data_items))
+
+    def get(self, key: Tuple[Any, ...]) -> Tuple[bool, Any]:
+        with self.lock:
+            if key not in self.entries:
+                self.counters['misses'] += 1
+                return (False, None)
+            (value, size, expires_at) = self.entries[key]
+            if monotonic() > expires_at:
+                del self.entries[key]
+                self.total_bytes -= size
+                self.counters['expired'] += 1
+                return (False, None)
+            self.entries.move_to_end(key)
+            self.counters['hits'] += 1
+        # Copied, so that callers modifying their response do not modify the cached one
+        return (True, deepcopy(value))
+
+    def put(self, key: Tuple[Any, ...], value: Any, size: int) -> None:
+        value = deepcopy(value)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size, monotonic() + self.ttls[self.endpoint_for(key[0])])
+            self.total_bytes += size
+            while self.entries and (len(self.entries) > self.maximum_entries or self.total_bytes > self.maximum_bytes):
+                (_, (_, evicted_size, _)) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.counters['evictions'] += 1
+
+    def invalidate(self, endpoint: Optional[str] = None) -> None:
+        '''Drop every cached response, or only those of the given endpoint (e.g. 'molid').'''
+        with self.lock:
+            for key in [key for key in self.entries if endpoint is None or self.endpoint_for(key[0]) == endpoint]:
+                self.total_bytes -= self.entries.pop(key)[1]
+                self.counters['invalidations'] += 1
+
+    def statistics(self) -> Dict[str, int]:
+        with self.lock:
+            return add_dicts(self.counters, dict(entries=len(self.entries), total_bytes=self.total_bytes))
+
+class RetryPolicy(object):
+    '''Decides whether, and after how long, a failed request is tried again.'''
+    MAXIMUM_ATTEMPTS = 3
+    BACKOFF_FACTOR = 0.5
+    MAXIMUM_BACKOFF = 30.
+    MAXIMUM_RETRY_AFTER = 120.
+    RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+    RETRYABLE_EXCEPTIONS = (API_Timeout, URLError, ConnectionError, HTTPException)
+    RETRY_BUDGET = 0.2
+    MINIMUM_RETRIES = 10
+
+    def __init__(self, maximum_attempts: int = MAXIMUM_ATTEMPTS, backoff_factor: float = BACKOFF_FACTOR, maximum_backoff: float = MAXIMUM_BACKOFF, maximum_retry_after: float = MAXIMUM_RETRY_AFTER, statuses: Tuple[int, ...] = RETRYABLE_STATUSES, exceptions: Tuple[type, ...] = RETRYABLE_EXCEPTIONS, retry_budget: float = RETRY_BUDGET, minimum_retries: int = MINIMUM_RETRIES, methods: Optional[Tuple[str, ...]] = None, non_idempotent_endpoints: Tuple[str, ...] = NON_IDEMPOTENT_ENDPOINTS) -> None:
+        self.maximum_attempts = maximum_attempts
+        self.backoff_factor = backoff_factor
+        self.maximum_backoff = maximum_backoff
+        self.maximum_retry_after = maximum_retry_after
+        self.statuses = tuple(statuses)
+        self.exceptions = tuple(exceptions)
+        self.retry_budget = retry_budget
+        self.minimum_retries = minimum_retries
+        # None retries every method
+        self.methods = methods
+        self.non_idempotent_endpoints = set(non_idempotent_endpoints)
+        self.lock = Lock()
+        self.retry_tokens = float(minimum_retries)
+        self.counters = dict(requests=0, retries=0, retries_exhausted=0, retries_over_budget=0)
+        self.retries_by_reason = {}
+
+    def reason_for(self, error: Exception) -> str:
+        return str(error.code) if isinstance(error, HTTPError) else type(error).__name__
+
+    def is_retryable(self, error: Exception, method: str, url: Optional[str] = None) -> bool:
+        if self.methods is not None and method not in self.methods:
+            return False
+        elif url is not None and endpoint_for(urlsplit(url).path) in self.non_idempotent_endpoints:
+            return False
+        elif isinstance(error, HTTPError):
+            return error.code in self.statuses
+        else:
+            return isinstance(error, self.exceptions)
+
+    def record_request(self) -> None:
+        with self.lock:
+            self.counters['requests'] += 1
+            self.retry_tokens = min(float(self.minimum_retries), self.retry_tokens + self.retry_budget)
+
+    def should_retry(self, error: Exception, retry_number: int, method: str, url: Optional[str] = None) -> bool:
+        '''Whether the request to url that failed with error on attempt retry_number gets another attempt; granted retries are counted.'''
+        if not self.is_retryable(error, method, url=url):
+            return False
+        with self.lock:
+            if retry_number >= self.maximum_attempts:
+                self.counters['retries_exhausted'] += 1
+                return False
+            elif self.retry_tokens < 1.:
+                self.counters['retries_over_budget'] += 1
+                return False
+            self.retry_tokens -= 1.
+            self.counters['retries'] += 1
+            reason = self.reason_for(error)
+            self.retries_by_reason[reason] = self.retries_by_reason.get(reason, 0) + 1
+            return True
+
+    @staticmethod
+    def retry_after_for(error: Exception) -> Optional[float]:
+        '''Seconds to wait according to the Retry-After header (delay in seconds or HTTP date), if any.'''
+        headers = getattr(error, 'headers', None)
+        value = headers.get('Retry-After') if headers is not None else None
+        if value is None:
+            return None
+        try:
+            return max(0., float(value))
+        except ValueError:
+            try:
+                from email.utils import parsedate_to_datetime
+                return max(0., parsedate_to_datetime(value).timestamp() - time())
+            except (TypeError, ValueError):
+                return None
+
+    def delay_for(self, error: Exception, retry_number: int) -> float:
+        retry_after = self.retry_after_for(error)
+        if retry_after is not None:
+            return min(retry_after, self.maximum_retry_after)
+        return uniform(0., min(self.maximum_backoff, self.backoff_factor * 2 ** (retry_number - 1)))
+
+    def statistics(self) -> Dict[str, Any]:
+        with self.lock:
+            return add_dicts(self.counters, dict(retries_by_reason=dict(self.retries_by_reason)))
+
+class RateLimiter(object):
+    '''Thread-safe token bucket allowing rate requests per second, in bursts of up to burst requests.'''
+    BURST = 10
+
+    def __init__(self, rate: float, burst: int = BURST) -> None:
+        assert rate > 0, rate
+        self.rate = rate
+        self.burst = burst
+        self.lock = Lock()
+        self.tokens = float(burst)
+        self.updated_at = monotonic()
+        self.counters = dict(requests=0, delayed=0, delay_seconds=0.)
+
+    def reserve(self) -> float:
+        '''Take a token, and return how long to wait (in seconds) before using it; tokens go negative so that waiters are served in order.'''
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate) - 1
+            self.updated_at = now
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.
+            self.counters['requests'] += 1
+            if delay > 0:
+                self.counters['delayed'] += 1
+                self.counters['delay_seconds'] += delay
+            return delay
+
+    def acquire(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            sleep(delay)
+
+    def statistics(self) -> Dict[str, Any]:
+        with self.lock:
+            return add_dicts(self.counters, dict(rate=self.rate, burst=self.burst))
+
+class AdaptiveConcurrencyLimit(object):
+    '''Thread-safe AIMD limit on the number of requests in flight.'''
+    INITIAL_LIMIT = 4
+    MINIMUM_LIMIT = 1
+    MAXIMUM_LIMIT = 64
+    DECREASE_FACTOR = 0.5
+    LATENCY_TOLERANCE = 2.
+
+    def __init__(self, initial_limit: int = INITIAL_LIMIT, minimum_limit: int = MINIMUM_LIMIT, maximum_limit: int = MAXIMUM_LIMIT, decrease_factor: float = DECREASE_FACTOR, latency_tolerance: float = LATENCY_TOLERANCE) -> None:
+        assert minimum_limit <= initial_limit <= maximum_limit, (minimum_limit, initial_limit, maximum_limit)
+        self.limit = float(initial_limit)
+        self.minimum_limit = minimum_limit
+        self.maximum_limit = maximum_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.condition = Condition()
+        self.in_flight = 0
+        self.minimum_latency = None
+        self.decreased_at = monotonic()
+        self.counters = dict(requests=0, waits=0, congestion_signals=0, decreases=0)
+
+    @staticmethod
+    def is_congestion(error: Exception) -> bool:
+        if isinstance(error, HTTPError):
+            return error.code == 429 or error.code >= 500
+        else:
+            return isinstance(error, (API_Timeout, URLError, ConnectionError))
+
+    def acquire(self) -> float:
+        '''Block until a request can be sent, and return its start time (to be passed to release()).'''
+        with self.condition:
+            if self.in_flight >= int(self.limit):
+                self.counters['waits'] += 1
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+            self.counters['requests'] += 1
+            return monotonic()
+
+    def release(self, started_at: float, congested: bool) -> None:
+        now = monotonic()
+        latency = now - started_at
+        with self.condition:
+            self.in_flight -= 1
+            if congested:
+                self.counters['congestion_signals'] += 1
+                # Requests sent before the last decrease reflect the previous limit, and do not decrease it again
+                if started_at >= self.decreased_at:
+                    self.limit = max(self.minimum_limit, self.limit * self.decrease_factor)
+                    self.decreased_at = now
+                    self.counters['decreases'] += 1
+            else:
+                self.minimum_latency = latency if self.minimum_latency is None else min(self.minimum_latency, latency)
+                if latency <= self.latency_tolerance * self.minimum_latency:
+                    self.limit = min(self.maximum_limit, self.limit + 1. / self.limit)
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        started_at = self.acquire()
+        try:
+            yield
+        except Exception as e:
+            self.release(started_at, congested=self.is_congestion(e))
+            raise
+        else:
+            self.release(started_at, congested=False)
+
+    def statistics(self) -> Dict[str, Any]:
+        with self.condition:
+            return add_dicts(self.counters, dict(limit=int(self.limit), in_flight=self.in_flight, minimum_latency=self.minimum_latency))
+
+class SingleFlight(object):
+    '''Lets concurrent identical requests to idempotent endpoints share a single network request.'''
+    NON_IDEMPOTENT_ENDPOINTS = NON_IDEMPOTENT_ENDPOINTS
+
+    def __init__(self, non_idempotent_endpoints: Tuple[str, ...] = NON_IDEMPOTENT_ENDPOINTS) -> None:
+        self.non_idempotent_endpoints = set(non_idempotent_endpoints)
+        self.lock = Lock()
+        self.in_flight = {}
+        self.counters = dict(requests=0, shared=0)
+
+    def shares(self, url: str, data_items: List[Tuple[str, Any]]) -> bool:
+        return endpoint_for(url) not in self.non_idempotent_endpoints and not any(
+            isinstance(value, bytes) or hasattr(value, 'read')
+            for (_, value) in data_items
+        )
+
+    def key_for(self, *args: Any) -> Tuple[Any, ...]:
+        return tuple(normalized_items(arg) if isinstance(arg, list) else arg for arg in args)
+
+    def run(self, key: Tuple[Any, ...], function: Callable[[], Any]) -> Any:
+        with self.lock:
+            self.counters['requests'] += 1
+            future = self.in_flight.get(key)
+            if future is None:
+                future = self.in_flight[key] = Future()
+                is_leader = True
+            else:
+                self.counters['shared'] += 1
+                is_leader = False
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = function()
+        except BaseException as e:
+            with self.lock:
+                del self.in_flight[key]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            del self.in_flight[key]
+        future.set_result(result)
+        return result
+
+    def statistics(self) -> Dict[str, int]:
+        with self.lock:
+            return add_dicts(self.counters, dict(in_flight=len(self.in_flight)))
+
+class RequestTimer(object):
+    '''Durations of the successive phases of one request attempt, recorded into an Instrumentation.'''
+
+    def __init__(self, instrumentation: 'Instrumentation', endpoint: str) -> None:
+        self.instrumentation = instrumentation
+        self.endpoint = endpoint
+        self.started_at = self.marked_at = monotonic()
+
+    def mark(self, phase: str) -> None:
+        '''Record the time elapsed since the previous mark as phase.'''
+        now = monotonic()
+        self.instrumentation.observe(self.endpoint, phase, now - self.marked_at)
+        self.marked_at = now
+
+    def finish(self, request_bytes: int, response_bytes: int) -> None:
+        self.instrumentation.observe(self.endpoint, 'total', monotonic() - self.started_at)
+        self.instrumentation.count(self.endpoint, requests=1, request_bytes=request_bytes, response_bytes=response_bytes)
+        self.instrumentation.maybe_export()
+
+    def fail(self, is_retried: bool) -> None:
+        self.instrumentation.count(self.endpoint, errors=1, retries=int(is_retried))
+
+class Instrumentation(object):
+    '''Per-endpoint latency histograms, byte counts, errors and retries of the API clients attached to it.'''
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60.)
+    COUNTERS = ('requests', 'errors', 'retries', 'request_bytes', 'response_bytes')
+
+    def __init__(self, exporters: List[Any] = [], export_interval: Optional[float] = None, buckets: Tuple[float, ...] = BUCKETS) -> None:
+        self.exporters = list(exporters)
+        self.export_interval = export_interval
+        self.buckets = tuple(buckets)
+        self.lock = Lock()
+        # endpoint -> counters, and (endpoint, phase) -> [count per bucket (the last one for +Inf), sum of durations]
+        self.counters = {}
+        self.histograms = {}
+        self.clients = WeakSet()
+        self.exported_at = monotonic()
+
+    def attach(self, api: 'API') -> None:
+        self.clients.add(api)
+
+    def timer(self, url: str) -> RequestTimer:
+        return RequestTimer(self, endpoint_for(url))
+
+    def observe(self, endpoint: str, phase: str, seconds: float) -> None:
+        with self.lock:
+            if (endpoint, phase) not in self.histograms:
+                self.histograms[(endpoint, phase)] = [[0] * (len(self.buckets) + 1), 0.]
+            histogram = self.histograms[(endpoint, phase)]
+            histogram[0][bisect_left(self.buckets, seconds)] += 1
+            histogram[1] += seconds
+
+    def count(self, endpoint: str, **values: int) -> None:
+        with self.lock:
+            if endpoint not in self.counters:
+                self.counters[endpoint] = {counter: 0 for counter in self.COUNTERS}
+            for (counter, value) in values.items():
+                self.counters[endpoint][counter] += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            endpoints = {endpoint: dict(counters, latency={}) for (endpoint, counters) in self.counters.items()}
+            for ((endpoint, phase), (bucket_counts, total)) in self.histograms.items():
+                cumulative_counts = [sum(bucket_counts[:i + 1]) for i in range(len(bucket_counts))]
+                endpoints.setdefault(endpoint, dict({counter: 0 for counter in self.COUNTERS}, latency={}))['latency'][phase] = dict(
+                    buckets=list(zip(list(self.buckets) + ['+Inf'], cumulative_counts)),
+                    sum=total,
+                    count=cumulative_counts[-1],
+                )
+        return dict(endpoints=endpoints, clients=[api.client_statistics() for api in list(self.clients)])
+
+    def export(self) -> None:
+        snapshot = self.snapshot()
+        for exporter in self.exporters:
+            exporter.export(snapshot)
+
+    def maybe_export(self) -> None:
+        if self.export_interval is not None and self.exporters and monotonic() - self.exported_at >= self.export_interval:
+            self.exported_at = monotonic()
+            self.export()
+
+class CallbackExporter(object):
+    def __init__(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        self.callback = callback
+
+    def export(self, snapshot: Dict[str, Any]) -> None:
+        self.callback(snapshot)
+
+class JSONExporter(object):
+    '''Writes snapshots to fnme as JSON (atomically, so that readers never see a partial file).'''
+
+    def __init__(self, fnme: str) -> None:
+        self.fnme = fnme
+
+    def export(self, snapshot: Dict[str, Any]) -> None:
+        write_atomically(self.fnme, json.dumps(snapshot, indent=2, sort_keys=True, default=str).encode())
+
+class PrometheusExporter(object):
+    '''Renders snapshots in the Prometheus text exposition format, written to fnme (e.g. for the node exporter textfile collector) if given.'''
+    PREFIX = 'atb_api'
+
+    def __init__(self, fnme: Optional[str] = None) -> None:
+        self.fnme = fnme
+
+    @staticmethod
+    def flattened(statistics: Dict[str, Any], prefix: str = '') -> Iterator[Tuple[str, float]]:
+        for (key, value) in sorted(statistics.items()):
+            name = '{0}_{1}'.format(prefix, key) if prefix else str(key)
+            if isinstance(value, dict):
+                yield from PrometheusExporter.flattened(value, name)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield (search('[a-zA-Z0-9_]*', name.replace('.', '_')).group(0), value)
+
+    def render(self, snapshot: Dict[str, Any]) -> str:
+        lines = []
+        histogram_name = '{0}_request_duration_seconds'.format(self.PREFIX)
+        lines.append('# TYPE {0} histogram'.format(histogram_name))
+        for (endpoint, metrics) in sorted(snapshot['endpoints'].items()):
+            for (phase, histogram) in sorted(metrics['latency'].items()):
+                labels = 'endpoint="{0}",phase="{1}"'.format(endpoint, phase)
+                for (upper_bound, count) in histogram['buckets']:
+                    lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(histogram_name, labels, upper_bound, count))
+                lines.append('{0}_sum{{{1}}} {2}'.format(histogram_name, labels, histogram['sum']))
+                lines.append('{0}_count{{{1}}} {2}'.format(histogram_name, labels, histogram['count']))
+        for counter in Instrumentation.COUNTERS:
+            counter_name = '{0}_{1}_total'.format(self.PREFIX, counter)
+            lines.append('# TYPE {0} counter'.format(counter_name))
+            for (endpoint, metrics) in sorted(snapshot['endpoints'].items()):
+                lines.append('{0}{{endpoint="{1}"}} {2}'.format(counter_name, endpoint, metrics[counter]))
+        for (i, client_statistics) in enumerate(snapshot['clients']):
+            for (name, value) in self.flattened(client_statistics):
+                lines.append('{0}_client_{1}{{client="{2}"}} {3}'.format(self.PREFIX, name, i, value))
+        return '\n'.join(lines) + '\n'
+
+    def export(self, snapshot: Dict[str, Any]) -> None:
+        if self.fnme is not None:
+            write_atomically(self.fnme, self.render(snapshot).encode())
+
 class API(object):
     HOST = 'https://atb.uq.edu.au'
     TIMEOUT = 45
     API_FORMAT = 'yaml'
     ENCODING = 'utf-8'
+    CHUNK_SIZE = 64 * 1024
+    API_FORMAT_PROBE = ('molecules', 'molid', dict(molid=21))
+    MOLIDS_CHUNK_SIZE = 500
+    CHUNK_WORKERS = 4
 
     def decode_if_necessary(self, x: Union[bytes, str], encoding: str = 'utf8') -> Union[str, bytes]:
         if isinstance(x, str):
@@ -119,7 +1773,30 @@ class API(object):
                 )
             )
 
-    def safe_urlopen(self, base_url: str, data: Union[Dict[str, Any], List[Tuple[str, Any]]] = {}, method: str = 'GET', retry_number: int = 1) -> str:
+    def read_response(self, response: Any, api_format: Optional[str] = None) -> Union[str, bytes]:
+        if (api_format or self.api_format) in BINARY_API_FORMATS:
+            return response.read()
+        else:
+            return response.read().decode()
+
+    def negotiate_api_format(self) -> str:
+        '''Settle api_format='auto' on the fastest format (see available_api_formats()) that the server answers a probe request in.'''
+        with self.negotiation_lock:
+            if self.api_format == 'auto':
+                (api_namespace, api_endpoint, probe_data) = self.API_FORMAT_PROBE
+                for api_format in available_api_formats() + [API.API_FORMAT]:
+                    try:
+                        deserializer_fct_for(api_format)(
+                            self.safe_urlopen(self.url(api_namespace, api_endpoint), data=probe_data, api_format=api_format),
+                        )
+                        break
+                    except Exception as e:
+                        if self.debug:
+                            self.log.warning('Server did not answer in api_format={0}: {1}'.format(api_format, e))
+                (self.deserializer_fct, self.api_format) = (deserializer_fct_for(api_format), api_format)
+            return self.api_format
+
+    def request_items(self, data: Union[Dict[str, Any], List[Tuple[str, Any]]], api_format: Optional[str] = None) -> List[Tuple[str, Any]]:
         if isinstance(data, dict):
             data_items = list(data.items())
         elif type(data) in (tuple, list):
@@ -127,99 +1804,353 @@ class API(object):
         else:
             raise Exception('Unexpected type: {0}'.format(type(data)))
 
-        data_items += [('api_token', self.api_token), ('api_format', self.api_format)]
+        if api_format is None:
+            api_format = self.api_format if self.api_format != 'auto' else self.negotiate_api_format()
+        return data_items + [('api_token', self.api_token), ('api_format', api_format)]
 
-        try:
-            if method == 'GET':
-                full_url = base_url + '?' + urlencode(data_items)
-                data_items = None
-            elif method == 'POST':
-                full_url = base_url
+    def prepare_request(self, base_url: str, data_items: List[Tuple[str, Any]], method: str) -> Tuple[str, Union[None, bytes, MultipartBody], Dict[str, str]]:
+        '''Return the (full_url, body, headers) of a request; POSTs with bytes or file values get a streaming MultipartBody.'''
+        if method == 'GET':
+            return (base_url + '?' + urlencode(data_items), None, {})
+        elif method == 'POST':
+            if any([is_file_value(value) for (key, value) in data_items]):
+                if self.debug:
+                    print('INFO: Will send binary data.')
+                body = MultipartBody(data_items, compress=self.compress_uploads)
+                return (base_url, body, body.headers())
             else:
-                raise Exception('Unsupported HTTP method: {0}'.format(method))
-            if self.debug:
-                self.log.debug('Querying {url}'.format(url=full_url))
+                return (base_url, self.encoded(urlencode(data_items)), FORM_HEADERS)
+        else:
+            raise Exception('Unsupported HTTP method: {0}'.format(method))
+
+    def retry_delay(self, error: Exception, retry_number: int, method: str, base_url: str, full_url: str, timer: Optional[RequestTimer] = None) -> float:
+        '''Seconds to wait before retrying the request that failed with error; raises it instead if the retry policy gives up.'''
+        is_retried = self.retry_policy.should_retry(error, retry_number, method, url=base_url)
+        if timer is not None:
+            timer.fail(is_retried)
+        if not is_retried:
+            if isinstance(error, HTTPError):
+                raise error
+            if self.debug and retry_number > 1:
+                self.log.error('API request failed, and reached maximum attempts or retry budget. Aborting ...')
+            if isinstance(error, URLError):
+                raise Exception([full_url, str(error)])
+            raise error
+        delay = self.retry_policy.delay_for(error, retry_number)
+        if self.debug:
+            self.log.warning('API request failed ({0}), will try again in {1:.2f}s (retry_number={2})'.format(error, delay, retry_number))
+        return delay
+
+    def log_http_error(self, e: HTTPError, full_url: str, data_items: List[Tuple[str, Any]], method: str) -> None:
+        self.log.error('Failed opening url: "{0}{1}{2}".\nResponse was:\n"{3}"\n'.format(
+            full_url,
+            '?' if method != 'GET' else '',
+            truncate_str_if_necessary(urlencode(data_items) if method != 'GET' else ''),
+            self.decode_if_necessary(e.read()),
+        ))
+
+    def stream_response(self, response: Any, fnme: str, checksum: Optional[str] = None) -> None:
+        '''Copy a response body to fnme through a temporary file, verifying checksum='<algorithm>:<hexdigest>' if given.'''
+        digest = checksum_digest(checksum) if checksum is not None else None
+        temporary_fnme = temporary_fnme_for(fnme)
+        try:
+            with open(temporary_fnme, 'xb') as fh:
+                while True:
+                    chunk = response.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    fh.write(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+            if digest is not None:
+                verify_digest(digest, checksum, fnme)
+            replace(temporary_fnme, fnme)
+        except:
+            if exists(temporary_fnme):
+                remove(temporary_fnme)
+            raise
 
-            if method == 'POST' and any([isinstance(value, bytes) or 'read' in dir(value) for (key, value) in data_items]):
-                def file_for(content):
-                    '''Cast a content object to a file for request.post'''
-                    if 'read' in dir(content):
-                        return content
-                    else:
-                        file_handler = TemporaryFile(mode='w+b')
-                        file_handler.write(
-                            content if isinstance(content, bytes) else str(content).encode(),
-                        )
-                        file_handler.seek(0) # Rewind the files to future .read()
-                        return file_handler
-
-                files=dict(
-                    [
-                        (key, file_for(value))
-                        for (key, value) in data_items
-                    ]
-                )
+    @contextmanager
+    def request_slot(self) -> Iterator[None]:
+        '''Wait for the rate limiter and the concurrency limit (if any) around a single request attempt.'''
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        if self.concurrency_limit is None:
+            yield
+        else:
+            with self.concurrency_limit.slot():
+                yield
+
+    def safe_urlopen(self, base_url: str, data: Union[Dict[str, Any], List[Tuple[str, Any]]] = {}, method: str = 'GET', retry_number: int = 1, fnme: Optional[str] = None, checksum: Optional[str] = None, api_format: Optional[str] = None) -> Union[str, bytes, None]:
+        '''Return the response content, or stream it to fnme (see stream_response()) and return None.'''
+        data_items = self.request_items(data, api_format=api_format)
+        if retry_number == 1 and self.single_flight is not None and self.single_flight.shares(base_url, data_items):
+            return self.single_flight.run(
+                self.single_flight.key_for('safe_urlopen', base_url, method, data_items, fnme, checksum),
+                lambda: self.urlopen_with_retries(base_url, data_items, method, retry_number, fnme, checksum, api_format),
+            )
+        return self.urlopen_with_retries(base_url, data_items, method, retry_number, fnme, checksum, api_format)
 
-                request = post(
-                    full_url,
-                    files=files,
-                )
-                response_content = request.text
+    def urlopen_with_retries(self, base_url: str, data_items: List[Tuple[str, Any]], method: str, retry_number: int, fnme: Optional[str], checksum: Optional[str], api_format: Optional[str], request: Optional[Tuple[str, Union[None, bytes, MultipartBody], Dict[str, str]]] = None) -> Union[str, bytes, None]:
+        '''Send the request, retrying it as the retry policy allows; retries send the same prepared request, so that file values are sent again from their initial position.'''
+        full_url = base_url
+        timer = self.instrumentation.timer(base_url) if self.instrumentation is not None else None
 
-                if self.debug:
-                    print('INFO: Will send binary data.')
-            else:
-                response = urlopen(
-                    Request(
-                        full_url,
-                        data=self.encoded(urlencode(data_items),) if data_items is not None else None,
-                    ),
+        if retry_number == 1:
+            self.retry_policy.record_request()
+        try:
+            if request is None:
+                request = self.prepare_request(base_url, data_items, method)
+            (full_url, body, headers) = request
+            if self.debug:
+                self.log.debug('Querying {url}'.format(url=full_url))
+            if timer is not None:
+                timer.mark('encode')
+
+            with self.request_slot():
+                if timer is not None:
+                    timer.mark('wait')
+                response = self.transport.urlopen(
+                    method,
+                    full_url,
+                    body=body,
+                    headers=headers,
                     timeout=self.timeout,
                 )
-                if self.api_format == 'pickle':
-                    response_content = response.read()
-                else:
-                    response_content = response.read().decode()
+                try:
+                    if timer is not None:
+                        timer.mark('ttfb')
+                        if getattr(response, 'connect_time', 0.) > 0.:
+                            timer.instrumentation.observe(timer.endpoint, 'connect', response.connect_time)
+                    if fnme is None:
+                        response_content = self.read_response(response, api_format=api_format)
+                    else:
+                        response_content = self.stream_response(response, fnme, checksum=checksum)
+                    if timer is not None:
+                        timer.mark('transfer')
+                finally:
+                    # Hands the connection back (or discards it if the body was not read to the end)
+                    response.close()
         except HTTPError as e:
-            self.log.error('Failed opening url: "{0}{1}{2}".\nResponse was:\n"{3}"\n'.format(
-                full_url,
-                '?' if data_items else '',
-                truncate_str_if_necessary(urlencode(data_items) if data_items else ''),
-                self.decode_if_necessary(e.read()),
-            ))
-            raise
+            self.log_http_error(e, full_url, data_items, method)
+            delay = self.retry_delay(e, retry_number, method, base_url, full_url, timer=timer)
+        except self.retry_policy.exceptions as e:
+            delay = self.retry_delay(e, retry_number, method, base_url, full_url, timer=timer)
         except URLError as e:
+            if timer is not None:
+                timer.fail(False)
             raise Exception([full_url, str(e)])
-        except API_Timeout:
-            if retry_number == self.maximum_attempts:
-                if self.debug:
-                    self.log.error('API request timed out, and reached maximum attempts ({0}). Aborting ...'.format(self.maximum_attempts))
-                raise
-            else:
-                if self.debug:
-                    self.log.warning('API request timed out, will try again (retry_number={0})'.format(retry_number))
-                return self.safe_urlopen(base_url, data=data, method=method, retry_number=retry_number + 1)
+        else:
+            if timer is not None:
+                timer.finish(
+                    len(full_url) + (len(body) if isinstance(body, bytes) else getattr(body, 'sent_bytes', 0)),
+                    getsize(fnme) if fnme is not None else len(response_content if isinstance(response_content, bytes) else response_content.encode()),
+                )
+            return response_content
+
+        sleep(delay)
+        return self.urlopen_with_retries(base_url, data_items, method, retry_number + 1, fnme, checksum, api_format, request=request)
+
+    def __init__(self, host: str = HOST, api_token: Optional[str] = None, debug: bool = False, timeout: int = TIMEOUT, api_format: str = API_FORMAT, debug_stream: Any = DEFAULT_DEBUG_STREAM, maximum_attempts: int = 1, pool_size: int = ConnectionPool.POOL_SIZE, keep_alive: float = ConnectionPool.KEEP_ALIVE, connection_pool: Optional[ConnectionPool] = None, topology_cache: Optional[TopologyCache] = None, response_cache: Optional[ResponseCache] = None, retry_policy: Optional[RetryPolicy] = None, rate_limiter: Optional[RateLimiter] = None, concurrency_limit: Optional[AdaptiveConcurrencyLimit] = None, single_flight: Optional[SingleFlight] = None, molids_chunk_size: int = MOLIDS_CHUNK_SIZE, chunk_workers: int = CHUNK_WORKERS, rmsd_pair_cache: Optional[RMSDPairCache] = None, rmsd_backend: str = 'remote', compress_uploads: bool = False, instrumentation: Optional[Instrumentation] = None, transport: Any = None, conditional_cache: Optional[ConditionalCache] = None, accept_encoding: bool = True) -> None:
+        self.init_client(
+            host=host,
+            api_token=api_token,
+            debug=debug,
+            timeout=timeout,
+            api_format=api_format,
+            debug_stream=debug_stream,
+            maximum_attempts=maximum_attempts,
+            retry_policy=retry_policy,
+            rate_limiter=rate_limiter,
+            concurrency_limit=concurrency_limit,
+            single_flight=single_flight,
+            molids_chunk_size=molids_chunk_size,
+            chunk_workers=chunk_workers,
+            topology_cache=topology_cache,
+            response_cache=response_cache,
+            rmsd_pair_cache=rmsd_pair_cache,
+            conditional_cache=conditional_cache,
+            compress_uploads=compress_uploads,
+            instrumentation=instrumentation,
+        )
+        # A shared pool can be passed in; pool_size=0 falls back to one connection per request
+        if connection_pool is not None:
+            self.connection_pool = connection_pool
+        elif pool_size > 0 and transport is None:
+            self.connection_pool = ConnectionPool(maxsize=pool_size, keep_alive=keep_alive)
+        else:
+            self.connection_pool = None
+        # Anything with the urlopen(method, url, body, headers, timeout) method of ConnectionPool (e.g. InProcessTransport, RecordingTransport, ReplayTransport)
+        if transport is not None:
+            self.transport = transport
+        elif self.connection_pool is not None:
+            self.transport = self.connection_pool
+        else:
+            self.transport = UrllibTransport()
+        # Compressed responses are decompressed before anything else (e.g. the conditional cache) sees them
+        if accept_encoding:
+            self.transport = DecompressingTransport(self.transport)
+        # GET responses with validators are stored, and revalidated with conditional requests
+        if conditional_cache is not None:
+            self.transport = ConditionalTransport(self.transport, conditional_cache)
 
-        return response_content
+        # API namespaces
+        self.Molecules = Molecules(self)
+        # rmsd_backend='local' computes RMSDs with NumPy instead of on the server, see LocalRMSD
+        assert rmsd_backend in ('remote', 'local'), rmsd_backend
+        self.RMSD = RMSD(self) if rmsd_backend == 'remote' else LocalRMSD(self)
+        self.Jobs = Jobs(self)
+        self.Statistics = Statistics(self)
+# 
 
-    def __init__(self, host: str = HOST, api_token: Optional[str] = None, debug: bool = False, timeout: int = TIMEOUT, api_format: str = API_FORMAT, debug_stream: Any = DEFAULT_DEBUG_STREAM, maximum_attempts: int = 1) -> None:
+    def init_client(self, host: str = HOST, api_token: Optional[str] = None, debug: bool = False, timeout: int = TIMEOUT, api_format: str = API_FORMAT, debug_stream: Any = DEFAULT_DEBUG_STREAM, maximum_attempts: int = 1, retry_policy: Optional[RetryPolicy] = None, rate_limiter: Optional[RateLimiter] = None, concurrency_limit: Optional[AdaptiveConcurrencyLimit] = None, single_flight: Optional[SingleFlight] = None, molids_chunk_size: int = MOLIDS_CHUNK_SIZE, chunk_workers: int = CHUNK_WORKERS, topology_cache: Optional[TopologyCache] = None, response_cache: Optional[ResponseCache] = None, rmsd_pair_cache: Optional[RMSDPairCache] = None, conditional_cache: Optional[ConditionalCache] = None, compress_uploads: bool = False, instrumentation: Optional[Instrumentation] = None) -> None:
+        '''Set the attributes shared by API and AsyncAPI: everything but the transport and the namespaces.'''
         # Attributes
         self.host = host
         self.api_token = api_token
         self.api_format = api_format
         self.debug = debug
         self.debug_stream = debug_stream
-        self.log = get_log(__name__ + str(getpid()), DEBUG, debug_stream)
         self.timeout = timeout
+        # gzip multipart uploads (Content-Encoding: gzip), for servers decompressing request bodies
+        self.compress_uploads = compress_uploads
         self.maximum_attempts = maximum_attempts
-        self.deserializer_fct = deserializer_fct_for(api_format)
+        # maximum_attempts is a shorthand for the default policy; a policy can be shared by several clients, which then share its retry budget
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy(maximum_attempts=maximum_attempts)
+        # Both are typically shared by all clients of the same server
+        self.rate_limiter = rate_limiter
+        self.concurrency_limit = concurrency_limit
+        self.single_flight = single_flight
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            instrumentation.attach(self)
+        # Longer molid lists are split into parallel requests, see in_chunks()
+        self.molids_chunk_size = molids_chunk_size
+        self.chunk_workers = chunk_workers
+        # api_format='auto' is settled on the first request, see negotiate_api_format()
+        self.deserializer_fct = deserializer_fct_for(api_format) if api_format != 'auto' else None
+        self.negotiation_lock = Lock()
+        self.topology_cache = topology_cache
+        self.response_cache = response_cache
+        self.rmsd_pair_cache = rmsd_pair_cache
+        self.conditional_cache = conditional_cache
+        # Full endpoint URLs, resolved from ROUTES on first use
+        self.urls = {}
+
+    @property
+    def log(self) -> Logger:
+        '''Per-process logger, set up on first use.'''
+        return get_log(__name__ + str(getpid()), DEBUG, self.debug_stream)
+
+    def pool_statistics(self) -> Dict[str, int]:
+        return self.connection_pool.statistics() if self.connection_pool is not None else {}
+
+    def transport_statistics(self) -> Dict[str, Any]:
+        return self.transport.statistics()
+
+    def retry_statistics(self) -> Dict[str, Any]:
+        return self.retry_policy.statistics()
+
+    def single_flight_statistics(self) -> Dict[str, int]:
+        return self.single_flight.statistics() if self.single_flight is not None else {}
+
+    def client_statistics(self) -> Dict[str, Any]:
+        '''Statistics of the connection pool, retries, throttling, single-flight and caches (with their hit rates), as reported by Instrumentation.'''
+        statistics = add_dicts(
+            dict(pool=self.pool_statistics(), transport=self.transport_statistics(), retries=self.retry_statistics(), single_flight=self.single_flight_statistics()),
+            self.throttling_statistics(),
+        )
+        for (name, cache) in (('response_cache', self.response_cache), ('topology_cache', self.topology_cache), ('rmsd_pair_cache', self.rmsd_pair_cache), ('conditional_cache', self.conditional_cache)):
+            if cache is not None:
+                cache_statistics = cache.statistics()
+                if 'misses' in cache_statistics:
+                    lookups = cache_statistics['hits'] + cache_statistics['misses']
+                    cache_statistics['hit_rate'] = cache_statistics['hits'] / lookups if lookups > 0 else 0.
+                statistics[name] = cache_statistics
+        return statistics
+
+    def throttling_statistics(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: limiter.statistics()
+            for (name, limiter) in (('rate_limiter', self.rate_limiter), ('concurrency_limit', self.concurrency_limit))
+            if limiter is not None
+        }
 
-        # API namespaces
-        self.Molecules = Molecules(self)
-        self.RMSD = RMSD(self)
-        self.Jobs = Jobs(self)
-        self.Statistics = Statistics(self)
-# 
+    def fetch(self, base_url: str, data: Union[Dict[str, Any], List[Tuple[str, Any]]] = {}, method: str = 'GET') -> Any:
+        '''Deserialized safe_urlopen(), memoized by the response cache (unless data has bypass_cache=True).'''
+        bypass_cache = False
+        if isinstance(data, dict) and 'bypass_cache' in data:
+            bypass_cache = data['bypass_cache']
+            data = {key: value for (key, value) in data.items() if key != 'bypass_cache'}
+
+        if self.response_cache is None or method != 'GET' or not self.response_cache.caches(base_url):
+            return self.fetch_response(base_url, data, method)[0]
+
+        key = self.response_cache.key_for(base_url, method, self.request_items(data))
+        if not bypass_cache:
+            (hit, value) = self.response_cache.get(key)
+            if hit:
+                return value
+        (value, size) = self.fetch_response(base_url, data, method)
+        self.response_cache.put(key, value, size)
+        return value
+
+    def in_chunks(self, molids: List[ATB_MOLID], function: Callable[[List[ATB_MOLID]], Any], merge_fct: Callable[[List[Any]], Any], sequential: bool = False) -> Any:
+        '''Call function on chunks of molids, in parallel unless sequential, and merge_fct() their results.'''
+        chunks = [molids[i:i + self.molids_chunk_size] for i in range(0, len(molids), self.molids_chunk_size)]
+        if len(chunks) <= 1:
+            return function(molids)
+
+        (results, errors, pending) = ([], [], [])
+        if sequential:
+            for (i, chunk) in enumerate(chunks):
+                try:
+                    results.append(function(chunk))
+                except Exception as e:
+                    errors.append((chunk, e))
+                    pending = [molid for unsent_chunk in chunks[i + 1:] for molid in unsent_chunk]
+                    break
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.chunk_workers, len(chunks))) as executor:
+                futures = [executor.submit(function, chunk) for chunk in chunks]
+            for (chunk, future) in zip(chunks, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    errors.append((chunk, e))
+        if errors:
+            raise ChunkedRequestError(errors, merge_fct(results) if results else None, pending=pending)
+        return merge_fct(results)
+
+    def fetch_molids(self, base_url: str, data: Dict[str, Any] = {}, method: str = 'GET', with_reference: bool = False, merge_fct: Callable[[List[API_RESPONSE]], API_RESPONSE] = merge_responses) -> API_RESPONSE:
+        '''fetch(), split by in_chunks() if data['molids'] is long; with_reference sends the first molid with every chunk.'''
+        if 'molids' not in data:
+            return self.fetch(base_url, data=data, method=method)
+        molids = molid_list_for(data['molids'])
+        (reference, molids) = (molids[:1], molids[1:]) if with_reference else ([], molids)
+        return self.in_chunks(
+            molids,
+            lambda chunk: self.fetch(base_url, data=add_dicts(data, dict(molids=','.join(map(str, reference + chunk)))), method=method),
+            merge_fct,
+            sequential=endpoint_for(base_url) in NON_IDEMPOTENT_ENDPOINTS,
+        )
+
+    def fetch_response(self, base_url: str, data: Union[Dict[str, Any], List[Tuple[str, Any]]], method: str) -> Tuple[Any, int]:
+        '''Deserialized response and its size; with single_flight set, identical concurrent calls share both.'''
+        def fetch_once() -> Tuple[Any, int]:
+            response_content = self.safe_urlopen(base_url, data=data, method=method)
+            if self.instrumentation is None:
+                return (self.deserialize(response_content), len(response_content))
+            deserialize_started_at = monotonic()
+            value = self.deserialize(response_content)
+            self.instrumentation.observe(endpoint_for(base_url), 'deserialize', monotonic() - deserialize_started_at)
+            return (value, len(response_content))
+
+        if self.single_flight is not None:
+            data_items = self.request_items(data)
+            if self.single_flight.shares(base_url, data_items):
+                return self.single_flight.run(self.single_flight.key_for('fetch', base_url, method, data_items), fetch_once)
+        return fetch_once()
 
     def deserialize(self, an_object: Any) -> Any:
         try:
@@ -228,23 +2159,13 @@ class API(object):
             print(an_object)
             raise
 
-    TWO_FRAMES_ABOVE = itemgetter(2)
-    FUNCTION_NAME = itemgetter(3)
-
-    def url(self, api_namespace: str, api_endpoint: Optional[str] = None) -> str:
+    def url(self, api_namespace: str, api_endpoint: str) -> str:
         try:
-            api_method = (API.FUNCTION_NAME(API.TWO_FRAMES_ABOVE(stack())) if api_endpoint is None else api_endpoint) + '.py'
-            assert search('^[a-zA-Z0-9-_]+\.py$', api_method), api_method
-
-            return join(
-                self.host,
-                'api',
-                'current',
-                api_namespace,
-                api_method,
-            )
-        except IndexError as e:
-            raise Exception('Invalid stack in API.url(): {0}. Error was: {1}'.format(stack(), str(e)))
+            return self.urls[(api_namespace, api_endpoint)]
+        except KeyError:
+            route = ROUTES[(api_namespace, api_endpoint)] if (api_namespace, api_endpoint) in ROUTES else route_for(api_namespace, api_endpoint)
+            self.urls[(api_namespace, api_endpoint)] = join(self.host, route)
+            return self.urls[(api_namespace, api_endpoint)]
 
 class ATB_Mol(object):
     def __init__(self, api, molecule_dict: Dict[str, Any]) -> None:
@@ -269,7 +2190,7 @@ class ATB_Mol(object):
         return self.api.Molecules.finished_job(molid=self.molid, **kwargs)
 
     def __repr__(self) -> str:
-        return yaml.dump(
+        return yaml_dump(
             {
                 key: value
                 for (key, value) in self.__dict__.items()
@@ -277,60 +2198,530 @@ class ATB_Mol(object):
             }
         )
 
+class LazyATB_Mol(ATB_Mol):
+    '''ATB_Mol holding only its molid until its Hydrator fetches it on first use.'''
+
+    def __init__(self, api, molid: ATB_MOLID, hydrator: 'Hydrator') -> None:
+        self.api = api
+        self.molid = molid
+        self.hydrator = hydrator
+        self.hydrated = False
+        hydrator.add(self)
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for attributes missing from __dict__
+        if name.startswith('__') or name in ('api', 'molid', 'hydrator', 'hydrated') or self.__dict__.get('hydrated', True):
+            raise AttributeError(name)
+        self.hydrator.hydrate(self)
+        return object.__getattribute__(self, name)
+
+    def fill(self, molecule_dict: Dict[str, Any]) -> None:
+        for (key, value) in molecule_dict.items():
+            if key not in ('api', 'hydrator', 'hydrated'):
+                setattr(self, key, value)
+        self.hydrated = True
+
+    def __repr__(self) -> str:
+        if not self.hydrated:
+            self.hydrator.hydrate(self)
+        return yaml_dump(
+            {
+                key: value
+                for (key, value) in self.__dict__.items()
+                if key not in ['api', 'hydrator', 'hydrated']
+            }
+        )
+
+class Hydrator(object):
+    '''Fills pending LazyATB_Mol handles with batched Molecules.molid(molids=...) requests.'''
+    BATCH_SIZE = 250
+    BATCH_WINDOW = 0.01
+
+    def __init__(self, molecules: 'Molecules', batch_size: int = BATCH_SIZE, batch_window: float = BATCH_WINDOW) -> None:
+        self.molecules = molecules
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.lock = Lock()
+        # molid -> handles not hydrated yet, in creation order; handles no longer referenced elsewhere drop out
+        self.pending = OrderedDict()
+        # molid -> Future of the batch fetching it
+        self.in_flight = {}
+        self.counters = dict(batches=0, molecules=0)
+
+    def add(self, handle: LazyATB_Mol) -> None:
+        with self.lock:
+            self.pending.setdefault(str(handle.molid), WeakSet()).add(handle)
+
+    def next_batch(self, molid: str) -> Dict[str, List[LazyATB_Mol]]:
+        batch = OrderedDict([(molid, list(self.pending.pop(molid, [])))])
+        batch_molids = []
+        for pending_molid in self.pending:
+            if len(batch) + len(batch_molids) >= self.batch_size:
+                break
+            if pending_molid not in self.in_flight:
+                batch_molids.append(pending_molid)
+        for pending_molid in batch_molids:
+            handles = list(self.pending.pop(pending_molid))
+            if handles:
+                batch[pending_molid] = handles
+        return batch
+
+    def hydrate(self, handle: LazyATB_Mol) -> None:
+        molid = str(handle.molid)
+        with self.lock:
+            future = self.in_flight.get(molid)
+        if future is None:
+            if self.batch_window > 0:
+                sleep(self.batch_window)
+            with self.lock:
+                future = self.in_flight.get(molid)
+                if future is None:
+                    batch = self.next_batch(molid)
+                    future = Future()
+                    for batch_molid in batch:
+                        self.in_flight[batch_molid] = future
+                    self.counters['batches'] += 1
+                    self.counters['molecules'] += len(batch)
+                else:
+                    batch = None
+            if batch is not None:
+                self.fetch_batch(batch, future)
+
+        molecule_dicts = future.result()
+        if not handle.hydrated:
+            if molid not in molecule_dicts:
+                raise Exception('Molecule not found: molid={0}'.format(molid))
+            handle.fill(molecule_dicts[molid])
+
+    def fetch_batch(self, batch: Dict[str, List[LazyATB_Mol]], future: Future) -> None:
+        try:
+            molecule_dicts = {
+                str(molecule_dict['molid']): molecule_dict
+                for molecule_dict in self.molecules.api.fetch(
+                    self.molecules.url('molid'),
+                    data=self.molecules.molid_parameters(None, list(batch.keys()), {}),
+                    method='GET',
+                )['molecules']
+            }
+            for (molid, handles) in batch.items():
+                if molid in molecule_dicts:
+                    for handle in handles:
+                        handle.fill(molecule_dicts[molid])
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(molecule_dicts)
+        finally:
+            with self.lock:
+                for molid in batch:
+                    del self.in_flight[molid]
+
+    def statistics(self) -> Dict[str, int]:
+        with self.lock:
+            return add_dicts(self.counters, dict(pending=len(self.pending), in_flight=len(self.in_flight)))
+
+class CategoricalColumn(object):
+    '''String column of a MoleculeTable: int32 codes into an array of its distinct values (UTF-8, fixed width); code -1 is None.'''
+
+    def __init__(self, codes: Any, categories: Any) -> None:
+        self.codes = codes
+        self.categories = categories
+
+    @classmethod
+    def from_values(cls, values: List[Optional[str]]) -> 'CategoricalColumn':
+        import numpy
+        index = OrderedDict()
+        codes = numpy.array([index.setdefault(value, len(index)) if value is not None else -1 for value in values], dtype=numpy.int32)
+        return cls(codes, numpy.array([value.encode() for value in index], dtype=bytes) if index else numpy.empty(0, dtype='S1'))
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.categories.nbytes
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, item: Any) -> Any:
+        if isinstance(item, Integral):
+            code = self.codes[item]
+            return self.categories[code].decode() if code >= 0 else None
+        return CategoricalColumn(self.codes[item], self.categories)
+
+    def isin(self, values: List[Any]) -> Any:
+        '''Boolean mask of the rows whose value is one of values.'''
+        import numpy
+        values = list(values)
+        encoded_values = [value.encode() for value in values if isinstance(value, str)]
+        codes = numpy.flatnonzero(numpy.isin(self.categories, encoded_values)).tolist() + ([-1] if None in values else [])
+        return numpy.isin(self.codes, codes)
+
+    def __eq__(self, other: Any) -> Any:
+        return self.isin([other])
+
+    def __ne__(self, other: Any) -> Any:
+        return ~self.isin([other])
+
+    __hash__ = None
+
+    def tolist(self) -> List[Optional[str]]:
+        categories = [category.decode() for category in self.categories.tolist()]
+        return [categories[code] if code >= 0 else None for code in self.codes.tolist()]
+
+    def to_array(self) -> Any:
+        '''Fixed-width unicode array of the values, None as ''.'''
+        import numpy
+        return numpy.char.decode(numpy.append(self.categories, b'')[self.codes], 'utf-8')
+
+class MoleculeRow(ATB_Mol):
+    '''Cheap view of one row of a MoleculeTable, behaving like an ATB_Mol.'''
+
+    def __init__(self, table: 'MoleculeTable', index: int) -> None:
+        self.table = table
+        self.index = index
+
+    @property
+    def api(self) -> API:
+        return self.table.api
+
+    def __getattr__(self, name: str) -> Any:
+        if name in ('table', 'index') or name not in self.table.columns:
+            raise AttributeError(name)
+        value = self.table.columns[name][self.index]
+        return value.item() if hasattr(value, 'item') else value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in self.table.columns.keys()}
+
+    def __repr__(self) -> str:
+        return yaml_dump(self.to_dict())
+
+class MoleculeTable(object):
+    '''Column-oriented store for large sets of molecules, one NumPy array per response key.'''
+
+    def __init__(self, api: API, columns: Dict[str, Any]) -> None:
+        self.api = api
+        self.columns = columns
+
+    @staticmethod
+    def column_for(values: List[Any]) -> Any:
+        import numpy
+        non_null_types = set(type(value) for value in values if value is not None)
+        if non_null_types == {bool} and None not in values:
+            return numpy.array(values, dtype=bool)
+        elif non_null_types == {int} and None not in values:
+            return numpy.array(values, dtype=numpy.int64)
+        elif non_null_types and non_null_types <= {int, float}:
+            return numpy.array([value if value is not None else numpy.nan for value in values], dtype=numpy.float64)
+        elif non_null_types == {str}:
+            return CategoricalColumn.from_values(values)
+        else:
+            column = numpy.empty(len(values), dtype=object)
+            column[:] = values
+            return column
+
+    @classmethod
+    def from_dicts(cls, api: API, molecule_dicts: List[Dict[str, Any]]) -> 'MoleculeTable':
+        keys = OrderedDict((key, None) for molecule_dict in molecule_dicts for key in molecule_dict.keys())
+        return cls(
+            api,
+            OrderedDict(
+                (key, cls.column_for([molecule_dict.get(key) for molecule_dict in molecule_dicts]))
+                for key in keys
+            ),
+        )
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __iter__(self) -> Iterator[MoleculeRow]:
+        return (MoleculeRow(self, index) for index in range(len(self)))
+
+    def __getitem__(self, item: Any) -> Any:
+        '''table['formula'] is a column, table[3] a row, and table[mask] or table[indices] a new table.'''
+        if isinstance(item, str):
+            return self.columns[item]
+        elif isinstance(item, Integral):
+            item = as_index(item)
+            if not -len(self) <= item < len(self):
+                raise IndexError(item)
+            return MoleculeRow(self, item % len(self))
+        else:
+            return MoleculeTable(self.api, OrderedDict((key, column[item]) for (key, column) in self.columns.items()))
+
+    def where(self, **conditions: Any) -> 'MoleculeTable':
+        '''Rows matching all conditions: a scalar (equality), a list/tuple/set (membership) or a callable returning a mask.'''
+        import numpy
+        mask = numpy.ones(len(self), dtype=bool)
+        for (key, condition) in conditions.items():
+            column = self.columns[key]
+            if callable(condition):
+                mask &= numpy.asarray(condition(column), dtype=bool)
+            elif isinstance(condition, (list, tuple, set)):
+                mask &= column.isin(condition) if isinstance(column, CategoricalColumn) else numpy.isin(column, list(condition))
+            else:
+                mask &= (column == condition)
+        return self[mask]
+
+    @property
+    def molids(self) -> List[ATB_MOLID]:
+        return self.columns['molid'].tolist()
+
+    def to_structured(self) -> Any:
+        '''Record array of the table; string columns become fixed-width unicode fields, and lists or dicts object fields.'''
+        import numpy
+        columns = OrderedDict((key, column.to_array() if isinstance(column, CategoricalColumn) else column) for (key, column) in self.columns.items())
+        structured_array = numpy.empty(len(self), dtype=[(key, column.dtype) for (key, column) in columns.items()])
+        for (key, column) in columns.items():
+            structured_array[key] = column
+        return structured_array
+
+    def __repr__(self) -> str:
+        return 'MoleculeTable({0} molecules; columns: {1})'.format(len(self), ', '.join(self.columns.keys()))
+
 class Jobs(API):
+    NAMESPACE = 'jobs'
+
     def __init__(self, api: API) -> None:
         self.api = api
 
-    def url(self, api_endpoint: Optional[str] = None) -> str:
-        return self.api.url(self.__class__.__name__.lower(), api_endpoint=api_endpoint)
+    def url(self, api_endpoint: str) -> str:
+        return self.api.url(self.NAMESPACE, api_endpoint)
+
+    def finished_data(self, molids: List[int], qm_logs: List[str], current_qm_levels: List[int], kwargs: Dict[str, Any]) -> List[Tuple[str, Any]]:
+        return (
+            list(kwargs.items())
+            +
+            [('molid', molid) for molid in molids]
+            +
+            [('qm_log', qm_log) for qm_log in qm_logs]
+            +
+            [('current_qm_level', current_qm_level) for current_qm_level in current_qm_levels]
+        )
 
     def finished(self, molids: List[int] = [], qm_logs: List[str] = [], current_qm_levels: List[int] = [], method: str = 'POST', **kwargs: Dict[str, Any]) -> API_RESPONSE:
-        return self.api.deserialize(
-            self.api.safe_urlopen(
-                self.url(),
-                data=(
-                    list(kwargs.items())
-                    +
-                    [('molid', molid) for molid in molids]
-                    +
-                    [('qm_log', qm_log) for qm_log in qm_logs]
-                    +
-                    [('current_qm_level', current_qm_level) for current_qm_level in current_qm_levels]
+        '''Accepted molids; longer molid lists are sent in sequential chunks (see ChunkedRequestError).'''
+        def finished_chunk(indices: List[int]) -> List[int]:
+            return self.api.deserialize(
+                self.api.safe_urlopen(
+                    self.url('finished'),
+                    data=self.finished_data(
+                        [molids[i] for i in indices],
+                        [qm_logs[i] for i in indices if i < len(qm_logs)],
+                        [current_qm_levels[i] for i in indices if i < len(current_qm_levels)],
+                        kwargs,
+                    ),
+                    method=method,
                 ),
-                method=method,
-            ),
-        )['accepted_molids']
+            )['accepted_molids']
+
+        try:
+            return self.api.in_chunks(
+                list(range(len(molids))),
+                finished_chunk,
+                lambda accepted_molids: list(OrderedDict.fromkeys(molid for chunk in accepted_molids for molid in chunk)),
+                sequential=True,
+            )
+        except ChunkedRequestError as e:
+            raise ChunkedRequestError(
+                [([molids[i] for i in indices], error) for (indices, error) in e.errors],
+                e.result,
+                pending=[molids[i] for i in e.pending],
+            )
 
 class RMSD(API):
+    NAMESPACE = 'rmsd'
+    MATRIX_BLOCK_SIZE = 100
+
     def __init__(self, api: API) -> None:
         self.api = api
 
-    def url(self, api_endpoint: Optional[str] = None) -> str:
-        return self.api.url(self.__class__.__name__.lower(), api_endpoint=api_endpoint)
+    def url(self, api_endpoint: str) -> str:
+        return self.api.url(self.NAMESPACE, api_endpoint)
 
-    def align(self, **kwargs) -> API_RESPONSE:
+    def rmsd_parameters(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
         assert 'molids' in kwargs or ('reference_pdb' in kwargs and 'pdb_0' in kwargs), MISSING_VALUE
         if 'molids' in kwargs:
             if type(kwargs['molids']) in (list, tuple):
                 kwargs['molids'] = ','.join(map(str, kwargs['molids']))
             else:
                 assert ',' in kwargs['molids']
-        response_content = self.api.safe_urlopen(self.url(), data=kwargs, method='POST')
-        return self.api.deserialize(response_content)
+        return kwargs
+
+    def align(self, **kwargs) -> API_RESPONSE:
+        # The first molid is the reference, sent with every chunk
+        return self.api.fetch_molids(self.url('align'), data=self.rmsd_parameters(kwargs), method='POST', with_reference=True, merge_fct=merge_align_responses)
 
     def matrix(self, **kwargs) -> API_RESPONSE:
-        assert 'molids' in kwargs or ('reference_pdb' in kwargs and 'pdb_0' in kwargs), MISSING_VALUE
-        if 'molids' in kwargs:
-            if type(kwargs['molids']) in (list, tuple):
-                kwargs['molids'] = ','.join(map(str, kwargs['molids']))
-            else:
-                assert ',' in kwargs['molids']
-        response_content = self.api.safe_urlopen(self.url(), data=kwargs, method='POST')
+        response_content = self.api.safe_urlopen(self.url('matrix'), data=self.rmsd_parameters(kwargs), method='POST')
         return self.api.deserialize(response_content)
 
+    def tiled_matrix(self, molids: List[ATB_MOLID], block_size: int = MATRIX_BLOCK_SIZE, **kwargs: Any) -> Any:
+        '''NumPy matrix of the RMSDs between all pairs of molids, requested in tiles and cached in rmsd_pair_cache.'''
+        import numpy
+        molids = [str(molid) for molid in molids]
+        index = {molid: i for (i, molid) in enumerate(molids)}
+        matrix = numpy.full((len(molids), len(molids)), numpy.nan)
+        numpy.fill_diagonal(matrix, 0.)
+        parameters = json.dumps([self.api.host, sorted((str(key), str(value)) for (key, value) in kwargs.items())])
+        pair_cache = self.api.rmsd_pair_cache
+        if pair_cache is not None:
+            for ((molid_a, molid_b), rmsd) in pair_cache.get_many(parameters, molids).items():
+                matrix[index[molid_a], index[molid_b]] = matrix[index[molid_b], index[molid_a]] = rmsd
+
+        # Molecules missing a pair come first, so that tiles of molecules whose pairs are all cached are skipped altogether
+        is_missing = numpy.isnan(matrix).any(axis=1)
+        order = numpy.concatenate([numpy.flatnonzero(is_missing), numpy.flatnonzero(~is_missing)])
+        blocks = [order[i:i + block_size] for i in range(0, len(order), block_size)]
+
+        def request_tile(rows: List[int]) -> None:
+            tile_molids = [molids[row] for row in rows]
+            response = self.matrix(molids=tile_molids, **kwargs)
+            positions = [index[str(molid)] for molid in response.get('molids', tile_molids)]
+            tile = numpy.array(response['matrix'], dtype=float)
+            matrix[numpy.ix_(positions, positions)] = tile
+            if pair_cache is not None:
+                pair_cache.put_many(
+                    parameters,
+                    {
+                        pair_cache.pair_for(molids[positions[i]], molids[positions[j]]): float(tile[i, j])
+                        for i in range(len(positions))
+                        for j in range(i + 1, len(positions))
+                    },
+                )
+
+        def missing_tiles(tiles: List[Tuple[int, int]]) -> List[List[int]]:
+            return [
+                list(blocks[i]) + (list(blocks[j]) if j != i else [])
+                for (i, j) in tiles
+                if numpy.isnan(matrix[numpy.ix_(blocks[i], blocks[j])]).any()
+            ]
+
+        errors = []
+        # Off-diagonal tiles also fill their two diagonal blocks, which are then only requested on their own if still incomplete
+        for tiles in (
+            [(i, j) for i in range(len(blocks)) for j in range(i + 1, len(blocks))],
+            [(i, i) for i in range(len(blocks))],
+        ):
+            rows_of_tiles = missing_tiles(tiles)
+            if not rows_of_tiles:
+                continue
+            with ThreadPoolExecutor(max_workers=min(self.api.chunk_workers, len(rows_of_tiles))) as executor:
+                futures = [executor.submit(request_tile, rows) for rows in rows_of_tiles]
+            for (rows, future) in zip(rows_of_tiles, futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(([molids[row] for row in rows], e))
+        if errors:
+            raise ChunkedRequestError(errors, matrix)
+        return matrix
+
+def pdb_atoms(pdb_str: str) -> Tuple[List[str], Any]:
+    '''Atom names and (N x 3) NumPy coordinates of the first model of a PDB; repeated atom names get a #<occurrence> suffix.'''
+    import numpy
+    (names, coordinates, occurrences) = ([], [], {})
+    for line in pdb_str.splitlines():
+        if line.startswith('ENDMDL'):
+            break
+        elif line.startswith(('ATOM', 'HETATM')):
+            name = line[12:16].strip()
+            occurrences[name] = occurrences.get(name, 0) + 1
+            names.append(name if occurrences[name] == 1 else '{0}#{1}'.format(name, occurrences[name]))
+            coordinates.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+    return (names, numpy.array(coordinates, dtype=float).reshape(-1, 3))
+
+def common_coordinates(structures: List[Tuple[List[str], Any]]) -> Any:
+    '''(B x N x 3) coordinates of the atoms (matched by name) present in all structures, in the order of the first one.'''
+    import numpy
+    common_names = set(structures[0][0]).intersection(*[names for (names, _) in structures[1:]])
+    ordered_names = [name for name in structures[0][0] if name in common_names]
+    if not ordered_names:
+        raise Exception('No atom names in common between structures')
+    return numpy.array([
+        coordinates[[{name: i for (i, name) in enumerate(names)}[name] for name in ordered_names]]
+        for (names, coordinates) in structures
+    ])
+
+def kabsch_rmsds(reference: Any, structures: Any) -> Any:
+    '''RMSDs after optimal (Kabsch) superposition of each of structures (B x N x 3) onto reference (N x 3), vectorized over structures.'''
+    import numpy
+    reference = reference - reference.mean(axis=0)
+    structures = structures - structures.mean(axis=1)[:, None, :]
+    covariances = numpy.einsum('ni,bnj->bij', reference, structures)
+    singular_values = numpy.linalg.svd(covariances, compute_uv=False)
+    # Superpositions requiring a reflection use the best proper rotation instead
+    singular_values[:, 2] *= numpy.sign(numpy.linalg.det(covariances))
+    squared_norms = (reference ** 2).sum() + (structures ** 2).sum(axis=(1, 2))
+    return numpy.sqrt(numpy.maximum(0., (squared_norms - 2. * singular_values.sum(axis=1)) / reference.shape[0]))
+
+def rmsd_matrix_rows(coordinates: Any, rows: List[int]) -> List[Tuple[int, Any]]:
+    '''RMSDs between each structure of rows and the following ones (module-level, so that it can run in worker processes).'''
+    return [(row, kabsch_rmsds(coordinates[row], coordinates[row + 1:])) for row in rows]
+
+def process_pool_executor(max_workers: int, start_method: Optional[str] = None) -> Any:
+    '''ProcessPoolExecutor whose workers are not forked from this (threaded) process: forkserver where available, spawn otherwise.'''
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    if start_method is None:
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(start_method))
+
+class LocalRMSD(RMSD):
+    '''RMSD namespace computing align() and matrix() locally with NumPy, for API(rmsd_backend='local').'''
+    ATB_FORMAT = 'pdb_aa'
+    PROCESS_PAIRS = 200000
+
+    def __init__(self, api: API, processes: Optional[int] = None, start_method: Optional[str] = None) -> None:
+        self.api = api
+        self.processes = processes if processes is not None else cpu_count()
+        self.start_method = start_method
+
+    def structures_for(self, kwargs: Dict[str, Any]) -> Tuple[List[str], List[Tuple[List[str], Any]]]:
+        '''Labels (molids, or PDB parameter names) and parsed structures of the request, the reference first.'''
+        if 'molids' in kwargs:
+            labels = [str(molid) for molid in molid_list_for(kwargs['molids'])]
+            with ThreadPoolExecutor(max_workers=self.api.chunk_workers) as executor:
+                pdbs = list(executor.map(lambda molid: self.api.Molecules.download_file(molid=molid, atb_format=self.ATB_FORMAT), labels))
+        else:
+            assert 'reference_pdb' in kwargs and 'pdb_0' in kwargs, MISSING_VALUE
+            labels = ['reference_pdb'] + sorted(
+                [key for key in kwargs if search('^pdb_[0-9]+$', key)],
+                key=lambda key: int(key.split('_')[1]),
+            )
+            pdbs = [kwargs[label] for label in labels]
+        return (labels, [pdb_atoms(self.api.decode_if_necessary(pdb)) for pdb in pdbs])
+
+    def align(self, **kwargs) -> API_RESPONSE:
+        '''RMSDs of the structures after superposition onto the first one, in the server's response shape.'''
+        (labels, structures) = self.structures_for(kwargs)
+        coordinates = common_coordinates(structures)
+        return dict(molids=labels, rmsds=kabsch_rmsds(coordinates[0], coordinates).tolist())
+
+    def matrix(self, **kwargs) -> API_RESPONSE:
+        import numpy
+        (labels, structures) = self.structures_for(kwargs)
+        coordinates = common_coordinates(structures)
+        n_structures = len(structures)
+        matrix = numpy.zeros((n_structures, n_structures))
+        if n_structures * (n_structures - 1) // 2 > self.PROCESS_PAIRS and self.processes > 1:
+            with process_pool_executor(self.processes, start_method=self.start_method) as executor:
+                # Interleaved rows, as the first rows have the most pairs
+                row_results = executor.map(rmsd_matrix_rows, [coordinates] * self.processes, [list(range(i, n_structures, self.processes)) for i in range(self.processes)])
+                for (row, rmsds) in (row_result for results in row_results for row_result in results):
+                    matrix[row, row + 1:] = matrix[row + 1:, row] = rmsds
+        else:
+            for (row, rmsds) in rmsd_matrix_rows(coordinates, range(n_structures)):
+                matrix[row, row + 1:] = matrix[row + 1:, row] = rmsds
+        return dict(molids=labels, matrix=matrix.tolist(), n_atoms=coordinates.shape[1])
+
 class Molecules(API):
+    NAMESPACE = 'molecules'
+    DOWNLOAD_WORKERS = 8
+    SEARCH_PAGE_SIZE = 500
+
     def __init__(self, api: API) -> None:
         self.api = api
+        self.hydrator = Hydrator(self)
         self.download_urls = {
             'pdb_aa': ('download_file', dict(outputType='top', file='pdb_allatom_optimised', ffVersion="54A7"),),
             'pdb_allatom_unoptimised': ('download_file', dict(outputType='top', file='pdb_allatom_unoptimised', ffVersion="54A7"),),
@@ -345,49 +2736,158 @@ class Molecules(API):
 # 
         }
 
-    def url(self, api_endpoint: Optional[str] = None) -> str:
-        return self.api.url(self.__class__.__name__.lower(), api_endpoint=api_endpoint)
+    def url(self, api_endpoint: str) -> str:
+        return self.api.url(self.NAMESPACE, api_endpoint)
 
     def search(self, **kwargs) -> Any:
+        return self.search_results(self.api.fetch(self.url('search'), data=self.search_parameters(kwargs), method='GET'), kwargs)
+
+    def search_parameters(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        # return_type='table' and 'lazy' are built locally from the 'molecules' and 'molids' responses
+        if kwargs.get('return_type') == 'table':
+            return add_dicts(kwargs, dict(return_type='molecules'))
+        elif kwargs.get('return_type') == 'lazy':
+            return add_dicts(kwargs, dict(return_type='molids'))
+        else:
+            return kwargs
+
+    def handles(self, molids: List[ATB_MOLID]) -> List[LazyATB_Mol]:
+        '''Lazy ATB_Mol handles, fetched in batches on first use (see Hydrator).'''
+        return [LazyATB_Mol(self.api, molid, self.hydrator) for molid in molids]
+
+    def iter_search(self, page_size: int = SEARCH_PAGE_SIZE, **kwargs) -> Iterator[ATB_Mol]:
+        '''Iterate over a search page_size molecules at a time; assumes server-side offset/limit paging, and stops if a page is short, too long or repeated.'''
+        def fetch_page(offset: int) -> List[Dict[str, Any]]:
+            return self.api.fetch(
+                self.url('search'),
+                data=add_dicts(kwargs, dict(return_type='molecules', offset=offset, limit=page_size)),
+                method='GET',
+            )['molecules']
+
+        (executor, next_page, offset, previous_molids) = (ThreadPoolExecutor(max_workers=1), None, 0, None)
+        try:
+            next_page = executor.submit(fetch_page, offset)
+            while next_page is not None:
+                page = next_page.result()
+                molids = [molecule_dict.get('molid') for molecule_dict in page]
+                if molids == previous_molids:
+                    break
+                (offset, previous_molids) = (offset + len(page), molids)
+                next_page = executor.submit(fetch_page, offset) if len(page) == page_size else None
+                for molecule_dict in page:
+                    yield ATB_Mol(self.api, molecule_dict)
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+            executor.shutdown(wait=False)
+
+    def search_results(self, data: API_RESPONSE, kwargs: Dict[str, Any]) -> Any:
         return_type = kwargs['return_type'] if 'return_type' in kwargs else 'molecules'
-        response_content = self.api.safe_urlopen(self.url(), data=kwargs, method='GET')
-        data = self.api.deserialize(response_content)
         if return_type == 'molecules':
             return [ATB_Mol(self.api, m) for m in data[return_type]]
+        elif return_type == 'table':
+            return MoleculeTable.from_dicts(self.api, data['molecules'])
+        elif return_type == 'lazy':
+            return self.handles(data['molids'])
         elif return_type == 'molids':
             return data[return_type]
         else:
             raise Exception('Unknow return_type: {0}'.format(return_type))
 
-    def download_file(self, **kwargs: Dict[str, Any]) -> Union[None, ATB_OUTPUT]:
-
-        def write_to_file_or_return(response_content, deserializer_fct) -> Union[None, ATB_OUTPUT]:
-            # Either write response to file 'fnme', or return its content
-            if 'fnme' in kwargs:
-                fnme = str(kwargs['fnme'])
-                with open(fnme, 'w' + ('b' if isinstance(response_content, bytes) else 't')) as fh:
-                    fh.write(response_content)
-                return None
-            else:
-                return deserializer_fct(response_content)
-
+    def download_request(self, kwargs: Dict[str, Any]) -> Tuple[str, Dict[str, Any], Callable[[Any], Any]]:
+        '''Return the (url, data, deserializer_fct) of a download_file() call; raw files are returned as text, whatever the api_format.'''
         if all([key in kwargs for key in ('atb_format', 'molid')]):
             # Construct donwload.py request based on requested file format
             atb_format = str(kwargs['atb_format'])
-            call_kwargs = dict([(key, value) for (key, value) in list(kwargs.items()) if key not in ('atb_format',)])
+            call_kwargs = dict([(key, value) for (key, value) in list(kwargs.items()) if key not in ('atb_format', 'checksum')])
             api_endpoint, extra_parameters = self.download_urls[atb_format]
-            url = self.url(api_endpoint)
-            response_content = self.api.safe_urlopen(url, data=concat_dicts(extra_parameters, call_kwargs), method='GET')
-            deserializer_fct = (self.api.deserializer_fct if atb_format == 'yml' else (lambda x: x))
+            return (
+                self.url(api_endpoint),
+                concat_dicts(extra_parameters, call_kwargs),
+                (self.api.deserialize if atb_format == 'yml' else self.api.decode_if_necessary),
+            )
         else:
             # Forward all the keyword arguments to download_file.py
-            response_content = self.api.safe_urlopen(self.url(), data=kwargs, method='GET')
-            deserializer_fct = lambda x: x
-        return write_to_file_or_return(response_content, deserializer_fct)
+            return (self.url('download_file'), {key: value for (key, value) in kwargs.items() if key != 'checksum'}, self.api.decode_if_necessary)
+
+    def write_to_file_or_return(self, kwargs: Dict[str, Any], response_content: Union[str, bytes], deserializer_fct: Callable[[Any], Any]) -> Union[None, ATB_OUTPUT]:
+        # Either write response to file 'fnme', or return its content
+        if 'fnme' in kwargs:
+            write_atomically(str(kwargs['fnme']), response_content if isinstance(response_content, bytes) else response_content.encode())
+            return None
+        else:
+            return deserializer_fct(response_content)
+
+    def download_file(self, **kwargs: Dict[str, Any]) -> Union[None, ATB_OUTPUT]:
+        '''Return the requested file, or write (stream) it to fnme, verified against checksum if given.'''
+        (url, data, deserializer_fct) = self.download_request(kwargs)
+        if 'fnme' in kwargs and self.api.topology_cache is None:
+            self.api.safe_urlopen(url, data=data, method='GET', fnme=str(kwargs['fnme']), checksum=kwargs.get('checksum'))
+            return None
+        elif self.api.topology_cache is not None and all([key in kwargs for key in ('atb_format', 'molid')]):
+            response_content = self.cached_download(url, data, kwargs)
+        else:
+            response_content = self.api.safe_urlopen(url, data=data, method='GET')
+            if 'checksum' in kwargs:
+                verify_checksum(response_content, kwargs['checksum'], url)
+        return self.write_to_file_or_return(kwargs, response_content, deserializer_fct)
+
+    def cached_download(self, url: str, data: Dict[str, Any], kwargs: Dict[str, Any]) -> Union[str, bytes]:
+        '''Serve a download from the topology cache, unless the molecule's latest_topology_hash changed since it was stored; verifies checksum if given.'''
+        cache = self.api.topology_cache
+        key = cache.key_for(
+            self.api.host,
+            kwargs['molid'],
+            kwargs['atb_format'],
+            {key: value for (key, value) in data.items() if key not in ('molid', 'fnme', 'refresh_cache')},
+        )
+        topology_hash = json.dumps(self.latest_topology_hash(molid=kwargs['molid']), sort_keys=True, default=str)
+        content = cache.get(key, topology_hash) if not kwargs.get('refresh_cache', False) else None
+        if content is None:
+            response_content = self.api.safe_urlopen(url, data=data, method='GET')
+            if 'checksum' in kwargs:
+                # Before storing it, so that a corrupted download is not served again
+                verify_checksum(response_content, kwargs['checksum'], url)
+            cache.put(key, response_content if isinstance(response_content, bytes) else response_content.encode(), topology_hash)
+            return response_content
+        else:
+            if 'checksum' in kwargs:
+                verify_checksum(content, kwargs['checksum'], url)
+            return content if self.api.api_format in BINARY_API_FORMATS else content.decode()
+
+    def download_many(self, molids: List[ATB_MOLID], atb_formats: List[str], out_dir: str = '.', workers: int = DOWNLOAD_WORKERS, max_in_flight: Optional[int] = None, fnme_template: str = '{molid}.{atb_format}', progress_callback: Optional[Callable[[Tuple[ATB_MOLID, str], Any, int, int], None]] = None, **kwargs: Dict[str, Any]) -> Dict[Tuple[ATB_MOLID, str], Any]:
+        '''Download every distinct (molid, atb_format) pair to out_dir on workers threads (duplicates are downloaded once); returns {item: path or exception}.'''
+        makedirs(out_dir, exist_ok=True)
+        # Duplicate molids (or formats) would download to the same file concurrently, so each item is downloaded once
+        items = list(OrderedDict.fromkeys((molid, atb_format) for molid in molids for atb_format in atb_formats))
+        in_flight = BoundedSemaphore(max_in_flight if max_in_flight is not None else 2 * workers)
+        (lock, results) = (Lock(), {})
+
+        def download(item: Tuple[ATB_MOLID, str]) -> str:
+            (molid, atb_format) = item
+            fnme = join(out_dir, fnme_template.format(molid=molid, atb_format=atb_format))
+            self.download_file(molid=molid, atb_format=atb_format, fnme=fnme, **kwargs)
+            return fnme
+
+        def on_done(item: Tuple[ATB_MOLID, str], future: Future) -> None:
+            result = future.exception() if future.exception() is not None else future.result()
+            with lock:
+                results[item] = result
+                n_completed = len(results)
+            in_flight.release()
+            if progress_callback is not None:
+                progress_callback(item, result, n_completed, len(items))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for item in items:
+                in_flight.acquire()
+                executor.submit(download, item).add_done_callback(lambda future, item=item: on_done(item, future))
+
+        return results
 
 # 
 
-    def molid(self, molid: Optional[ATB_MOLID] = None, molids: Optional[List[ATB_MOLID]] = None, **kwargs: Dict[str, Any]) -> Union[ATB_Mol, List[ATB_Mol]]:
+    def molid_parameters(self, molid: Optional[ATB_MOLID], molids: Optional[List[ATB_MOLID]], kwargs: Dict[str, Any]) -> Dict[str, Any]:
         assert len([True for x in [molid, molids] if x is not None]) <= 1, 'Provide molid={0} or molids={1}; not both'.format(molid, molids)
         if molid is not None:
             parameters = dict(molid=molid)
@@ -395,9 +2895,15 @@ class Molecules(API):
             parameters = dict(molids=','.join(map(str, molids)))
         else:
             raise Exception('Provide either molid=X or molids=[X, Y]')
-        response_content = self.api.safe_urlopen(self.url(), data=add_dicts(parameters, kwargs), method='GET')
-        data = self.api.deserialize(response_content)
-        if molids is not None:
+        return add_dicts(parameters, {key: value for (key, value) in kwargs.items() if (key, value) != ('return_type', 'table')})
+
+    def molid(self, molid: Optional[ATB_MOLID] = None, molids: Optional[List[ATB_MOLID]] = None, **kwargs: Dict[str, Any]) -> Union[ATB_Mol, List[ATB_Mol]]:
+        return self.molid_results(self.api.fetch_molids(self.url('molid'), data=self.molid_parameters(molid, molids, kwargs), method='GET'), molid, molids, kwargs)
+
+    def molid_results(self, data: API_RESPONSE, molid: Optional[ATB_MOLID], molids: Optional[List[ATB_MOLID]], kwargs: Dict[str, Any] = {}) -> Union[ATB_Mol, List[ATB_Mol], MoleculeTable]:
+        if molids is not None and kwargs.get('return_type') == 'table':
+            return MoleculeTable.from_dicts(self.api, data['molecules'])
+        elif molids is not None:
             return [ATB_Mol(self.api, molecule_dict) for molecule_dict in data['molecules']]
         elif molid is not None:
             return ATB_Mol(self.api, data['molecule'])
@@ -409,24 +2915,26 @@ class Molecules(API):
 
     def structure_search(self, method: str = 'POST', **kwargs) -> API_RESPONSE:
         assert all([ arg in kwargs for arg in ('structure', 'netcharge', 'structure_format') ])
-        response_content = self.api.safe_urlopen(self.url(), data=kwargs, method=method)
+        response_content = self.api.safe_urlopen(self.url('structure_search'), data=kwargs, method=method)
         return self.api.deserialize(response_content)
 
 # 
 
     def submit(self, request='POST', **kwargs) -> API_RESPONSE:
         assert all([arg in kwargs for arg in ('netcharge', 'public', 'moltype') ]) and len([True for arg in ['pdb', 'smiles'] if arg in kwargs]) == 1
-        response_content = self.api.safe_urlopen(self.url(), data=kwargs, method=request)
+        response_content = self.api.safe_urlopen(self.url('submit'), data=kwargs, method=request)
         return self.api.deserialize(response_content)
 
 # 
 
 class Statistics(API):
+    NAMESPACE = 'statistics'
+
     def __init__(self, api: API) -> None:
         self.api = api
 
-    def url(self, api_endpoint: Optional[str] = None) -> str:
-        return self.api.url(self.__class__.__name__.lower(), api_endpoint=api_endpoint)
+    def url(self, api_endpoint: str) -> str:
+        return self.api.url(self.NAMESPACE, api_endpoint)
 
 # 
 
@@ -468,7 +2976,7 @@ METHODS = {
 for namespace in METHODS.keys():
     for (function_name, maybe_key, default_method) in METHODS[namespace]:
         function = lambda self, method=default_method, api_endpoint=function_name, maybe_key=maybe_key, function_name=function_name, **kwargs: get_maybe_key(
-            self.api.deserialize(self.api.safe_urlopen(self.url(api_endpoint=api_endpoint), data=kwargs, method=method)),
+            self.api.fetch_molids(self.url(api_endpoint=api_endpoint), data=kwargs, method=method),
             maybe_key,
         )
         function.__name__ = function_name
@@ -478,6 +2986,605 @@ for namespace in METHODS.keys():
             function,
         )
 
+# Endpoints of the namespaces' explicit methods; those of METHODS are added below
+EXPLICIT_ENDPOINTS = {
+    Molecules: ['search', 'download_file', 'molid', 'structure_search', 'submit'],
+    RMSD: ['align', 'matrix'],
+    Jobs: ['finished'],
+    Statistics: [],
+}
+
+# Static routing table: (namespace, endpoint) -> path relative to API.host
+ROUTES = {
+    (namespace.NAMESPACE, api_endpoint): route_for(namespace.NAMESPACE, api_endpoint)
+    for namespace in EXPLICIT_ENDPOINTS.keys()
+    for api_endpoint in EXPLICIT_ENDPOINTS[namespace] + [function_name for (function_name, _, _) in METHODS.get(namespace, [])]
+}
+
+class JobPipeline(object):
+    '''QM worker pipelining Jobs.get/accept, compute_fct(job) in a process pool, and batched Jobs.finished uploads.'''
+    QUEUE_SIZE = 20
+    UPLOAD_BATCH_SIZE = 10
+    UPLOAD_INTERVAL = 5.
+    POLL_INTERVAL = 30.
+
+    def __init__(self, api: API, compute_fct: Callable[[Dict[str, Any]], Tuple[Any, int]], processes: Optional[int] = None, queue_size: int = QUEUE_SIZE, upload_batch_size: int = UPLOAD_BATCH_SIZE, upload_interval: float = UPLOAD_INTERVAL, poll_interval: float = POLL_INTERVAL, get_kwargs: Dict[str, Any] = {}, start_method: Optional[str] = None) -> None:
+        self.api = api
+        self.compute_fct = compute_fct
+        self.processes = processes if processes is not None else cpu_count()
+        # Workers must not be forked from a process running threads; None uses forkserver where available, else spawn
+        self.start_method = start_method
+        self.upload_batch_size = upload_batch_size
+        self.upload_interval = upload_interval
+        self.poll_interval = poll_interval
+        self.get_kwargs = get_kwargs
+        self.queue_size = queue_size
+        self.jobs = Queue(maxsize=queue_size)
+        self.results = Queue()
+        # Jobs being computed or waiting for upload
+        self.computing = BoundedSemaphore(queue_size)
+        self.lock = Lock()
+        self.stopping = Event()
+        (self.fetcher, self.dispatcher, self.uploader, self.executor) = (None, None, None, None)
+        self.started_at = None
+        self.counters = dict(fetched=0, accepted=0, computed=0, failed=0, finished=0, released=0, upload_batches=0, errors=0)
+
+    def count(self, counter: str, value: int = 1) -> None:
+        with self.lock:
+            self.counters[counter] += value
+
+    def log_error(self, message: str, e: Exception) -> None:
+        self.count('errors')
+        self.api.log.error('{0}: {1}'.format(message, e))
+
+    def release(self, molids: List[ATB_MOLID]) -> None:
+        if not molids:
+            return
+        try:
+            self.api.Jobs.release(molids=','.join(map(str, molids)))
+            self.count('released', len(molids))
+        except Exception as e:
+            self.log_error('Could not release jobs {0}'.format(molids), e)
+
+    def fetch_jobs(self) -> None:
+        while not self.stopping.is_set():
+            try:
+                jobs = self.api.Jobs.get(**self.get_kwargs) or []
+                self.count('fetched', len(jobs))
+                accepted_molids = set(
+                    str(molid)
+                    for molid in (self.api.Jobs.accept(molids=','.join(str(job['molid']) for job in jobs)) if jobs else [])
+                )
+            except Exception as e:
+                self.log_error('Could not fetch jobs', e)
+                (jobs, accepted_molids) = ([], set())
+            accepted_jobs = [job for job in jobs if str(job['molid']) in accepted_molids]
+            self.count('accepted', len(accepted_jobs))
+            if not accepted_jobs:
+                self.stopping.wait(self.poll_interval)
+            for (i, job) in enumerate(accepted_jobs):
+                # Blocks while the queue is full
+                while not self.stopping.is_set():
+                    try:
+                        self.jobs.put(job, timeout=0.1)
+                        break
+                    except Full:
+                        pass
+                else:
+                    self.release([job['molid'] for job in accepted_jobs[i:]])
+                    break
+
+    def dispatch_jobs(self) -> None:
+        while not self.stopping.is_set():
+            try:
+                job = self.jobs.get(timeout=0.1)
+            except Empty:
+                continue
+            # Blocks while queue_size jobs are being computed or waiting for upload
+            self.computing.acquire()
+            future = self.executor.submit(self.compute_fct, job)
+            future.add_done_callback(lambda future, job=job: self.results.put((job, future)))
+
+        # Once the fetcher has stopped, release the jobs it queued that were not started
+        self.fetcher.join()
+        queued_jobs = []
+        while not self.jobs.empty():
+            queued_jobs.append(self.jobs.get())
+        self.release([job['molid'] for job in queued_jobs])
+        # Taking every slot waits for all jobs in computation to be handed to the uploader
+        for _ in range(self.queue_size):
+            self.computing.acquire()
+        self.results.put(None)
+        for _ in range(self.queue_size):
+            self.computing.release()
+
+    def upload_results(self) -> None:
+        (batch, is_done, deadline) = ([], False, monotonic() + self.upload_interval)
+        while not is_done:
+            try:
+                item = self.results.get(timeout=max(0., deadline - monotonic()))
+                if item is None:
+                    is_done = True
+                else:
+                    batch.append(item)
+                    self.computing.release()
+            except Empty:
+                pass
+            if batch and (is_done or len(batch) >= self.upload_batch_size or monotonic() >= deadline):
+                self.upload(batch)
+                batch = []
+            if monotonic() >= deadline:
+                deadline = monotonic() + self.upload_interval
+
+    def upload(self, batch: List[Tuple[Dict[str, Any], Future]]) -> None:
+        (molids, qm_logs, current_qm_levels, failed_molids) = ([], [], [], [])
+        for (job, future) in batch:
+            try:
+                (qm_log, current_qm_level) = future.result()
+                (molids, qm_logs, current_qm_levels) = (molids + [job['molid']], qm_logs + [qm_log], current_qm_levels + [current_qm_level])
+                self.count('computed')
+            except Exception as e:
+                self.log_error('Computation failed for job {0}'.format(job['molid']), e)
+                self.count('failed')
+                failed_molids.append(job['molid'])
+        if molids:
+            try:
+                accepted_molids = self.api.Jobs.finished(molids=molids, qm_logs=qm_logs, current_qm_levels=current_qm_levels)
+                self.count('finished', len(accepted_molids))
+                self.count('upload_batches')
+            except Exception as e:
+                self.log_error('Could not upload results of jobs {0}'.format(molids), e)
+                failed_molids += molids
+        self.release(failed_molids)
+
+    def start(self) -> 'JobPipeline':
+        self.started_at = monotonic()
+        self.stopping.clear()
+        self.executor = process_pool_executor(self.processes, start_method=self.start_method)
+        (self.fetcher, self.dispatcher, self.uploader) = [
+            Thread(target=target, daemon=True)
+            for target in (self.fetch_jobs, self.dispatch_jobs, self.upload_results)
+        ]
+        for thread in (self.fetcher, self.dispatcher, self.uploader):
+            thread.start()
+        return self
+
+    def stop(self) -> None:
+        '''Stop fetching, release the queued jobs, and wait for the ones being computed to be uploaded.'''
+        self.stopping.set()
+        for thread in (self.fetcher, self.dispatcher, self.uploader):
+            thread.join()
+        self.executor.shutdown(wait=True)
+
+    def run(self, duration: Optional[float] = None) -> Dict[str, Any]:
+        '''Run until duration (in seconds) has elapsed, or until interrupted (e.g. Ctrl-C), and return the final statistics.'''
+        self.start()
+        try:
+            self.stopping.wait(duration)
+        finally:
+            self.stop()
+        return self.statistics()
+
+    def __enter__(self) -> 'JobPipeline':
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    def statistics(self) -> Dict[str, Any]:
+        elapsed = monotonic() - self.started_at if self.started_at is not None else 0.
+        with self.lock:
+            return add_dicts(
+                self.counters,
+                dict(
+                    queued=self.jobs.qsize(),
+                    elapsed=elapsed,
+                    finished_per_second=self.counters['finished'] / elapsed if elapsed > 0 else 0.,
+                ),
+            )
+
+class AsyncResponse(object):
+    '''Fully read HTTP response returned by AsyncConnectionPool.'''
+
+    def __init__(self, url: str, status: int, reason: str, headers: Any, content: bytes) -> None:
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+
+    def read(self) -> bytes:
+        return self.content
+
+class AsyncConnection(object):
+    def __init__(self, reader: Any, writer: Any) -> None:
+        self.reader = reader
+        self.writer = writer
+
+    def close(self) -> None:
+        self.writer.close()
+
+class AsyncConnectionPool(ConnectionPool):
+    '''asyncio counterpart of ConnectionPool, speaking HTTP/1.1 over asyncio streams and decompressing responses (see DecompressingTransport).'''
+
+    def __init__(self, maxsize: int = ConnectionPool.POOL_SIZE, keep_alive: float = ConnectionPool.KEEP_ALIVE, keep_alive_per_host: Optional[Dict[str, float]] = None, ssl_context: Any = None, content_encodings: Optional[List[str]] = None) -> None:
+        super(AsyncConnectionPool, self).__init__(maxsize=maxsize, keep_alive=keep_alive, keep_alive_per_host=keep_alive_per_host, ssl_context=ssl_context)
+        self.accept_encoding = ', '.join(content_encodings if content_encodings is not None else available_content_encodings()) or 'identity'
+        self.compression_counters = dict(compressed_responses=0, identity_responses=0, compressed_bytes=0, decompressed_bytes=0)
+
+    def is_reusable(self, connection: AsyncConnection) -> bool:
+        return not connection.reader.at_eof()
+
+    async def get_connection(self, key: Tuple[str, str, int]) -> Tuple[AsyncConnection, bool]:
+        import asyncio
+        connection = self.take_idle_connection(key)
+        if connection is not None:
+            return (connection, True)
+
+        (scheme, host, port) = key
+        try:
+            if scheme == 'https' and self.ssl_context is None:
+                self.ssl_context = create_default_context()
+            (reader, writer) = await asyncio.open_connection(host, port, ssl=self.ssl_context if scheme == 'https' else None)
+        except:
+            self.release_slot()
+            raise
+        return (AsyncConnection(reader, writer), False)
+
+    async def exchange(self, connection: AsyncConnection, method: str, url: str, body: Optional[bytes], headers: Dict[str, str]) -> Tuple[AsyncResponse, bool]:
+        (reader, writer) = (connection.reader, connection.writer)
+        split_url = urlsplit(url)
+        is_streamed = body is not None and not isinstance(body, bytes)
+        request_headers = add_dicts(
+            {'Host': split_url.netloc, 'Accept-Encoding': self.accept_encoding},
+            {'Content-Length': str(len(body))} if body is not None and not is_streamed else {},
+            {'Transfer-Encoding': 'chunked'} if is_streamed and 'Content-Length' not in headers else {},
+            headers,
+        )
+        writer.write(
+            (
+                '{0} {1} HTTP/1.1\r\n'.format(method, urlunsplit(('', '', split_url.path or '/', split_url.query, '')))
+                +
+                ''.join('{0}: {1}\r\n'.format(key, value) for (key, value) in request_headers.items())
+                +
+                '\r\n'
+            ).encode('latin-1') + (body if body is not None and not is_streamed else b''),
+        )
+        if is_streamed:
+            for chunk in (chunked_frames(body) if 'Transfer-Encoding' in request_headers else body):
+                writer.write(chunk)
+                await writer.drain()
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('Connection closed by server')
+        (version, status, reason) = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+        header_block = await reader.readuntil(b'\r\n\r\n')
+        response_headers = parse_headers(BytesIO(header_block))
+        status = int(status)
+
+        reusable = not (response_headers.get('Connection', '').lower() == 'close' or version == 'HTTP/1.0')
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            content = b''
+        elif response_headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                chunk_size = int((await reader.readline()).split(b';')[0].strip(), 16)
+                if chunk_size == 0:
+                    while (await reader.readline()) not in (b'\r\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(chunk_size))
+                await reader.readline()
+            content = b''.join(chunks)
+        elif response_headers.get('Content-Length') is not None:
+            content = await reader.readexactly(int(response_headers['Content-Length']))
+        else:
+            content = await reader.read()
+            reusable = False
+        return (AsyncResponse(url, status, reason, response_headers, content), reusable)
+
+    def decoded(self, response: AsyncResponse) -> AsyncResponse:
+        '''response, with its body decompressed if it has a Content-Encoding.'''
+        content_encoding = response.headers.get('Content-Encoding', 'identity').strip().lower()
+        if content_encoding == 'identity':
+            with self.lock:
+                self.compression_counters['identity_responses'] += 1
+            return response
+        decoder = StreamDecoder(content_encoding)
+        content = decoder.decompress(response.content) + decoder.flush()
+        with self.lock:
+            self.compression_counters['compressed_responses'] += 1
+            self.compression_counters['compressed_bytes'] += len(response.content)
+            self.compression_counters['decompressed_bytes'] += len(content)
+        headers = message_for([(key, value) for (key, value) in response.headers.items() if key.lower() not in ('content-encoding', 'content-length')])
+        return AsyncResponse(response.url, response.status, response.reason, headers, content)
+
+    async def send(self, method: str, url: str, body: Optional[bytes] = None, headers: Dict[str, str] = {}, timeout: Optional[float] = None) -> AsyncResponse:
+        import asyncio
+        split_url = urlsplit(url)
+        key = pool_key_for(split_url)
+        with self.lock:
+            self.counters['requests'] += 1
+        while True:
+            try:
+                (connection, reused) = await asyncio.wait_for(self.get_connection(key), timeout)
+            except asyncio.TimeoutError:
+                raise API_Timeout('timed out')
+            except OSError as e:
+                raise URLError(e)
+            try:
+                (response, reusable) = await asyncio.wait_for(self.exchange(connection, method, url, body, headers), timeout)
+            except asyncio.TimeoutError:
+                self.discard_connection(connection)
+                raise API_Timeout('timed out')
+            except (asyncio.IncompleteReadError, HTTPException, OSError, ValueError) as e:
+                self.discard_connection(connection)
+                if reused:
+                    # The server closed this keep-alive connection while it was idle; retry on a fresh one
+                    continue
+                raise URLError(e)
+            if reusable:
+                self.put_connection(key, connection)
+            else:
+                self.discard_connection(connection)
+            return self.decoded(response)
+
+    def statistics(self) -> Dict[str, Any]:
+        with self.lock:
+            compression = add_dicts(
+                self.compression_counters,
+                dict(compression_ratio=self.compression_counters['decompressed_bytes'] / self.compression_counters['compressed_bytes'] if self.compression_counters['compressed_bytes'] > 0 else 0.),
+            )
+        return add_dicts(super(AsyncConnectionPool, self).statistics(), dict(compression=compression))
+
+    async def urlopen(self, method: str, url: str, body: Optional[bytes] = None, headers: Dict[str, str] = {}, timeout: Optional[float] = None) -> AsyncResponse:
+        for _ in range(self.MAXIMUM_REDIRECTS + 1):
+            response = await self.send(method, url, body=body, headers=headers, timeout=timeout)
+            if response.status in REDIRECT_STATUSES and response.headers.get('Location') is not None:
+                url = urljoin(url, response.headers['Location'])
+                if response.status not in (307, 308):
+                    method, body, headers = 'GET', None, {}
+            elif response.status >= 400:
+                raise HTTPError(url, response.status, response.reason, response.headers, BytesIO(response.content))
+            else:
+                return response
+        raise URLError('Too many redirects (>{0}) for url: {1}'.format(self.MAXIMUM_REDIRECTS, url))
+
+class AsyncAPI(API):
+    '''asyncio client with the same namespaces and methods as API, whose requests return awaitables.'''
+    MAXIMUM_CONCURRENCY = 100
+    RETRY_DELAY = 0.5
+
+    def __init__(self, host: str = API.HOST, api_token: Optional[str] = None, debug: bool = False, timeout: int = API.TIMEOUT, api_format: str = API.API_FORMAT, debug_stream: Any = DEFAULT_DEBUG_STREAM, maximum_attempts: int = 1, pool_size: int = ConnectionPool.POOL_SIZE, keep_alive: float = ConnectionPool.KEEP_ALIVE, connection_pool: Optional[AsyncConnectionPool] = None, maximum_concurrency: int = MAXIMUM_CONCURRENCY, retry_delay: float = RETRY_DELAY, retry_policy: Optional[RetryPolicy] = None, rate_limiter: Optional[RateLimiter] = None, molids_chunk_size: int = API.MOLIDS_CHUNK_SIZE, accept_encoding: bool = True) -> None:
+        self.init_client(
+            host=host,
+            api_token=api_token,
+            debug=debug,
+            timeout=timeout,
+            api_format=api_format,
+            debug_stream=debug_stream,
+            maximum_attempts=maximum_attempts,
+            retry_policy=retry_policy if retry_policy is not None else RetryPolicy(maximum_attempts=maximum_attempts, backoff_factor=retry_delay),
+            rate_limiter=rate_limiter,
+            molids_chunk_size=molids_chunk_size,
+        )
+        self.connection_pool = connection_pool if connection_pool is not None else AsyncConnectionPool(maxsize=pool_size, keep_alive=keep_alive, content_encodings=None if accept_encoding else [])
+        self.maximum_concurrency = maximum_concurrency
+        # Created on first use, so that they bind to the running event loop
+        self.semaphore = None
+        self.negotiation = None
+
+        # API namespaces
+        self.Molecules = AsyncMolecules(self)
+        self.RMSD = AsyncRMSD(self)
+        self.Jobs = AsyncJobs(self)
+        self.Statistics = AsyncStatistics(self)
+
+    async def probe_api_formats(self) -> str:
+        (api_namespace, api_endpoint, probe_data) = self.API_FORMAT_PROBE
+        for api_format in available_api_formats() + [API.API_FORMAT]:
+            try:
+                deserializer_fct_for(api_format)(
+                    await self.safe_urlopen(self.url(api_namespace, api_endpoint), data=probe_data, api_format=api_format),
+                )
+                break
+            except Exception as e:
+                if self.debug:
+                    self.log.warning('Server did not answer in api_format={0}: {1}'.format(api_format, e))
+        (self.deserializer_fct, self.api_format) = (deserializer_fct_for(api_format), api_format)
+        return api_format
+
+    async def async_negotiate_api_format(self) -> str:
+        '''Coroutine counterpart of negotiate_api_format(); concurrent callers share a single negotiation.'''
+        import asyncio
+        if self.negotiation is None:
+            self.negotiation = asyncio.ensure_future(self.probe_api_formats())
+        return await self.negotiation
+
+    async def safe_urlopen(self, base_url: str, data: Union[Dict[str, Any], List[Tuple[str, Any]]] = {}, method: str = 'GET', retry_number: int = 1, api_format: Optional[str] = None, request: Optional[Tuple[str, Union[None, bytes, MultipartBody], Dict[str, str]]] = None) -> str:
+        '''Response content; retries send the same prepared request, so that file values are sent again from their initial position.'''
+        import asyncio
+        if api_format is None and self.api_format == 'auto':
+            await self.async_negotiate_api_format()
+        data_items = self.request_items(data, api_format=api_format)
+        full_url = base_url
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.maximum_concurrency)
+
+        if retry_number == 1:
+            self.retry_policy.record_request()
+        try:
+            if request is None:
+                request = self.prepare_request(base_url, data_items, method)
+            (full_url, body, headers) = request
+            if self.debug:
+                self.log.debug('Querying {url}'.format(url=full_url))
+
+            async with self.semaphore:
+                if self.rate_limiter is not None:
+                    await asyncio.sleep(self.rate_limiter.reserve())
+                response = await self.connection_pool.urlopen(
+                    method,
+                    full_url,
+                    body=body,
+                    headers=headers,
+                    timeout=self.timeout,
+                )
+            response_content = self.read_response(response, api_format=api_format)
+        except HTTPError as e:
+            self.log_http_error(e, full_url, data_items, method)
+            delay = self.retry_delay(e, retry_number, method, base_url, full_url)
+        except self.retry_policy.exceptions as e:
+            delay = self.retry_delay(e, retry_number, method, base_url, full_url)
+        except URLError as e:
+            raise Exception([full_url, str(e)])
+        else:
+            return response_content
+
+        await asyncio.sleep(delay)
+        return await self.safe_urlopen(base_url, data=data, method=method, retry_number=retry_number + 1, api_format=api_format, request=request)
+
+    async def fetch_molids(self, base_url: str, data: Dict[str, Any] = {}, method: str = 'GET', with_reference: bool = False, merge_fct: Callable[[List[API_RESPONSE]], API_RESPONSE] = merge_responses) -> API_RESPONSE:
+        '''Coroutine counterpart of API.fetch_molids(), sending the chunks concurrently.'''
+        import asyncio
+        async def fetch_chunk(chunk_data: Dict[str, Any]) -> API_RESPONSE:
+            return self.deserialize(await self.safe_urlopen(base_url, data=chunk_data, method=method))
+
+        molids = molid_list_for(data['molids']) if 'molids' in data else []
+        (reference, molids) = (molids[:1], molids[1:]) if with_reference else ([], molids)
+        chunks = [molids[i:i + self.molids_chunk_size] for i in range(0, len(molids), self.molids_chunk_size)]
+        if len(chunks) <= 1:
+            return await fetch_chunk(data)
+
+        outcomes = await asyncio.gather(
+            *[fetch_chunk(add_dicts(data, dict(molids=','.join(map(str, reference + chunk))))) for chunk in chunks],
+            return_exceptions=True
+        )
+        results = [outcome for outcome in outcomes if not isinstance(outcome, Exception)]
+        errors = [(chunk, outcome) for (chunk, outcome) in zip(chunks, outcomes) if isinstance(outcome, Exception)]
+        if errors:
+            raise ChunkedRequestError(errors, merge_fct(results) if results else None)
+        return merge_fct(results)
+
+    def transport_statistics(self) -> Dict[str, Any]:
+        return self.connection_pool.statistics()
+
+    def close(self) -> None:
+        self.connection_pool.clear()
+
+def sync_only(function_name: str) -> Callable[..., Any]:
+    def function(self, *args: Any, **kwargs: Any) -> Any:
+        raise TypeError('{0}() is not supported on AsyncAPI; use API instead'.format(function_name))
+    function.__name__ = function_name
+    return function
+
+class AsyncJobs(Jobs):
+    async def finished(self, molids: List[int] = [], qm_logs: List[str] = [], current_qm_levels: List[int] = [], method: str = 'POST', **kwargs: Dict[str, Any]) -> API_RESPONSE:
+        return self.api.deserialize(
+            await self.api.safe_urlopen(
+                self.url('finished'),
+                data=self.finished_data(molids, qm_logs, current_qm_levels, kwargs),
+                method=method,
+            ),
+        )['accepted_molids']
+
+class AsyncRMSD(RMSD):
+    async def align(self, **kwargs) -> API_RESPONSE:
+        return await self.api.fetch_molids(self.url('align'), data=self.rmsd_parameters(kwargs), method='POST', with_reference=True, merge_fct=merge_align_responses)
+
+    async def matrix(self, **kwargs) -> API_RESPONSE:
+        response_content = await self.api.safe_urlopen(self.url('matrix'), data=self.rmsd_parameters(kwargs), method='POST')
+        return self.api.deserialize(response_content)
+
+    tiled_matrix = sync_only('tiled_matrix')
+
+class AsyncMolecules(Molecules):
+    handles = sync_only('handles')
+    iter_search = sync_only('iter_search')
+
+    async def search(self, **kwargs) -> Any:
+        if kwargs.get('return_type') == 'lazy':
+            raise TypeError("search(return_type='lazy') is not supported on AsyncAPI; use API instead")
+        response_content = await self.api.safe_urlopen(self.url('search'), data=self.search_parameters(kwargs), method='GET')
+        return self.search_results(self.api.deserialize(response_content), kwargs)
+
+    async def download_file(self, **kwargs: Dict[str, Any]) -> Union[None, ATB_OUTPUT]:
+        (url, data, deserializer_fct) = self.download_request(kwargs)
+        response_content = await self.api.safe_urlopen(url, data=data, method='GET')
+        if 'checksum' in kwargs:
+            verify_checksum(response_content, kwargs['checksum'], url)
+        return self.write_to_file_or_return(kwargs, response_content, deserializer_fct)
+
+    async def download_many(self, molids: List[ATB_MOLID], atb_formats: List[str], out_dir: str = '.', workers: int = Molecules.DOWNLOAD_WORKERS, max_in_flight: Optional[int] = None, fnme_template: str = '{molid}.{atb_format}', progress_callback: Optional[Callable[[Tuple[ATB_MOLID, str], Any, int, int], None]] = None, **kwargs: Dict[str, Any]) -> Dict[Tuple[ATB_MOLID, str], Any]:
+        '''Coroutine counterpart of Molecules.download_many() (duplicates are downloaded once); at most `max_in_flight` (default: `workers`) downloads run at once.'''
+        import asyncio
+        makedirs(out_dir, exist_ok=True)
+        # Duplicate molids (or formats) would download to the same file concurrently, so each item is downloaded once
+        items = list(OrderedDict.fromkeys((molid, atb_format) for molid in molids for atb_format in atb_formats))
+        in_flight = asyncio.Semaphore(max_in_flight if max_in_flight is not None else workers)
+        results = {}
+
+        async def download(item: Tuple[ATB_MOLID, str]) -> None:
+            (molid, atb_format) = item
+            fnme = join(out_dir, fnme_template.format(molid=molid, atb_format=atb_format))
+            async with in_flight:
+                try:
+                    await self.download_file(molid=molid, atb_format=atb_format, fnme=fnme, **kwargs)
+                    result = fnme
+                except Exception as e:
+                    result = e
+            results[item] = result
+            if progress_callback is not None:
+                progress_callback(item, result, len(results), len(items))
+
+        await asyncio.gather(*[download(item) for item in items])
+        return results
+
+    async def molid(self, molid: Optional[ATB_MOLID] = None, molids: Optional[List[ATB_MOLID]] = None, **kwargs: Dict[str, Any]) -> Union[ATB_Mol, List[ATB_Mol]]:
+        response_content = await self.api.safe_urlopen(self.url('molid'), data=self.molid_parameters(molid, molids, kwargs), method='GET')
+        return self.molid_results(self.api.deserialize(response_content), molid, molids, kwargs)
+
+    async def molids(self, **kwargs: Dict[str, Any]) -> List[ATB_Mol]:
+        return await self.molid(**kwargs)
+
+    async def structure_search(self, method: str = 'POST', **kwargs) -> API_RESPONSE:
+        assert all([ arg in kwargs for arg in ('structure', 'netcharge', 'structure_format') ])
+        response_content = await self.api.safe_urlopen(self.url('structure_search'), data=kwargs, method=method)
+        return self.api.deserialize(response_content)
+
+    async def submit(self, request='POST', **kwargs) -> API_RESPONSE:
+        assert all([arg in kwargs for arg in ('netcharge', 'public', 'moltype') ]) and len([True for arg in ['pdb', 'smiles'] if arg in kwargs]) == 1
+        response_content = await self.api.safe_urlopen(self.url('submit'), data=kwargs, method=request)
+        return self.api.deserialize(response_content)
+
+class AsyncStatistics(Statistics):
+    pass
+
+ASYNC_NAMESPACES = {
+    Molecules: AsyncMolecules,
+    Jobs: AsyncJobs,
+    Statistics: AsyncStatistics,
+}
+
+def async_function_for(function_name: str, maybe_key: Optional[str], default_method: str) -> Callable[..., Any]:
+    async def function(self, method=default_method, **kwargs):
+        return get_maybe_key(
+            self.api.deserialize(await self.api.safe_urlopen(self.url(api_endpoint=function_name), data=kwargs, method=method)),
+            maybe_key,
+        )
+    function.__name__ = function_name
+    return function
+
+for namespace in METHODS.keys():
+    for (function_name, maybe_key, default_method) in METHODS[namespace]:
+        setattr(
+            ASYNC_NAMESPACES[namespace],
+            function_name,
+            async_function_for(function_name, maybe_key, default_method),
+        )
+
 def test_api_client():
     api = API(api_token='<put your token here>', debug=True, api_format='yaml', host='https://atb.uq.edu.au', debug_stream=sys.stderr, timeout=30, maximum_attempts=5)
 
@@ -0,0 +1,29 @@
+import sys
+from os.path import abspath, dirname, join
+from threading import Thread
+
+ROOT_DIR = dirname(dirname(abspath(__file__)))
+sys.path[0:0] = [join(ROOT_DIR, 'src3'), ROOT_DIR]
+
+import pytest
+
+from benchmark_atb_api import ThreadingHTTPServer, RecordedShapeHandler, JobsStandInHandler
+
+def serve(handler_class: type):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+    Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield 'http://127.0.0.1:{0}'.format(server.server_address[1])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def recorded_shape_host():
+    RecordedShapeHandler.configure(0., 100, 4096)
+    yield from serve(RecordedShapeHandler)
+
+@pytest.fixture
+def jobs_host():
+    JobsStandInHandler.reset(0)
+    yield from serve(JobsStandInHandler)
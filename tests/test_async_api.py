@@ -0,0 +1,57 @@
+import asyncio
+from os.path import getsize
+
+import pytest
+
+from atb_api import AsyncAPI, AsyncConnectionPool, AsyncMolecules
+
+def run(host: str, function):
+    async def main():
+        api = AsyncAPI(host=host, api_token='test', api_format='json')
+        try:
+            return await function(api)
+        finally:
+            api.close()
+    return asyncio.run(main())
+
+def test_download_many_writes_files(recorded_shape_host, tmp_path):
+    results = run(
+        recorded_shape_host,
+        lambda api: api.Molecules.download_many([1, 2, 3], ['pdb_aa', 'mtb_aa'], out_dir=str(tmp_path), workers=2),
+    )
+    assert sorted(results) == [(molid, atb_format) for molid in (1, 2, 3) for atb_format in ('mtb_aa', 'pdb_aa')]
+    for path in results.values():
+        assert isinstance(path, str) and getsize(path) > 0
+
+def test_sync_only_helpers_raise(recorded_shape_host):
+    api = AsyncAPI(host=recorded_shape_host, api_token='test', api_format='json')
+    for function in (
+        lambda: api.RMSD.tiled_matrix(molids=[1, 2, 3]),
+        lambda: api.Molecules.iter_search(any='ethanol'),
+        lambda: api.Molecules.handles([1, 2]),
+        lambda: asyncio.run(api.Molecules.search(any='ethanol', return_type='lazy')),
+    ):
+        with pytest.raises(TypeError, match='not supported on AsyncAPI'):
+            function()
+
+def test_responses_are_compressed(recorded_shape_host):
+    async def search(api: AsyncAPI) -> tuple:
+        molecules = await api.Molecules.search(any='ethanol')
+        return (molecules, api.transport_statistics()['compression'])
+    (molecules, compression) = run(recorded_shape_host, search)
+    assert len(molecules) == 100
+    assert compression['compressed_responses'] == 1 and compression['decompressed_bytes'] > compression['compressed_bytes'] > 0
+
+def test_construction_builds_no_sync_transport():
+    api = AsyncAPI(api_token='test')
+    assert isinstance(api.connection_pool, AsyncConnectionPool) and isinstance(api.Molecules, AsyncMolecules)
+    assert not hasattr(api, 'transport')
+
+def test_download_many_downloads_duplicates_once(recorded_shape_host, tmp_path):
+    progress = []
+    results = run(
+        recorded_shape_host,
+        lambda api: api.Molecules.download_many([1, 1, 2], ['pdb_aa'], out_dir=str(tmp_path), progress_callback=lambda *arguments: progress.append(arguments[2:])),
+    )
+    assert sorted(results) == [(1, 'pdb_aa'), (2, 'pdb_aa')]
+    assert progress == [(1, 2), (2, 2)]
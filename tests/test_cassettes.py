@@ -0,0 +1,77 @@
+import gzip
+import json
+from io import BytesIO
+from urllib.error import HTTPError, URLError
+
+import pytest
+
+from atb_api import API, InProcessTransport, RecordingTransport, ReplayTransport
+
+API_TOKEN = 'recording-secret-token'
+
+class CountingHandler(object):
+    '''Answers every request with its method, path and number; molid 404 is not found.'''
+    def __init__(self) -> None:
+        self.requests = 0
+
+    def __call__(self, method: str, url: str, headers: dict, body: bytes) -> tuple:
+        self.requests += 1
+        if 'molid=404' in url:
+            return (404, {'Content-Type': 'text/plain'}, b'Not Found')
+        content = dict(method=method, path=url.split('?')[0], request=self.requests, body_bytes=len(body))
+        return (200, {'Content-Type': 'application/json'}, json.dumps(content).encode())
+
+def exchanges(api: API) -> list:
+    return [
+        api.fetch(api.url('molecules', 'molid'), data=dict(molid=21)),
+        api.fetch(api.url('molecules', 'molid'), data=dict(molid=21)),
+        api.fetch(api.url('molecules', 'search'), data=dict(any='ethanol'), method='POST'),
+        api.fetch(api.url('rmsd', 'align'), data=[('molids', '21,22'), ('pdb', BytesIO(b'ATOM' * 100))], method='POST'),
+    ]
+
+def test_replayed_responses_match_the_recorded_ones(tmp_path):
+    cassette = str(tmp_path / 'exchanges.jsonl.gz')
+    handler = CountingHandler()
+    recording_api = API(host='http://stand-in', api_token=API_TOKEN, api_format='json', transport=RecordingTransport(cassette, transport=InProcessTransport(handler)))
+    recorded = exchanges(recording_api)
+    with pytest.raises(HTTPError):
+        recording_api.fetch(recording_api.url('molecules', 'molid'), data=dict(molid=404))
+    assert handler.requests == 5 and recording_api.transport.statistics()['recorded'] == 5
+
+    # Replayed with another token, without calling the handler
+    replay_api = API(host='http://stand-in', api_token='any-token', api_format='json', transport=ReplayTransport(cassette))
+    assert exchanges(replay_api) == recorded
+    # Exchanges recorded twice are replayed in order, then the last one again
+    assert [response['request'] for response in recorded[:2]] == [1, 2]
+    assert replay_api.fetch(replay_api.url('molecules', 'molid'), data=dict(molid=21))['request'] == 2
+    with pytest.raises(HTTPError) as error:
+        replay_api.fetch(replay_api.url('molecules', 'molid'), data=dict(molid=404))
+    assert error.value.code == 404
+    assert handler.requests == 5
+    statistics = replay_api.transport.statistics()
+    assert (statistics['replayed'], statistics['missing']) == (6, 0)
+
+def test_unrecorded_requests_are_missing(tmp_path):
+    cassette = str(tmp_path / 'exchanges.jsonl.gz')
+    api = API(host='http://stand-in', api_token=API_TOKEN, api_format='json', transport=RecordingTransport(cassette, transport=InProcessTransport(CountingHandler())))
+    api.fetch(api.url('molecules', 'molid'), data=dict(molid=21))
+    transport = ReplayTransport(cassette)
+    with pytest.raises(URLError):
+        transport.urlopen('GET', api.url('molecules', 'molid') + '?molid=22&api_format=json')
+    assert transport.statistics()['missing'] == 1
+
+def test_api_token_is_never_written(tmp_path):
+    cassette = str(tmp_path / 'exchanges.jsonl.gz')
+    api = API(host='http://stand-in', api_token=API_TOKEN, api_format='json', transport=RecordingTransport(cassette, transport=InProcessTransport(CountingHandler())))
+    exchanges(api)
+    with gzip.open(cassette, 'rb') as fh:
+        lines = fh.read().decode().splitlines()
+    assert len(lines) == 4
+    assert all(API_TOKEN not in line and 'api_token' not in json.loads(line)['url'] for line in lines)
+    # Tokens do not change the keys of requests, whichever way the token was sent
+    transport = ReplayTransport(cassette)
+    for (method, url, body) in (
+        ('GET', api.url('molecules', 'molid') + '?molid=21&api_token=other&api_format=json', None),
+        ('POST', api.url('molecules', 'search'), b'any=ethanol&api_token=other&api_format=json'),
+    ):
+        assert transport.cassette.key_for(method, url, body) in transport.exchanges
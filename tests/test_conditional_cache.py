@@ -0,0 +1,59 @@
+import gc
+from os import listdir
+
+import atb_api
+from atb_api import ConditionalCache, ConditionalTransport, ConnectionPool
+
+def download_url(host: str) -> str:
+    return '{0}/api/current/molecules/download_file.py?molid=21&outputType=top&file=pdb_allatom_optimised'.format(host)
+
+def temporary_files(directory: str) -> list:
+    return [fnme for fnme in listdir(directory) if fnme.endswith('.tmp')]
+
+def test_partly_read_responses_leave_no_temporary_file(recorded_shape_host, tmp_path):
+    cache = ConditionalCache(str(tmp_path))
+    transport = ConditionalTransport(ConnectionPool(), cache)
+
+    response = transport.urlopen('GET', download_url(recorded_shape_host))
+    response.read(10)
+    assert len(temporary_files(str(tmp_path))) == 1
+    response.close()
+    assert not temporary_files(str(tmp_path))
+
+    response = transport.urlopen('GET', download_url(recorded_shape_host))
+    response.read(10)
+    del response
+    gc.collect()
+    assert not temporary_files(str(tmp_path))
+    assert cache.statistics()['stored'] == 0
+
+def test_read_responses_are_stored(recorded_shape_host, tmp_path):
+    cache = ConditionalCache(str(tmp_path))
+    transport = ConditionalTransport(ConnectionPool(), cache)
+    content = transport.urlopen('GET', download_url(recorded_shape_host)).read()
+    assert transport.urlopen('GET', download_url(recorded_shape_host)).read() == content
+    assert (cache.statistics()['stored'], cache.statistics()['not_modified']) == (1, 1)
+    assert not temporary_files(str(tmp_path))
+
+def store(cache: ConditionalCache, url: str, content: bytes) -> str:
+    key = cache.key_for(url)
+    temporary_fnme = cache.temporary_fnme(key)
+    with open(temporary_fnme, 'wb') as fh:
+        fh.write(content)
+    cache.commit(key, temporary_fnme, {'ETag': '"{0}"'.format(len(content))})
+    return key
+
+def test_eviction_uses_the_in_memory_index(tmp_path, monkeypatch):
+    cache = ConditionalCache(str(tmp_path), maximum_bytes=100)
+    def no_listdir(path):
+        raise AssertionError('Listed {0}'.format(path))
+    monkeypatch.setattr(atb_api, 'listdir', no_listdir)
+    (key_a, key_b) = (store(cache, 'http://stand-in/a', b'A' * 60), store(cache, 'http://stand-in/b', b'B' * 30))
+    assert cache.get(key_a)['size'] == 60
+    key_c = store(cache, 'http://stand-in/c', b'C' * 30)
+    assert cache.get(key_b) is None and cache.get(key_a) is not None and cache.get(key_c) is not None
+    assert (cache.statistics()['total_bytes'], cache.statistics()['entries'], cache.statistics()['evictions']) == (90, 2, 1)
+
+    monkeypatch.undo()
+    reopened_cache = ConditionalCache(str(tmp_path), maximum_bytes=100)
+    assert (reopened_cache.statistics()['total_bytes'], reopened_cache.statistics()['entries']) == (90, 2)
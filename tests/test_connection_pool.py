@@ -0,0 +1,38 @@
+import gc
+
+import pytest
+
+from atb_api import API, ConnectionPool
+
+def download_url(host: str) -> str:
+    return '{0}/api/current/molecules/download_file.py?molid=21&outputType=top&file=pdb_allatom_optimised'.format(host)
+
+def test_slot_released_when_connecting_fails():
+    pool = ConnectionPool()
+    with pytest.raises(Exception, match='Unsupported URL scheme'):
+        pool.send('GET', 'ftp://127.0.0.1/')
+    assert pool.statistics()['in_use'] == 0
+
+def test_slot_released_when_sending_the_body_fails(recorded_shape_host):
+    def failing_body():
+        yield b'molid=21'
+        raise ValueError('Could not read upload')
+
+    pool = ConnectionPool()
+    with pytest.raises(ValueError):
+        pool.send('POST', download_url(recorded_shape_host), body=failing_body())
+    assert pool.statistics()['in_use'] == 0
+
+def test_unread_responses_are_released(recorded_shape_host, tmp_path):
+    pool = ConnectionPool()
+    response = pool.urlopen('GET', download_url(recorded_shape_host))
+    response.read(10)
+    assert pool.statistics()['in_use'] == 1
+    del response
+    gc.collect()
+    assert pool.statistics()['in_use'] == 0
+
+    api = API(host=recorded_shape_host, api_token='test', api_format='json', connection_pool=pool)
+    with pytest.raises(FileNotFoundError):
+        api.Molecules.download_file(molid=21, atb_format='pdb_aa', fnme=str(tmp_path / 'missing' / '21.pdb'))
+    assert pool.statistics()['in_use'] == 0
@@ -0,0 +1,66 @@
+import json
+from time import monotonic, sleep
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from atb_api import API, InProcessTransport, ChunkedRequestError, JobPipeline
+from benchmark_atb_api import JobsStandInHandler, stand_in_qm_calculation
+
+class JobsHandler(object):
+    def __init__(self, failing_request: int = None) -> None:
+        self.failing_request = failing_request
+        self.requests = []
+
+    def __call__(self, method: str, url: str, headers: dict, body: bytes) -> tuple:
+        parameters = parse_qs(urlsplit(url).query)
+        parameters.update(parse_qs(body.decode()) if body else {})
+        self.requests.append(parameters)
+        if len(self.requests) == self.failing_request:
+            return (500, {'Content-Type': 'text/plain'}, b'Internal Server Error')
+        molids = parameters.get('molid', []) + [molid for value in parameters.get('molids', []) for molid in value.split(',')]
+        content = dict(molids=[int(molid) for molid in molids], accepted_molids=[int(molid) for molid in molids])
+        return (200, {'Content-Type': 'application/json'}, json.dumps(content).encode())
+
+def api_for(handler: JobsHandler) -> API:
+    return API(host='http://stand-in', api_token='test', api_format='json', transport=InProcessTransport(handler), molids_chunk_size=2)
+
+def test_single_molid():
+    handler = JobsHandler()
+    assert api_for(handler).Jobs.release(molids=5) == [5]
+    assert handler.requests[0]['molids'] == ['5']
+
+def test_finished_stops_at_the_first_failed_chunk():
+    handler = JobsHandler(failing_request=2)
+    with pytest.raises(ChunkedRequestError) as error_info:
+        api_for(handler).Jobs.finished(molids=[1, 2, 3, 4, 5, 6], qm_logs=['log'] * 6, current_qm_levels=[1] * 6)
+    assert len(handler.requests) == 2
+    assert error_info.value.result == [1, 2]
+    assert [molids for (molids, _) in error_info.value.errors] == [[3, 4]]
+    assert error_info.value.pending == [5, 6]
+
+def failing_qm_calculation(job: dict) -> tuple:
+    if job['molid'] % 5 == 0:
+        raise RuntimeError('SCF did not converge')
+    return stand_in_qm_calculation(job)
+
+def run_pipeline(host: str, compute_fct, n_jobs: int) -> dict:
+    JobsStandInHandler.reset(n_jobs)
+    api = API(host=host, api_token='test', api_format='json')
+    pipeline = JobPipeline(api, compute_fct, processes=2, upload_batch_size=5, upload_interval=0.1, poll_interval=0.05)
+    with pipeline:
+        deadline = monotonic() + 60.
+        while len(JobsStandInHandler.finished | JobsStandInHandler.released) < n_jobs and monotonic() < deadline:
+            sleep(0.05)
+    return pipeline.statistics()
+
+def test_job_pipeline_finishes_every_job(jobs_host):
+    statistics = run_pipeline(jobs_host, stand_in_qm_calculation, 30)
+    assert JobsStandInHandler.finished == set(range(30)) and not JobsStandInHandler.released
+    assert (statistics['accepted'], statistics['computed'], statistics['finished'], statistics['errors']) == (30, 30, 30, 0)
+
+def test_job_pipeline_releases_failed_jobs(jobs_host):
+    statistics = run_pipeline(jobs_host, failing_qm_calculation, 30)
+    assert JobsStandInHandler.released == set(range(0, 30, 5))
+    assert JobsStandInHandler.finished == set(range(30)) - JobsStandInHandler.released
+    assert (statistics['failed'], statistics['finished']) == (6, 24)
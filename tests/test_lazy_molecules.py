@@ -0,0 +1,64 @@
+import json
+from math import ceil
+from threading import Event, Lock, Thread
+from time import sleep
+from urllib.parse import parse_qs, urlparse
+
+from atb_api import API, Hydrator, InProcessTransport
+
+class MolidHandler(object):
+    '''Answers molid.py requests, recording the molids of each; the first request is held until released.'''
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.requested_molids = []
+        (self.first_request_started, self.first_request_released) = (Event(), Event())
+        self.first_request_released.set()
+
+    def __call__(self, method: str, url: str, headers: dict, body: bytes) -> tuple:
+        molids = parse_qs(urlparse(url).query)['molids'][0].split(',')
+        with self.lock:
+            self.requested_molids.append(molids)
+            is_first = len(self.requested_molids) == 1
+        if is_first:
+            self.first_request_started.set()
+            assert self.first_request_released.wait(10)
+        content = dict(molecules=[dict(molid=int(molid), inchi='InChI={0}'.format(molid)) for molid in molids])
+        return (200, {'Content-Type': 'application/json'}, json.dumps(content).encode())
+
+def api_for(handler: MolidHandler, batch_size: int) -> API:
+    api = API(host='http://stand-in', api_token='test', api_format='json', transport=InProcessTransport(handler))
+    api.Molecules.hydrator = Hydrator(api.Molecules, batch_size=batch_size, batch_window=0.)
+    return api
+
+def test_handles_are_fetched_in_batches():
+    handler = MolidHandler()
+    api = api_for(handler, batch_size=3)
+    handles = api.Molecules.handles(list(range(1, 8)))
+    assert handler.requested_molids == []
+    assert [handle.inchi for handle in handles] == ['InChI={0}'.format(molid) for molid in range(1, 8)]
+    assert len(handler.requested_molids) == ceil(7 / 3)
+    assert handler.requested_molids == [['1', '2', '3'], ['4', '5', '6'], ['7']]
+    assert api.Molecules.hydrator.statistics() == dict(batches=3, molecules=7, pending=0, in_flight=0)
+
+def test_handles_in_a_batch_in_flight_are_not_fetched_again():
+    handler = MolidHandler()
+    handler.first_request_released.clear()
+    api = api_for(handler, batch_size=2)
+    handles = api.Molecules.handles([1, 2, 3, 4])
+    inchis = {}
+    def read_inchi(i: int) -> None:
+        inchis[i] = handles[i].inchi
+    threads = [Thread(target=read_inchi, args=(0,))]
+    threads[0].start()
+    assert handler.first_request_started.wait(10)
+    # Handle 1 waits for the batch in flight; handle 2 starts the next batch, without 1
+    threads += [Thread(target=read_inchi, args=(i,)) for i in (1, 2)]
+    for thread in threads[1:]:
+        thread.start()
+    sleep(0.05)
+    handler.first_request_released.set()
+    for thread in threads:
+        thread.join(10)
+    assert inchis == {0: 'InChI=1', 1: 'InChI=2', 2: 'InChI=3'}
+    assert handles[3].inchi == 'InChI=4'
+    assert handler.requested_molids == [['1', '2'], ['3', '4']]
@@ -0,0 +1,108 @@
+import json
+import sys
+from os.path import abspath, dirname, join
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import atb_api
+from atb_api import API, InProcessTransport, LocalRMSD, RecordingTransport, ReplayTransport, kabsch_rmsds, pdb_atoms, process_pool_executor
+from benchmark_atb_api import pairwise_kabsch_rmsd
+
+numpy = pytest.importorskip('numpy')
+
+# Recorded with `PYTHONPATH=src3 python tests/test_local_rmsd.py [<api_token>]`: from the ATB server given a token,
+# otherwise from reference_server(), which computes each RMSD with the single-pair reference implementation
+SERVER_CASSETTE = join(dirname(abspath(__file__)), 'data', 'rmsd_server.jsonl.gz')
+ETHANOL_MOLIDS = [15608, 23009, 26394]
+ETHANOL_ATOMS = [
+    ('C1', (-1.168, 0.242, 0.000)),
+    ('C2', (0.213, -0.375, 0.000)),
+    ('O1', (1.190, 0.651, 0.000)),
+    ('H1', (-1.921, -0.547, 0.000)),
+    ('H2', (-1.316, 0.869, 0.882)),
+    ('H3', (-1.316, 0.869, -0.882)),
+    ('H4', (0.344, -1.010, 0.880)),
+    ('H5', (0.344, -1.010, -0.880)),
+    ('H6', (2.050, 0.224, 0.000)),
+]
+
+def ethanol_pdb(i: int) -> str:
+    '''A rotated, translated and (for i > 0) distorted ethanol conformer.'''
+    random = numpy.random.RandomState(i)
+    (rotation, _) = numpy.linalg.qr(random.normal(size=(3, 3)))
+    coordinates = numpy.array([xyz for (_, xyz) in ETHANOL_ATOMS]) + 0.1 * i * random.normal(size=(len(ETHANOL_ATOMS), 3))
+    coordinates = coordinates.dot(rotation.T) + random.normal(size=3)
+    return '\n'.join(
+        'ATOM  {0:5d} {1:<4s} EOH     1    {2:8.3f}{3:8.3f}{4:8.3f}  1.00  0.00           {5}'.format(n + 1, name, x, y, z, name[0])
+        for (n, ((name, _), (x, y, z))) in enumerate(zip(ETHANOL_ATOMS, coordinates))
+    ) + '\nEND\n'
+
+def reference_server(method: str, url: str, headers: dict, body: bytes) -> tuple:
+    parameters = {key: values[0] for (key, values) in parse_qs(urlsplit(url).query).items()}
+    parameters.update({key: values[0] for (key, values) in parse_qs(body.decode()).items()} if body else {})
+    pdbs = {str(molid): ethanol_pdb(i) for (i, molid) in enumerate(ETHANOL_MOLIDS)}
+    if url.split('?')[0].endswith('download_file.py'):
+        return (200, {'Content-Type': 'text/plain'}, pdbs[parameters['molid']].encode())
+    molids = parameters['molids'].split(',')
+    coordinates = [pdb_atoms(pdbs[molid])[1] for molid in molids]
+    if url.split('?')[0].endswith('align.py'):
+        content = dict(molids=molids, rmsds=[pairwise_kabsch_rmsd(coordinates[0], xyz) for xyz in coordinates])
+    else:
+        content = dict(molids=molids, matrix=[[pairwise_kabsch_rmsd(a, b) for b in coordinates] for a in coordinates])
+    return (200, {'Content-Type': 'application/json'}, json.dumps(content).encode())
+
+def record_server_cassette(api_token: str = None) -> None:
+    if api_token is None:
+        api = API(api_token='test', api_format='json', transport=RecordingTransport(SERVER_CASSETTE, transport=InProcessTransport(reference_server)))
+    else:
+        api = API(api_token=api_token, api_format='json', timeout=60, transport=RecordingTransport(SERVER_CASSETTE))
+    for molid in ETHANOL_MOLIDS:
+        api.Molecules.download_file(molid=molid, atb_format='pdb_aa')
+    api.RMSD.align(molids=ETHANOL_MOLIDS)
+    api.RMSD.matrix(molids=ETHANOL_MOLIDS)
+
+def test_kabsch_rmsds_of_superposable_structures():
+    random = numpy.random.RandomState(0)
+    reference = random.normal(size=(20, 3))
+    (rotation, _) = numpy.linalg.qr(random.normal(size=(3, 3)))
+    rotation *= numpy.sign(numpy.linalg.det(rotation))
+    structures = numpy.array([reference.dot(rotation.T) + 5., reference + 0.3 * random.normal(size=(20, 3))])
+    rmsds = kabsch_rmsds(reference, structures)
+    assert rmsds[0] == pytest.approx(0., abs=1e-6)
+    assert rmsds[1] == pytest.approx(pairwise_kabsch_rmsd(reference, structures[1]))
+
+def test_align_has_the_server_response_shape(recorded_shape_host):
+    (remote, local) = [
+        API(host=recorded_shape_host, api_token='test', api_format='json', rmsd_backend=rmsd_backend).RMSD.align(molids=[1, 2, 3])
+        for rmsd_backend in ('remote', 'local')
+    ]
+    assert sorted(local.keys()) == sorted(remote.keys()) == ['molids', 'rmsds']
+    assert [str(molid) for molid in local['molids']] == [str(molid) for molid in remote['molids']]
+    assert len(local['rmsds']) == len(remote['rmsds']) and local['rmsds'][0] == pytest.approx(0.)
+
+def test_matrix_in_worker_processes_matches_serial_matrix(monkeypatch):
+    api = API(api_token='test', api_format='json', transport=ReplayTransport(SERVER_CASSETTE))
+    serial = LocalRMSD(api, processes=1).matrix(molids=ETHANOL_MOLIDS)
+    start_methods = []
+    def recording_process_pool_executor(max_workers: int, start_method: str = None):
+        executor = process_pool_executor(max_workers, start_method=start_method)
+        start_methods.append(executor._mp_context.get_start_method())
+        return executor
+    monkeypatch.setattr(atb_api, 'process_pool_executor', recording_process_pool_executor)
+    monkeypatch.setattr(LocalRMSD, 'PROCESS_PAIRS', 0)
+    assert LocalRMSD(api, processes=2).matrix(molids=ETHANOL_MOLIDS) == serial
+    assert start_methods and start_methods[0] != 'fork'
+
+def test_matches_recorded_server_results():
+    (remote, local) = [
+        API(api_token='test', api_format='json', rmsd_backend=rmsd_backend, transport=ReplayTransport(SERVER_CASSETTE)).RMSD
+        for rmsd_backend in ('remote', 'local')
+    ]
+    (remote_align, local_align) = (remote.align(molids=ETHANOL_MOLIDS), local.align(molids=ETHANOL_MOLIDS))
+    assert [str(molid) for molid in local_align['molids']] == [str(molid) for molid in remote_align['molids']]
+    assert numpy.allclose(local_align['rmsds'], remote_align['rmsds'], atol=1e-3)
+    assert numpy.allclose(local.matrix(molids=ETHANOL_MOLIDS)['matrix'], remote.matrix(molids=ETHANOL_MOLIDS)['matrix'], atol=1e-3)
+
+if __name__ == '__main__':
+    record_server_cassette(*sys.argv[1:2])
@@ -0,0 +1,51 @@
+import sys
+
+import pytest
+
+from atb_api import CategoricalColumn, MoleculeTable
+
+numpy = pytest.importorskip('numpy')
+
+MOLECULE_DICTS = [
+    dict(molid=21, net_charge=0, molecular_weight=46.07, formula='C2H6O', inchi='InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3', iupac=None),
+    dict(molid=15608, net_charge=-1, molecular_weight=45.06, formula='C2H5O', inchi='InChI=1S/' + 'C' * 400, iupac='ethanolate'),
+    dict(molid=23009, net_charge=0, molecular_weight=None, formula='C2H6O', inchi='InChI=1S/C2H6O/c1-3-2/h1-2H3', iupac='methoxymethane'),
+]
+
+def test_column_dtypes():
+    table = MoleculeTable.from_dicts(None, MOLECULE_DICTS)
+    assert table['molid'].dtype == numpy.int64
+    assert table['net_charge'].dtype == numpy.int64
+    assert table['molecular_weight'].dtype == numpy.float64 and numpy.isnan(table['molecular_weight'][2])
+    for key in ('formula', 'inchi', 'iupac'):
+        assert isinstance(table[key], CategoricalColumn)
+    assert table['formula'].tolist() == ['C2H6O', 'C2H5O', 'C2H6O'] and table['iupac'][0] is None
+    assert table[1].iupac == 'ethanolate' and table[0].iupac is None
+    assert table.where(formula='C2H6O').molids == [21, 23009]
+    assert table.where(iupac=['ethanolate']).molids == [15608]
+    assert table.where(iupac=[None]).molids == [21]
+    assert table[table['formula'] != 'C2H6O'].molids == [15608]
+
+def test_strings_are_stored_compactly():
+    formulas = ['C{0}H{1}O'.format(2 + i % 20, 6 + i % 7) for i in range(10000)]
+    column = MoleculeTable.from_dicts(None, [dict(formula=formula) for formula in formulas])['formula']
+    # Payload of an object array: one pointer per row, and one str object per distinct value
+    object_array_bytes = len(formulas) * numpy.dtype(object).itemsize + sum(sys.getsizeof(formula) for formula in set(formulas))
+    assert column.nbytes == column.codes.nbytes + column.categories.nbytes
+    assert column.nbytes < object_array_bytes / 2
+    assert column.nbytes < numpy.array(formulas).nbytes / 4
+
+def test_to_structured_has_no_object_fields():
+    array = MoleculeTable.from_dicts(None, MOLECULE_DICTS).to_structured()
+    assert not [key for key in array.dtype.names if array.dtype[key].hasobject]
+    assert array['formula'].tolist() == ['C2H6O', 'C2H5O', 'C2H6O']
+    assert array['iupac'].tolist() == ['', 'ethanolate', 'methoxymethane']
+    assert array['inchi'][1] == 'InChI=1S/' + 'C' * 400
+
+def test_numpy_integer_row_index():
+    table = MoleculeTable.from_dicts(None, MOLECULE_DICTS)
+    for index in numpy.flatnonzero(table['net_charge'] == 0):
+        assert table[index].formula == 'C2H6O'
+    assert table[numpy.int64(-2)].molid == 15608
+    with pytest.raises(IndexError):
+        table[numpy.int32(3)]
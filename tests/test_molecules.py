@@ -0,0 +1,75 @@
+import json
+from hashlib import sha256
+from os import listdir
+
+import pytest
+
+from atb_api import API, InProcessTransport, TopologyCache, available_api_formats
+from benchmark_atb_api import recorded_shape_molecule
+
+class IgnoringPaginationHandler(object):
+    def __init__(self, n_molecules: int) -> None:
+        self.n_molecules = n_molecules
+        self.n_requests = 0
+
+    def __call__(self, method: str, url: str, headers: dict, body: bytes) -> tuple:
+        self.n_requests += 1
+        content = dict(molecules=[recorded_shape_molecule(molid) for molid in range(self.n_molecules)])
+        return (200, {'Content-Type': 'application/json'}, json.dumps(content).encode())
+
+def test_iter_search_pages(recorded_shape_host):
+    api = API(host=recorded_shape_host, api_token='test', api_format='json')
+    assert [molecule.molid for molecule in api.Molecules.iter_search(page_size=30, any='ethanol')] == list(range(100))
+
+def test_iter_search_stops_if_server_ignores_pagination():
+    for (n_molecules, n_requests) in [(600, 1), (50, 2)]:
+        handler = IgnoringPaginationHandler(n_molecules)
+        api = API(host='http://stand-in', api_token='test', api_format='json', transport=InProcessTransport(handler))
+        assert len(list(api.Molecules.iter_search(page_size=50, any='ethanol'))) == n_molecules
+        assert handler.n_requests == n_requests
+
+def test_download_file_returns_text_whatever_the_api_format(recorded_shape_host):
+    for api_format in ['json', 'pickle'] + (['msgpack'] if 'msgpack' in available_api_formats() else []):
+        api = API(host=recorded_shape_host, api_token='test', api_format=api_format)
+        assert isinstance(api.Molecules.download_file(molid=21, atb_format='pdb_aa'), str)
+
+PDB = b'ATOM      1  C1  EOH     1       0.000   0.000   0.000  1.00  0.00           C\n'
+
+def download_handler(method: str, url: str, headers: dict, body: bytes) -> tuple:
+    if 'latest_topology_hash.py' in url:
+        return (200, {'Content-Type': 'application/json'}, json.dumps(dict(latest_topology_hash='1')).encode())
+    return (200, {'Content-Type': 'text/plain'}, PDB)
+
+def test_download_file_checksum_mismatch_raises_on_every_path(tmp_path):
+    (good, bad) = ('sha256:' + sha256(PDB).hexdigest(), 'sha256:' + sha256(b'other').hexdigest())
+    (out_dir, cache_dir) = (tmp_path / 'out', tmp_path / 'cache')
+    out_dir.mkdir()
+    for (path, topology_cache, fnme) in [
+        ('streamed', None, out_dir / 'streamed.pdb'),
+        ('in memory', None, None),
+        ('cached', TopologyCache(str(cache_dir)), out_dir / 'cached.pdb'),
+        ('cached, in memory', TopologyCache(str(cache_dir)), None),
+    ]:
+        api = API(host='http://stand-in', api_token='test', api_format='json', transport=InProcessTransport(download_handler), topology_cache=topology_cache)
+        kwargs = dict(molid=21, atb_format='pdb_aa', **(dict(fnme=str(fnme)) if fnme is not None else {}))
+        with pytest.raises(Exception, match='Checksum mismatch'):
+            api.Molecules.download_file(checksum=bad, **kwargs)
+        assert fnme is None or not fnme.exists(), path
+        result = api.Molecules.download_file(checksum=good, **kwargs)
+        assert (fnme.read_bytes() if fnme is not None else result.encode()) == PDB, path
+    # The cache now holds the file: a mismatch on a cache hit raises too
+    with pytest.raises(Exception, match='Checksum mismatch'):
+        api.Molecules.download_file(molid=21, atb_format='pdb_aa', checksum=bad)
+    assert not [fnme for fnme in listdir(str(out_dir)) if fnme.endswith('.tmp')]
+
+def test_download_many_downloads_duplicates_once(recorded_shape_host, tmp_path):
+    api = API(host=recorded_shape_host, api_token='test', api_format='json')
+    progress = []
+    results = api.Molecules.download_many(
+        [1, 2, 1, 2], ['pdb_aa', 'pdb_aa'],
+        out_dir=str(tmp_path),
+        progress_callback=lambda item, result, n_completed, n_total: progress.append((n_completed, n_total)),
+    )
+    assert sorted(results) == [(1, 'pdb_aa'), (2, 'pdb_aa')]
+    assert sorted(progress) == [(1, 2), (2, 2)]
+    assert sorted(listdir(str(tmp_path))) == ['1.pdb_aa', '2.pdb_aa']
@@ -0,0 +1,124 @@
+import asyncio
+import email
+import gzip
+from io import BytesIO
+from threading import Thread
+
+from atb_api import API, AsyncAPI, ConnectionPool, InProcessTransport, MultipartBody, RetryPolicy, chunked_frames
+from benchmark_atb_api import StandInHandler, ThreadingHTTPServer
+
+QM_LOG = bytes(range(256)) * 40
+
+EXPECTED_PARTS = [
+    ('molid', None, b'21'),
+    ('qm_log', 'qm_log', QM_LOG),
+    ('pdb', 'pdb', b'ATOM' * 100),
+    ('current_qm_level', None, b'1'),
+]
+
+def data_items() -> list:
+    # A file positioned after a header, as left by a caller
+    qm_log = BytesIO(b'header' + QM_LOG)
+    qm_log.seek(len(b'header'))
+    return [('molid', 21), ('qm_log', qm_log), ('pdb', b'ATOM' * 100), ('current_qm_level', 1)]
+
+def parts_of(content: bytes, content_type: str) -> list:
+    message = email.message_from_bytes('Content-Type: {0}\r\n\r\n'.format(content_type).encode() + content)
+    assert message.is_multipart() and not message.defects
+    return [(part.get_param('name', header='Content-Disposition'), part.get_filename(), part.get_payload(decode=True)) for part in message.get_payload()]
+
+def unframed(frames: bytes) -> bytes:
+    (stream, chunks) = (BytesIO(frames), [])
+    while True:
+        chunk_size = int(stream.readline().strip(), 16)
+        chunks.append(stream.read(chunk_size))
+        assert stream.read(2) == b'\r\n'
+        if chunk_size == 0:
+            assert stream.read() == b''
+            return b''.join(chunks)
+
+def test_parts_are_framed_with_the_boundary():
+    body = MultipartBody(data_items(), chunk_size=1000)
+    chunks = [bytes(chunk) for chunk in body]
+    (content, headers) = (b''.join(chunks), body.headers())
+    assert int(headers['Content-Length']) == len(content) == body.sent_bytes
+    assert content.endswith('--{0}--\r\n'.format(body.boundary).encode())
+    assert parts_of(content, headers['Content-Type']) == EXPECTED_PARTS
+    # File values are read chunk_size bytes at a time
+    assert max(len(chunk) for chunk in chunks) <= 1000
+
+def test_compressed_body_round_trips_through_gzip():
+    body = MultipartBody(data_items(), compress=True)
+    (content, headers) = (b''.join(bytes(chunk) for chunk in body), body.headers())
+    assert headers['Content-Encoding'] == 'gzip' and 'Content-Length' not in headers
+    assert len(content) == body.sent_bytes < len(QM_LOG)
+    assert parts_of(gzip.decompress(content), headers['Content-Type']) == EXPECTED_PARTS
+
+def test_chunked_frames():
+    frames = b''.join(chunked_frames([b'abc', b'', memoryview(b'0123456789abcdef' * 2)]))
+    assert frames == b'3\r\nabc\r\n20\r\n' + b'0123456789abcdef' * 2 + b'\r\n0\r\n\r\n'
+    assert unframed(frames) == b'abc' + b'0123456789abcdef' * 2
+
+class RecordingHandler(StandInHandler):
+    '''Records the request bodies it receives; the first n_failures requests are answered with a 503.'''
+    bodies = []
+    n_failures = 0
+
+    def discard_body(self) -> None:
+        self.bodies.append((self.headers.get('Transfer-Encoding'), self.headers.get('Content-Encoding'), self.headers['Content-Type'], b''.join(self.body_chunks())))
+
+    def respond(self) -> None:
+        if len(self.bodies) >= self.n_failures:
+            StandInHandler.respond(self)
+        else:
+            self.discard_body()
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    do_POST = respond
+
+def serve_recording_handler(function, n_failures: int = 0) -> None:
+    (RecordingHandler.bodies, RecordingHandler.n_failures) = ([], n_failures)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RecordingHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        function('http://127.0.0.1:{0}'.format(server.server_address[1]))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_compressed_uploads_are_sent_chunked():
+    def upload(host: str) -> None:
+        body = MultipartBody(data_items(), compress=True)
+        pool = ConnectionPool()
+        pool.urlopen('POST', host + '/api/current/jobs/finished.py', body=body, headers=body.headers()).read()
+        pool.clear()
+    serve_recording_handler(upload)
+    [(transfer_encoding, content_encoding, content_type, content)] = RecordingHandler.bodies
+    assert (transfer_encoding, content_encoding) == ('chunked', 'gzip')
+    assert parts_of(gzip.decompress(content), content_type) == EXPECTED_PARTS
+
+def test_bodies_are_sent_again_in_full_on_retries():
+    received = []
+    def flaky_handler(method: str, url: str, headers: dict, body: bytes) -> tuple:
+        received.append((headers['Content-Type'], body))
+        if len(received) == 1:
+            return (503, {'Content-Type': 'text/plain'}, b'Service Unavailable')
+        return (200, {'Content-Type': 'application/json'}, b'{"accepted_molids": [21]}')
+    api = API(host='http://stand-in', api_token='test', api_format='json', transport=InProcessTransport(flaky_handler), retry_policy=RetryPolicy(backoff_factor=0.))
+    api.fetch(api.url('rmsd', 'align'), data=data_items(), method='POST')
+    assert len(received) == 2 and received[0] == received[1]
+    assert parts_of(*reversed(received[1]))[:len(EXPECTED_PARTS)] == EXPECTED_PARTS
+
+def test_async_bodies_are_sent_again_in_full_on_retries():
+    async def upload(host: str) -> None:
+        api = AsyncAPI(host=host, api_token='test', api_format='json', retry_policy=RetryPolicy(backoff_factor=0.))
+        try:
+            await api.safe_urlopen(api.url('rmsd', 'align'), data=data_items(), method='POST')
+        finally:
+            api.close()
+    serve_recording_handler(lambda host: asyncio.run(upload(host)), n_failures=1)
+    assert len(RecordingHandler.bodies) == 2 and RecordingHandler.bodies[0] == RecordingHandler.bodies[1]
+    (_, _, content_type, content) = RecordingHandler.bodies[1]
+    assert parts_of(content, content_type)[:len(EXPECTED_PARTS)] == EXPECTED_PARTS
@@ -0,0 +1,102 @@
+import json
+from urllib.error import HTTPError
+
+import pytest
+
+import atb_api
+from atb_api import API, AdaptiveConcurrencyLimit, InProcessTransport, RateLimiter
+
+class FakeClock(object):
+    def __init__(self) -> None:
+        self.now = 1000.
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(atb_api, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(atb_api, 'sleep', clock.sleep)
+    return clock
+
+def test_rate_limiter_bursts_then_throttles(clock):
+    rate_limiter = RateLimiter(rate=10., burst=5)
+    assert [rate_limiter.reserve() for _ in range(5)] == [0.] * 5
+    assert [rate_limiter.reserve() for _ in range(2)] == pytest.approx([0.1, 0.2])
+    clock.now += 1.
+    # Refilled by 10 tokens, of which 2 pay back the throttled requests
+    assert [rate_limiter.reserve() for _ in range(5)] == [0.] * 5
+    assert rate_limiter.reserve() == pytest.approx(0.1)
+    assert rate_limiter.statistics()['delayed'] == 3
+
+def test_rate_limiter_shared_by_clients(clock):
+    def handler(method: str, url: str, headers: dict, body: bytes) -> tuple:
+        return (200, {'Content-Type': 'application/json'}, json.dumps(dict(data={})).encode())
+    rate_limiter = RateLimiter(rate=5., burst=2)
+    apis = [API(host='http://stand-in', api_token='test', api_format='json', transport=InProcessTransport(handler), rate_limiter=rate_limiter) for _ in range(2)]
+    started_at = clock.now
+    for i in range(10):
+        apis[i % 2].Statistics.charge_distribution()
+    # 2 requests in the initial burst, then one every 1 / rate seconds
+    assert clock.now - started_at == pytest.approx((10 - 2) / 5.)
+
+def congestion(code: int) -> HTTPError:
+    return HTTPError('http://stand-in', code, 'Congested', {}, None)
+
+def complete(concurrency_limit: AdaptiveConcurrencyLimit, clock: FakeClock, latency: float, error: Exception = None) -> None:
+    started_at = concurrency_limit.acquire()
+    clock.now += latency
+    concurrency_limit.release(started_at, congested=error is not None and concurrency_limit.is_congestion(error))
+
+def test_limit_grows_by_about_one_per_round_trip(clock):
+    concurrency_limit = AdaptiveConcurrencyLimit(initial_limit=4)
+    for _ in range(4):
+        complete(concurrency_limit, clock, 0.01)
+    # 4 + 1/4 + 1/4.25 + ...
+    assert concurrency_limit.limit == pytest.approx(4.92, abs=0.01)
+    for _ in range(20):
+        complete(concurrency_limit, clock, 0.01)
+    assert concurrency_limit.statistics()['limit'] == 8
+    # Requests much slower than the fastest seen do not grow it
+    limit = concurrency_limit.limit
+    complete(concurrency_limit, clock, 0.1)
+    assert concurrency_limit.limit == limit
+
+def test_limit_halves_on_429_and_5xx_once_per_round_trip(clock):
+    concurrency_limit = AdaptiveConcurrencyLimit(initial_limit=16)
+    clock.now += 1.
+    # Sent before the decrease: reflects the previous limit
+    overlapping_started_at = concurrency_limit.acquire()
+    clock.now += 0.005
+    complete(concurrency_limit, clock, 0.01, congestion(429))
+    assert concurrency_limit.limit == 8.
+    concurrency_limit.release(overlapping_started_at, congested=concurrency_limit.is_congestion(congestion(503)))
+    assert concurrency_limit.limit == 8.
+    complete(concurrency_limit, clock, 0.01, congestion(503))
+    assert concurrency_limit.limit == 4.
+    complete(concurrency_limit, clock, 0.01, congestion(404))
+    assert concurrency_limit.limit == pytest.approx(4.25)
+    statistics = concurrency_limit.statistics()
+    assert (statistics['congestion_signals'], statistics['decreases'], statistics['in_flight']) == (3, 2, 0)
+
+def test_api_requests_decrease_the_limit_on_5xx(clock):
+    statuses = iter([200, 200, 503, 200])
+    def handler(method: str, url: str, headers: dict, body: bytes) -> tuple:
+        clock.now += 0.01
+        status = next(statuses)
+        return (status, {'Content-Type': 'application/json'}, json.dumps(dict(data={})).encode() if status == 200 else b'Unavailable')
+    concurrency_limit = AdaptiveConcurrencyLimit(initial_limit=4)
+    api = API(host='http://stand-in', api_token='test', api_format='json', transport=InProcessTransport(handler), concurrency_limit=concurrency_limit)
+    api.Statistics.charge_distribution()
+    api.Statistics.charge_distribution()
+    limit = concurrency_limit.limit
+    assert limit > 4.
+    with pytest.raises(HTTPError):
+        api.Statistics.charge_distribution()
+    assert concurrency_limit.limit == pytest.approx(limit / 2)
+    api.Statistics.charge_distribution()
+    assert concurrency_limit.statistics()['in_flight'] == 0
@@ -0,0 +1,69 @@
+import json
+
+import atb_api
+from atb_api import API, InProcessTransport, ResponseCache
+
+class StatisticsHandler(object):
+    def __init__(self) -> None:
+        self.requests = 0
+
+    def __call__(self, method: str, url: str, headers: dict, body: bytes) -> tuple:
+        self.requests += 1
+        content = dict(data={'0': 10, '1': 5}, requests=self.requests)
+        return (200, {'Content-Type': 'application/json'}, json.dumps(content).encode())
+
+def api_for(handler: StatisticsHandler, response_cache: ResponseCache) -> API:
+    return API(host='http://stand-in', api_token='test', api_format='json', transport=InProcessTransport(handler), response_cache=response_cache)
+
+def charge_distribution_url(api: API) -> str:
+    return api.url('statistics', 'charge_distribution')
+
+def test_hits_are_not_shared_with_callers():
+    api = api_for(StatisticsHandler(), ResponseCache())
+    first = api.fetch(charge_distribution_url(api))
+    first['data']['0'] = -1
+    second = api.fetch(charge_distribution_url(api))
+    assert second['data']['0'] == 10
+    second['data'].clear()
+    assert api.fetch(charge_distribution_url(api))['data'] == {'0': 10, '1': 5}
+    assert api.response_cache.statistics()['hits'] == 2
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    now = [1000.]
+    monkeypatch.setattr(atb_api, 'monotonic', lambda: now[0])
+    handler = StatisticsHandler()
+    api = api_for(handler, ResponseCache(ttls=dict(charge_distribution=60.)))
+    assert api.fetch(charge_distribution_url(api))['requests'] == 1
+    now[0] += 59.
+    assert api.fetch(charge_distribution_url(api))['requests'] == 1
+    now[0] += 2.
+    assert api.fetch(charge_distribution_url(api))['requests'] == 2
+    assert api.response_cache.statistics()['expired'] == 1
+
+def test_least_recently_used_entries_are_evicted_beyond_maximum_bytes():
+    cache = ResponseCache(ttls=dict(molid=3600.), maximum_bytes=250)
+    keys = [cache.key_for('http://stand-in/molid.py', 'GET', [('molid', str(molid))]) for molid in range(3)]
+    for key in keys[:2]:
+        cache.put(key, dict(molid=key), 100)
+    assert cache.get(keys[0])[0]
+    cache.put(keys[2], dict(molid=keys[2]), 100)
+    assert [cache.get(key)[0] for key in keys] == [True, False, True]
+    assert cache.statistics()['total_bytes'] == 200 and cache.statistics()['evictions'] == 1
+
+def test_invalidate():
+    cache = ResponseCache()
+    (molid_key, search_key) = [cache.key_for('http://stand-in/{0}.py'.format(endpoint), 'GET', []) for endpoint in ('molid', 'search')]
+    cache.put(molid_key, {}, 10)
+    cache.put(search_key, {}, 10)
+    cache.invalidate('molid')
+    assert [cache.get(key)[0] for key in (molid_key, search_key)] == [False, True]
+    cache.invalidate()
+    assert not cache.get(search_key)[0] and cache.statistics()['total_bytes'] == 0
+
+def test_bypass_cache_requests_again_and_stores_the_fresh_response():
+    handler = StatisticsHandler()
+    api = api_for(handler, ResponseCache())
+    assert api.fetch(charge_distribution_url(api))['requests'] == 1
+    assert api.fetch(charge_distribution_url(api), data=dict(bypass_cache=True))['requests'] == 2
+    assert api.fetch(charge_distribution_url(api))['requests'] == 2
+    assert handler.requests == 2
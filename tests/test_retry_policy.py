@@ -0,0 +1,98 @@
+import asyncio
+from threading import Lock, Thread
+from urllib.error import HTTPError
+
+import pytest
+
+from atb_api import API, AsyncAPI, InProcessTransport, RetryPolicy
+from benchmark_atb_api import StandInHandler, ThreadingHTTPServer
+
+class FlakyHandler(object):
+    def __init__(self, n_failures: int) -> None:
+        self.n_failures = n_failures
+        self.requests = []
+
+    def __call__(self, method: str, url: str, headers: dict, body: bytes) -> tuple:
+        self.requests.append((method, url))
+        if len(self.requests) <= self.n_failures:
+            return (503, {'Content-Type': 'text/plain'}, b'Service Unavailable')
+        return (200, {'Content-Type': 'application/json'}, b'{"molecules": [], "molids": [21]}')
+
+def api_for(handler: FlakyHandler, **kwargs) -> API:
+    return API(
+        host='http://stand-in',
+        api_token='test',
+        api_format='json',
+        transport=InProcessTransport(handler),
+        retry_policy=RetryPolicy(backoff_factor=0., **kwargs),
+    )
+
+def test_idempotent_requests_are_retried():
+    handler = FlakyHandler(n_failures=2)
+    api_for(handler, maximum_attempts=3).Molecules.search(any='ethanol')
+    assert len(handler.requests) == 3
+
+def test_non_idempotent_requests_are_not_retried():
+    handler = FlakyHandler(n_failures=2)
+    with pytest.raises(Exception):
+        api_for(handler, maximum_attempts=3).Molecules.submit(netcharge=0, public=True, moltype='heteromolecule', smiles='CCO')
+    assert len(handler.requests) == 1
+
+    handler = FlakyHandler(n_failures=2)
+    api_for(handler, maximum_attempts=3, non_idempotent_endpoints=()).Molecules.submit(netcharge=0, public=True, moltype='heteromolecule', smiles='CCO')
+    assert len(handler.requests) == 3
+
+def test_retry_budget_does_not_grow_with_healthy_requests():
+    retry_policy = RetryPolicy(maximum_attempts=2, retry_budget=0.2, minimum_retries=10)
+    for _ in range(10000):
+        retry_policy.record_request()
+    error = ConnectionResetError()
+    granted = sum(retry_policy.should_retry(error, 1, 'GET') for _ in range(100))
+    assert granted == 10
+
+    for _ in range(60):
+        retry_policy.record_request()
+    assert sum(retry_policy.should_retry(error, 1, 'GET') for _ in range(100)) == 10
+
+class FlakyStandInHandler(StandInHandler):
+    (lock, n_failures, n_requests) = (Lock(), 0, 0)
+
+    def respond(self) -> None:
+        cls = FlakyStandInHandler
+        with cls.lock:
+            cls.n_requests += 1
+            is_failing = cls.n_requests <= cls.n_failures
+        if is_failing:
+            self.discard_body()
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            super(FlakyStandInHandler, self).respond()
+
+    do_GET = respond
+    do_POST = respond
+
+def test_async_api_shares_the_retry_decision():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyStandInHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    host = 'http://127.0.0.1:{0}'.format(server.server_address[1])
+
+    async def main(function):
+        api = AsyncAPI(host=host, api_token='test', api_format='json', retry_policy=RetryPolicy(maximum_attempts=3, backoff_factor=0.))
+        try:
+            return await function(api)
+        finally:
+            api.close()
+    try:
+        (FlakyStandInHandler.n_failures, FlakyStandInHandler.n_requests) = (2, 0)
+        assert asyncio.run(main(lambda api: api.Molecules.molid(molid=21))).molid == 21
+        assert FlakyStandInHandler.n_requests == 3
+
+        (FlakyStandInHandler.n_failures, FlakyStandInHandler.n_requests) = (2, 0)
+        with pytest.raises(HTTPError):
+            asyncio.run(main(lambda api: api.Molecules.submit(netcharge=0, public=True, moltype='heteromolecule', smiles='CCO')))
+        assert FlakyStandInHandler.n_requests == 1
+    finally:
+        server.shutdown()
+        server.server_close()
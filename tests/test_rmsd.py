@@ -0,0 +1,29 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from atb_api import API, AsyncAPI, InProcessTransport
+
+def align_handler(method: str, url: str, headers: dict, body: bytes) -> tuple:
+    molids = parse_qs(body.decode())['molids'][0].split(',')
+    content = dict(molids=molids, rmsds=[0.0] + [float(molid) for molid in molids[1:]])
+    return (200, {'Content-Type': 'application/json'}, json.dumps(content).encode())
+
+def test_chunked_align_matches_unchunked_align():
+    (unchunked, chunked) = [
+        API(host='http://stand-in', api_token='test', api_format='json', transport=InProcessTransport(align_handler), molids_chunk_size=molids_chunk_size).RMSD.align(molids=[1, 2, 3, 4, 5])
+        for molids_chunk_size in (100, 2)
+    ]
+    assert unchunked == dict(molids=['1', '2', '3', '4', '5'], rmsds=[0.0, 2.0, 3.0, 4.0, 5.0])
+    assert chunked == unchunked
+
+def test_async_chunked_align_matches_unchunked_align(recorded_shape_host):
+    async def align(molids_chunk_size: int) -> dict:
+        api = AsyncAPI(host=recorded_shape_host, api_token='test', api_format='json', molids_chunk_size=molids_chunk_size)
+        try:
+            return await api.RMSD.align(molids=[1, 2, 3, 4, 5])
+        finally:
+            api.close()
+    (unchunked, chunked) = [asyncio.run(align(molids_chunk_size)) for molids_chunk_size in (100, 2)]
+    assert unchunked['molids'] == ['1', '2', '3', '4', '5']
+    assert chunked == unchunked
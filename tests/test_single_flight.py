@@ -0,0 +1,84 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier, Event, Lock, Thread
+from time import monotonic, sleep
+
+from atb_api import API, InProcessTransport, SingleFlight
+
+CALLERS = 4
+
+class BlockingHandler(object):
+    '''Holds every request until released, counting the requests that reached it.'''
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.requests = 0
+        self.released = Event()
+
+    def __call__(self, method: str, url: str, headers: dict, body: bytes) -> tuple:
+        with self.lock:
+            self.requests += 1
+        assert self.released.wait(10)
+        return (200, {'Content-Type': 'application/json'}, json.dumps(dict(data={}, accepted_molids=[])).encode())
+
+def api_for(handler: BlockingHandler) -> API:
+    return API(host='http://stand-in', api_token='test', api_format='json', transport=InProcessTransport(handler), single_flight=SingleFlight())
+
+def wait_for(condition) -> None:
+    deadline = monotonic() + 10.
+    while not condition():
+        assert monotonic() < deadline
+        sleep(0.001)
+
+def test_concurrent_identical_gets_share_one_request():
+    handler = BlockingHandler()
+    api = api_for(handler)
+    with ThreadPoolExecutor(CALLERS) as executor:
+        futures = [executor.submit(api.fetch, api.url('statistics', 'charge_distribution')) for _ in range(CALLERS)]
+        wait_for(lambda: api.single_flight.statistics()['shared'] == CALLERS - 1)
+        handler.released.set()
+        results = [future.result() for future in futures]
+    assert handler.requests == 1
+    assert results == [dict(data={}, accepted_molids=[])] * CALLERS
+    statistics = api.single_flight.statistics()
+    assert (statistics['shared'], statistics['in_flight']) == (CALLERS - 1, 0)
+
+def test_non_idempotent_endpoints_are_not_shared():
+    handler = BlockingHandler()
+    api = api_for(handler)
+    arrived = Barrier(CALLERS + 1)
+    def finished() -> list:
+        arrived.wait(10)
+        return api.Jobs.finished(molids=[21], qm_logs=['log'], current_qm_levels=[1])
+    with ThreadPoolExecutor(CALLERS) as executor:
+        futures = [executor.submit(finished) for _ in range(CALLERS)]
+        arrived.wait(10)
+        wait_for(lambda: handler.requests == CALLERS)
+        handler.released.set()
+        [future.result() for future in futures]
+    assert handler.requests == CALLERS
+    assert api.single_flight.statistics()['shared'] == 0
+
+def test_followers_are_released_when_the_leader_is_interrupted():
+    single_flight = SingleFlight()
+    (leader_started, interrupt) = (Event(), Event())
+    def interrupted_leader() -> None:
+        leader_started.set()
+        interrupt.wait(10)
+        raise KeyboardInterrupt
+    outcomes = {}
+    def run(name: str, function) -> None:
+        try:
+            outcomes[name] = single_flight.run(('key',), function)
+        except BaseException as e:
+            outcomes[name] = e
+    threads = [Thread(target=run, args=('leader', interrupted_leader), daemon=True), Thread(target=run, args=('follower', lambda: 'not called'), daemon=True)]
+    threads[0].start()
+    leader_started.wait(10)
+    threads[1].start()
+    wait_for(lambda: single_flight.statistics()['shared'] == 1)
+    interrupt.set()
+    for thread in threads:
+        thread.join(10)
+    assert [type(outcomes.get(name)) for name in ('leader', 'follower')] == [KeyboardInterrupt, KeyboardInterrupt]
+    assert single_flight.statistics()['in_flight'] == 0
+    assert single_flight.run(('key',), lambda: 'retried') == 'retried'
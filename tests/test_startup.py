@@ -0,0 +1,6 @@
+from benchmark_atb_api import LAZY_MODULES, eagerly_loaded_modules
+
+def test_heavy_modules_are_loaded_lazily():
+    assert {'numpy', 'yaml', 'asyncio', 'sqlite3'} <= set(LAZY_MODULES)
+    loaded_modules = eagerly_loaded_modules()
+    assert not loaded_modules, 'Loaded eagerly: {0}'.format(loaded_modules)
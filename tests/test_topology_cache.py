@@ -0,0 +1,53 @@
+from os import listdir, utime
+
+import atb_api
+from atb_api import TopologyCache
+
+def test_shared_objects_outlive_replaced_keys(tmp_path):
+    cache = TopologyCache(str(tmp_path))
+    (key_a, key_b) = (cache.key_for('host', 21, 'pdb_aa', {}), cache.key_for('host', 22, 'pdb_aa', {}))
+    cache.put(key_a, b'ATOM shared', 'hash 1')
+    cache.put(key_b, b'ATOM shared', 'hash 1')
+    assert len(listdir(str(tmp_path / 'objects'))) == 1
+
+    cache.put(key_a, b'ATOM updated', 'hash 2')
+    assert cache.get(key_b, 'hash 1') == b'ATOM shared'
+    assert cache.get(key_a, 'hash 2') == b'ATOM updated'
+
+    cache.put(key_b, b'ATOM updated', 'hash 2')
+    assert len(listdir(str(tmp_path / 'objects'))) == 1
+    assert cache.statistics()['total_bytes'] == len(b'ATOM updated')
+
+def test_eviction_keeps_objects_of_remaining_keys(tmp_path):
+    cache = TopologyCache(str(tmp_path), maximum_bytes=100)
+    keys = [cache.key_for('host', molid, 'pdb_aa', {}) for molid in range(4)]
+    for (key, content) in zip(keys[:3], [b'A' * 60, b'A' * 60, b'B' * 30]):
+        cache.put(key, content, 'hash')
+    # Least recently used first: keys[0], keys[2], keys[1]
+    for key in (keys[2], keys[1]):
+        cache.get(key, 'hash')
+    cache.put(keys[3], b'C' * 30, 'hash')
+
+    assert cache.get(keys[1], 'hash') == b'A' * 60
+    assert cache.get(keys[3], 'hash') == b'C' * 30
+    assert cache.get(keys[0], 'hash') is None and cache.get(keys[2], 'hash') is None
+    assert cache.statistics()['total_bytes'] == 90
+
+def test_index_is_read_once_in_last_used_order(tmp_path, monkeypatch):
+    cache = TopologyCache(str(tmp_path))
+    keys = [cache.key_for('host', molid, 'pdb_aa', {}) for molid in range(3)]
+    for (key, content) in zip(keys, [b'A' * 60, b'A' * 60, b'B' * 30]):
+        cache.put(key, content, 'hash')
+    # Least recently used first: keys[1], keys[0], keys[2]
+    for (last_used, key) in enumerate([keys[1], keys[0], keys[2]]):
+        utime(str(tmp_path / 'keys' / key), (last_used, last_used))
+
+    cache = TopologyCache(str(tmp_path), maximum_bytes=60)
+    def no_listdir(path):
+        raise AssertionError('Listed {0}'.format(path))
+    monkeypatch.setattr(atb_api, 'listdir', no_listdir)
+    cache.put(cache.key_for('host', 3, 'pdb_aa', {}), b'C' * 30, 'hash')
+    # keys[1] and keys[0] share their object, which goes with the last of them
+    assert cache.get(keys[0], 'hash') is None and cache.get(keys[1], 'hash') is None
+    assert cache.get(keys[2], 'hash') == b'B' * 30
+    assert cache.statistics()['total_bytes'] == 60 and cache.statistics()['entries'] == 2